@@ -5,7 +5,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nemo_park_project.settings')
 django.setup()
 
 from django.contrib.auth import get_user_model
-from nemo_park.models import Employee, Visitor, Ticket, Product
+from nemo_park.models import Employee, Visitor, Ticket, Product, Ingredient, ProductComponent, ProductIngredient
+from nemo_park.services.bom_service import BillOfMaterials
 from django.utils import timezone
 
 CustomUser = get_user_model()
@@ -17,6 +18,7 @@ def create_test_data():
     Visitor.objects.all().delete()
     Ticket.objects.all().delete()
     Product.objects.all().delete()
+    Ingredient.objects.all().delete()
     
     print("🗑️ Старые данные удалены")
     
@@ -206,6 +208,7 @@ def create_test_data():
          'description': '2 пиццы + 4 напитка + картофель'},
     ]
     
+    prep_minutes = {'pizza': 12, 'burger': 8, 'snack': 5, 'drink': 1, 'dessert': 3, 'combo': 0}
     for p in products_data:
         Product.objects.create(
             name=p['name'],
@@ -213,12 +216,42 @@ def create_test_data():
             price=p['price'],
             image_emoji=p['emoji'],
             description=p.get('description', ''),
+            prep_minutes=prep_minutes[p['category']],
             is_popular=p.get('popular', False),
             is_available=True
         )
     
     print(f"🍕 Создано {len(products_data)} товаров")
     
+    # ==================== СОСТАВЫ И РЕЦЕПТЫ ====================
+    products = {product.name: product for product in Product.objects.all()}
+    combos = {
+        'Комбо Немо': [('Классический бургер', 1), ('Картофель фри', 1), ('Кола', 1)],
+        'Семейный набор': [('Пицца Маргарита', 2), ('Кола', 4), ('Картофель фри', 1)],
+    }
+    for combo, components in combos.items():
+        for name, quantity in components:
+            ProductComponent.objects.create(product=products[combo], component=products[name], quantity=quantity)
+    
+    ingredients = {
+        name: Ingredient.objects.create(name=name, unit=unit)
+        for name, unit in [('Булочка', 'pcs'), ('Говяжья котлета', 'pcs'), ('Картофель', 'g'),
+                           ('Тесто', 'g'), ('Моцарелла', 'g'), ('Сироп колы', 'ml')]
+    }
+    recipes = {
+        'Классический бургер': [('Булочка', 1), ('Говяжья котлета', 1)],
+        'Двойной бургер': [('Булочка', 1), ('Говяжья котлета', 2)],
+        'Картофель фри': [('Картофель', 150)],
+        'Пицца Маргарита': [('Тесто', 250), ('Моцарелла', 120)],
+        'Кола': [('Сироп колы', 80)],
+    }
+    for name, lines in recipes.items():
+        for ingredient, amount in lines:
+            ProductIngredient.objects.create(product=products[name], ingredient=ingredients[ingredient], amount=amount)
+    BillOfMaterials.rebuild()
+    
+    print(f"🍟 Составы комбо: {len(combos)}, ингредиентов: {len(ingredients)}")
+    
     # ==================== ИТОГ ====================
     print("\n" + "="*60)
     print("✅ Тестовые данные успешно созданы!")
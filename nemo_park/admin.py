@@ -1,6 +1,35 @@
+from collections import defaultdict
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Employee, Visitor, Ticket, Product, Order, OrderItem
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
+from .models import (CustomUser, Employee, Visitor, Ticket, Holiday, PriceRule, Product, Order, OrderItem,
+                     ArchivedTicket, ArchivedOrder, ArchiveRollup, WorkShift, PayrollAccrual,
+                     PayrollLedger, ProductSalesRollup, SalesHour, DemandForecast,
+                     VisitorProfile, VisitorProduct, VisitorDuplicate, LoyaltyEvent, LoyaltyBalance,
+                     LoyaltyCompaction, Ingredient, ProductComponent, ProductIngredient)
+from .services.bom_service import BillOfMaterials, BomCycleError
+from .services.payroll_service import PayrollRecalculator
+from .services.pricing_service import PricingEngine
+from .services.sales_service import SalesRemoval
+
+
+class CascadeRowsMixin:
+    """Удаление владельца вместе со строками, которые вручную не удаляются.
+
+    Смены, итоги и журналы закрыты от удаления в своих админках, и Django
+    из-за этого запретил бы удалить и владельца, к которому они привязаны
+    каскадом. cascade_models — такие модели: они уходят вместе с владельцем
+    (delete_model/delete_queryset владельца вычитают их из итогов заранее).
+    """
+
+    cascade_models = ()
+
+    def get_deleted_objects(self, objs, request):
+        deleted, model_count, perms_needed, protected = super().get_deleted_objects(objs, request)
+        perms_needed -= {model._meta.verbose_name for model in self.cascade_models}
+        return deleted, model_count, perms_needed, protected
 
 
 @admin.register(CustomUser)
@@ -11,23 +40,51 @@ class CustomUserAdmin(UserAdmin):
     )
     list_filter = ('role', 'position')
 
+    # Продажи кассира удаляются каскадом — итоги вычитаются заранее
+    def delete_model(self, request, obj):
+        SalesRemoval.delete_users(CustomUser.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        SalesRemoval.delete_users(queryset)
+
 
 @admin.register(Employee)
-class EmployeeAdmin(admin.ModelAdmin):
+class EmployeeAdmin(CascadeRowsMixin, admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'position', 'salary', 'phone', 'get_user')
     list_filter = ('position',)
+    cascade_models = (WorkShift, PayrollAccrual, PayrollLedger)
     
     def get_user(self, obj):
         if hasattr(obj, 'customuser'):
             return obj.customuser.username
         return "Нет профиля"
     get_user.short_description = 'Логин пользователя'
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and PayrollRecalculator.mark_stale(obj, form.changed_data):
+            PayrollRecalculator.recompute_on_commit([obj.pk])
+
+    # Учётная запись, её продажи и листы удаляются каскадом — итоги вычитаются заранее
+    def delete_model(self, request, obj):
+        SalesRemoval.delete_employees(Employee.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        SalesRemoval.delete_employees(queryset)
 
 
 @admin.register(Visitor)
-class VisitorAdmin(admin.ModelAdmin):
+class VisitorAdmin(CascadeRowsMixin, admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'email', 'phone', 'registration_date')
     search_fields = ('first_name', 'last_name', 'email')
+    cascade_models = (VisitorProfile, VisitorProduct, LoyaltyEvent, LoyaltyBalance)
+
+    # Билеты и заказы посетителя удаляются каскадом — итоги вычитаются заранее
+    def delete_model(self, request, obj):
+        SalesRemoval.delete_visitors(Visitor.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        SalesRemoval.delete_visitors(queryset)
 
 
 @admin.register(Ticket)
@@ -35,22 +92,355 @@ class TicketAdmin(admin.ModelAdmin):
     list_display = ('visitor', 'ticket_type', 'price', 'purchase_date', 'valid_date', 'cashier')
     list_filter = ('ticket_type', 'purchase_date')
 
+    # Продажа обновляет итоги, остатки и баллы — продают и меняют только на кассе
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        SalesRemoval.delete_tickets(Ticket.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        SalesRemoval.delete_tickets(queryset)
+
+
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name', 'kind', 'moved_to', 'pay_multiplier')
+    list_filter = ('kind', 'date')
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        Holiday.invalidate_caches()
+
+
+@admin.register(PriceRule)
+class PriceRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'ticket_type', 'weekdays', 'date_from', 'date_to', 'holidays_only',
+                    'min_occupancy', 'multiplier', 'surcharge', 'priority', 'is_active')
+    list_filter = ('ticket_type', 'holidays_only', 'is_active')
+    list_editable = ('multiplier', 'surcharge', 'priority', 'is_active')
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        PricingEngine.invalidate()
+
+
+class ProductComponentFormSet(BaseInlineFormSet):
+    """Состав комбо целиком: цикл может появиться только из нескольких строк сразу
+    (или из строки, которая ещё не сохранена), поэтому проверяется весь граф"""
+
+    def clean(self):
+        super().clean()
+        if self.instance.pk is None:
+            # Нового товара ещё нет ни в чьём составе — цикла быть не может
+            return
+        components = defaultdict(list)
+        for product_id, component_id, quantity in ProductComponent.objects.exclude(
+            product=self.instance
+        ).values_list('product_id', 'component_id', 'quantity'):
+            components[product_id].append((component_id, quantity))
+        for form in self.forms:
+            data = getattr(form, 'cleaned_data', None)
+            if not data or data.get('DELETE') or not data.get('component'):
+                continue
+            components[self.instance.pk].append((data['component'].pk, data.get('quantity') or 1))
+        try:
+            BillOfMaterials.flatten(components, {})
+        except BomCycleError:
+            raise ValidationError(f'Состав замкнулся: «{self.instance.name}» входит сам в себя через другие комбо')
+
+
+class ProductComponentInline(admin.TabularInline):
+    model = ProductComponent
+    formset = ProductComponentFormSet
+    fk_name = 'product'
+    extra = 1
+    autocomplete_fields = ['component']
+
+
+class ProductIngredientInline(admin.TabularInline):
+    model = ProductIngredient
+    extra = 1
+
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ['image_emoji', 'name', 'category', 'price', 'is_available', 'is_popular']
+class ProductAdmin(CascadeRowsMixin, admin.ModelAdmin):
+    list_display = ['image_emoji', 'name', 'category', 'price', 'stock', 'prep_minutes', 'is_available', 'is_popular']
     list_filter = ['category', 'is_available', 'is_popular']
     search_fields = ['name', 'description']
     list_editable = ['is_available', 'is_popular', 'price']
+    # Остаток меняют продажи и страница «Остатки» (приход и инвентаризация)
+    readonly_fields = ['stock']
+    inlines = [ProductComponentInline, ProductIngredientInline]
+    cascade_models = (ProductSalesRollup, VisitorProduct)
+    
+    # Состав товара изменился — пересобрать развёрнутые составы меню
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        BillOfMaterials.rebuild()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        BillOfMaterials.rebuild()
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        BillOfMaterials.rebuild()
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(admin.ModelAdmin):
+    list_display = ('name', 'unit')
+    search_fields = ('name',)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        BillOfMaterials.rebuild()
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        BillOfMaterials.rebuild()
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
-    extra = 1
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'visitor', 'total_price', 'status', 'cashier', 'created_at']
-    list_filter = ['status', 'created_at']
-    inlines = [OrderItemInline]
\ No newline at end of file
+    list_display = ['id', 'visitor', 'total_price', 'status', 'is_rush', 'cashier', 'created_at']
+    list_filter = ['status', 'is_rush', 'created_at']
+    inlines = [OrderItemInline]
+
+    # Заказ обновляет итоги, остатки, баллы и очередь кухни — оформляют и меняют только на кассе
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        SalesRemoval.delete_orders(Order.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        SalesRemoval.delete_orders(queryset)
+
+
+@admin.register(ArchivedTicket)
+class ArchivedTicketAdmin(admin.ModelAdmin):
+    list_display = ('id', 'visitor', 'ticket_type', 'price', 'purchase_date', 'cashier', 'archived_at')
+    list_filter = ('ticket_type',)
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'visitor', 'total_price', 'status', 'cashier', 'created_at', 'archived_at')
+    list_filter = ('status',)
+
+
+@admin.register(ArchiveRollup)
+class ArchiveRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'kind', 'cashier', 'count', 'revenue')
+    list_filter = ('kind',)
+
+
+@admin.register(WorkShift)
+class WorkShiftAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'started_at', 'ended_at', 'break_minutes', 'worked_minutes')
+    list_filter = ('employee',)
+
+    # Закрытая смена уже в нарастающих итогах табеля — отмечают только на странице «Табель»
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PayrollAccrual)
+class PayrollAccrualAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'day', 'minutes', 'overtime_minutes', 'cum_days', 'cum_minutes')
+    list_filter = ('employee',)
+
+    # Итоги меняются только при закрытии смен (rebuild_accruals для пересборки)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PayrollLedger)
+class PayrollLedgerAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'period', 'status', 'count', 'gross_total', 'net_total')
+    list_filter = ('status',)
+
+    # Итоги меняются только вместе с листами (reconcile_payroll_ledger для сверки)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProductSalesRollup)
+class ProductSalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'hour', 'product', 'quantity', 'revenue')
+    list_filter = ('product__category',)
+    date_hierarchy = 'day'
+
+    # Итоги меняются вместе с заказами (rebuild_product_sales для пересборки)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SalesHour)
+class SalesHourAdmin(admin.ModelAdmin):
+    list_display = ('day', 'hour', 'channel', 'cashier', 'count', 'revenue')
+    list_filter = ('channel', 'cashier')
+    date_hierarchy = 'day'
+
+    # Ряд меняется вместе с продажами (forecast_demand --rebuild для пересборки)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DemandForecast)
+class DemandForecastAdmin(admin.ModelAdmin):
+    list_display = ('weekday', 'hour', 'channel', 'expected', 'fitted_on')
+    list_filter = ('channel', 'weekday')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VisitorProfile)
+class VisitorProfileAdmin(admin.ModelAdmin):
+    list_display = ('visitor', 'visits', 'last_visit', 'tickets', 'orders', 'ticket_spend', 'food_spend', 'total_spend')
+    search_fields = ('visitor__first_name', 'visitor__last_name', 'visitor__phone')
+    list_select_related = ('visitor',)
+
+    # Профили меняются вместе с продажами (rebuild_visitor_profiles для пересборки)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VisitorProduct)
+class VisitorProductAdmin(admin.ModelAdmin):
+    list_display = ('visitor', 'product', 'quantity')
+    list_select_related = ('visitor', 'product')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VisitorDuplicate)
+class VisitorDuplicateAdmin(admin.ModelAdmin):
+    list_display = ('visitor', 'duplicate', 'reason', 'score', 'found_at')
+    list_filter = ('reason',)
+    list_select_related = ('visitor', 'duplicate')
+
+    # Пары находит find_duplicate_visitors, сливаются на странице «Посетители → Дубли»
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LoyaltyEvent)
+class LoyaltyEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'visitor', 'kind', 'points', 'ticket_id', 'order_id', 'created_at')
+    list_filter = ('kind',)
+    list_select_related = ('visitor',)
+
+    # Журнал только дописывается (удаляется только вместе с посетителем)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LoyaltyBalance)
+class LoyaltyBalanceAdmin(admin.ModelAdmin):
+    list_display = ('visitor', 'points', 'earned', 'compacted_to', 'updated_at')
+    search_fields = ('visitor__first_name', 'visitor__last_name', 'visitor__phone')
+    list_select_related = ('visitor',)
+
+    # Снимки пишет только свёртка (compact_loyalty)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LoyaltyCompaction)
+class LoyaltyCompactionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'compacted_to', 'events', 'visitors')
+
+    # Граница свёртки: удалённая запись сдвинула бы её назад, и события сложились бы в снимки дважды
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -4,4 +4,9 @@ from django.apps import AppConfig
 class NemoParkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'nemo_park'
-    verbose_name = 'Парк развлечений Немо'
\ No newline at end of file
+    verbose_name = 'Парк развлечений Немо'
+    
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .db_tuning import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='nemo_park_sqlite_pragmas')
\ No newline at end of file
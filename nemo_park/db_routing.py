@@ -0,0 +1,107 @@
+"""Маршрутизация запросов между основной БД и репликой для чтения.
+
+Тяжёлые страницы (аналитика, списки) помечаются декоратором read_from_replica
+и на GET-запросах читают из реплики. Запись всегда идёт в default. После
+успешной записи сессия на REPLICA_STICKY_SECONDS «прилипает» к основной БД,
+чтобы пользователь сразу видел свои изменения.
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_SESSION_KEY = 'db_last_write_at'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_replica_reads = ContextVar('nemo_replica_reads', default=False)
+
+
+def replica_alias():
+    """Алиас реплики или None, если реплика не настроена"""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def session_is_sticky(request) -> bool:
+    """Была ли у сессии недавняя запись"""
+    session = getattr(request, 'session', None)
+    if session is None:
+        return False
+    last_write = session.get(STICKY_SESSION_KEY)
+    if not last_write:
+        return False
+    return time.time() - last_write < getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def read_from_replica(view_func):
+    """Декоратор: все чтения внутри view идут в реплику (только GET/HEAD —
+    POST той же страницы читает из основной БД вместе со своими записями)"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or replica_alias() is None or session_is_sticky(request):
+            return view_func(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    """Роутер БД: чтение из реплики внутри read_from_replica, запись — в default"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        allowed = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in allowed and obj2._state.db in allowed:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит из основной БД (репликация или TEST MIRROR)
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Запоминает время последней записи в сессии (для read-your-writes).
+
+    Отметка ставится, только если запрос действительно писал в основную БД
+    и завершился успешно: POST, который лишь считает (моделирование) или
+    вернул ошибку, не отключает реплику для сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS or not hasattr(request, 'session'):
+            return self.get_response(request)
+
+        wrote = False
+
+        def watch_writes(execute, sql, params, many, context):
+            nonlocal wrote
+            if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+                wrote = True
+            return execute(sql, params, many, context)
+
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(watch_writes):
+            response = self.get_response(request)
+        if wrote and response.status_code < 400:
+            request.session[STICKY_SESSION_KEY] = time.time()
+        return response
@@ -0,0 +1,21 @@
+"""Настройка соединений SQLite для продакшена.
+
+При каждом новом соединении выставляются PRAGMA из settings.SQLITE_PRAGMAS:
+WAL позволяет читать параллельно с записью, busy_timeout заставляет писателя
+подождать блокировку вместо мгновенного «database is locked».
+"""
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Обработчик сигнала connection_created"""
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -4,7 +4,10 @@ from django.core.validators import RegexValidator, MinValueValidator
 from django.core.exceptions import ValidationError
 import re
 from .models import CustomUser, Employee, Visitor, Ticket, Product
+from .services.simulation_service import make_scenario, SimulationError
+from .services.analytics_service import COMPARE_CHOICES
 from datetime import date, timedelta
+from decimal import Decimal
 
 # ==================== ВАЛИДАТОРЫ ====================
 
@@ -46,13 +49,10 @@ def clean_name(value, field_name='Поле'):
     return ' '.join(word.capitalize() for word in value.split())
 
 
-def clean_phone(value):
-    """Очистка и валидация телефона"""
-    if not value:
-        return value
-    
+def phone_digits(value):
+    """11 цифр российского номера (7XXXXXXXXXX) или None, если номер не распознан"""
     # Убираем все кроме цифр
-    digits = re.sub(r'\D', '', value)
+    digits = re.sub(r'\D', '', value or '')
     
     # Проверяем длину
     if len(digits) == 11 and digits.startswith('8'):
@@ -60,6 +60,17 @@ def clean_phone(value):
     elif len(digits) == 10:
         digits = '7' + digits
     elif len(digits) != 11 or not digits.startswith('7'):
+        return None
+    return digits
+
+
+def clean_phone(value):
+    """Очистка и валидация телефона"""
+    if not value:
+        return value
+    
+    digits = phone_digits(value)
+    if digits is None:
         raise ValidationError('Введите корректный российский номер телефона')
     
     # Форматируем
@@ -183,7 +194,7 @@ class EmployeeForm(forms.ModelForm):
     class Meta:
         model = Employee
         fields = ['first_name', 'last_name', 'position', 'hourly_rate',
-                  'work_start', 'work_end', 'break_minutes', 'work_days',
+                  'work_start', 'work_end', 'break_minutes', 'work_days', 'follows_calendar',
                   'phone', 'email']
         widgets = {
             'first_name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Имя'}),
@@ -194,6 +205,7 @@ class EmployeeForm(forms.ModelForm):
             'work_end': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}, format='%H:%M'),
             'break_minutes': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '60'}),
             'work_days': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '1,2,3,4,5'}),
+            'follows_calendar': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'phone': forms.TextInput(attrs={'class': 'form-control phone-mask', 'placeholder': '+7 (___) ___-__-__'}),
             'email': forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'email@example.com'}),
         }
@@ -373,7 +385,7 @@ class EditEmployeeForm(forms.ModelForm):
     class Meta:
         model = Employee
         fields = ['first_name', 'last_name', 'position', 'hourly_rate', 
-                  'work_start', 'work_end', 'break_minutes', 'work_days',
+                  'work_start', 'work_end', 'break_minutes', 'work_days', 'follows_calendar',
                   'phone', 'email']
         widgets = {
             'first_name': forms.TextInput(attrs={'class': 'form-control'}),
@@ -384,6 +396,7 @@ class EditEmployeeForm(forms.ModelForm):
             'work_end': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
             'break_minutes': forms.NumberInput(attrs={'class': 'form-control'}),
             'work_days': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '1,2,3,4,5'}),
+            'follows_calendar': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'phone': forms.TextInput(attrs={'class': 'form-control phone-mask'}),
             'email': forms.EmailInput(attrs={'class': 'form-control'}),
         }
@@ -406,7 +419,7 @@ class EditEmployeeForm(forms.ModelForm):
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'category', 'description', 'price', 'image_emoji', 'is_available', 'is_popular']
+        fields = ['name', 'category', 'description', 'price', 'image_emoji', 'prep_minutes', 'is_available', 'is_popular']
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -430,6 +443,11 @@ class ProductForm(forms.ModelForm):
                 'class': 'form-control',
                 'placeholder': '🍕'
             }),
+            'prep_minutes': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': '0',
+                'placeholder': 'Минут на 1 шт.'
+            }),
             'is_available': forms.CheckboxInput(attrs={
                 'class': 'form-check-input'
             }),
@@ -443,6 +461,7 @@ class ProductForm(forms.ModelForm):
             'description': 'Описание',
             'price': 'Цена (₽)',
             'image_emoji': 'Иконка (эмодзи)',
+            'prep_minutes': 'Время готовки (мин)',
             'is_available': 'В наличии',
             'is_popular': 'Популярное',
         }
@@ -460,6 +479,45 @@ class ProductForm(forms.ModelForm):
         return name
 
 
+class RestockForm(forms.Form):
+    """Приход и инвентаризация по всем товарам меню одной формой"""
+    
+    def __init__(self, *args, products=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.products = list(products)
+        for product in self.products:
+            self.fields[f'add_{product.id}'] = forms.IntegerField(
+                min_value=0,
+                required=False,
+                widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '0'}),
+                label=f'Приход: {product.name}'
+            )
+            self.fields[f'count_{product.id}'] = forms.IntegerField(
+                min_value=0,
+                required=False,
+                widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'не менять'}),
+                label=f'Факт: {product.name}'
+            )
+    
+    def product_fields(self):
+        """Тройки (товар, приход, фактический остаток) — для шаблона"""
+        return [(product, self[f'add_{product.id}'], self[f'count_{product.id}']) for product in self.products]
+    
+    def added(self) -> dict:
+        return {product.id: self.cleaned_data[f'add_{product.id}'] for product in self.products
+                if self.cleaned_data[f'add_{product.id}']}
+    
+    def counted(self) -> dict:
+        return {product.id: self.cleaned_data[f'count_{product.id}'] for product in self.products
+                if self.cleaned_data[f'count_{product.id}'] is not None}
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors and not self.added() and not self.counted():
+            raise ValidationError('Укажите приход или фактический остаток хотя бы для одного товара')
+        return cleaned_data
+
+
 class PayrollCalculateForm(forms.Form):
     """Форма для расчёта зарплаты"""
     
@@ -476,6 +534,11 @@ class PayrollCalculateForm(forms.Form):
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
         label='Конец периода'
     )
+    use_timesheet = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='По табелю (отмеченные смены)'
+    )
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -502,4 +565,180 @@ class PayrollBulkForm(forms.Form):
     period_end = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
         label='Конец периода'
-    )
\ No newline at end of file
+    )
+    use_timesheet = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='По табелю (отмеченные смены)'
+    )
+
+
+class PayrollSimulationForm(forms.Form):
+    """Период моделирования фонда оплаты труда"""
+    
+    first_month = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='С месяца'
+    )
+    months = forms.IntegerField(
+        min_value=1,
+        max_value=24,
+        initial=12,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Месяцев'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['first_month'].initial = date.today().replace(day=1)
+
+
+class PayrollScenarioForm(forms.Form):
+    """Сценарий «что если»: ставки и графики по должностям, НДФЛ, переработка"""
+    
+    name = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Например: +10% кассирам'}),
+        label='Название'
+    )
+    ndfl_percent = forms.DecimalField(
+        min_value=0,
+        max_value=99,
+        decimal_places=2,
+        initial=13,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.5'}),
+        label='НДФЛ, %'
+    )
+    overtime_multiplier = forms.DecimalField(
+        min_value=1,
+        max_value=5,
+        decimal_places=2,
+        initial=Decimal('1.5'),
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.1'}),
+        label='Коэффициент переработки'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.positions = [(code, label) for code, label in Employee.POSITION_CHOICES if code != 'user']
+        for code, label in self.positions:
+            self.fields[f'rate_{code}'] = forms.DecimalField(
+                min_value=0,
+                max_value=1000,
+                decimal_places=2,
+                initial=100,
+                widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '1'}),
+                label=f'Ставка: {label}, %'
+            )
+            self.fields[f'days_{code}'] = forms.CharField(
+                max_length=20,
+                required=False,
+                widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'как сейчас'}),
+                label=f'Рабочие дни: {label}'
+            )
+    
+    def position_fields(self):
+        """Пары полей (ставка, дни) по должностям — для шаблона"""
+        return [(label, self[f'rate_{code}'], self[f'days_{code}']) for code, label in self.positions]
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors:
+            try:
+                self.scenario = make_scenario(
+                    cleaned_data['name'],
+                    rate_multipliers={code: cleaned_data[f'rate_{code}'] / 100 for code, _ in self.positions},
+                    work_days={code: cleaned_data[f'days_{code}'] for code, _ in self.positions},
+                    ndfl_rate=cleaned_data['ndfl_percent'] / 100,
+                    overtime_multiplier=cleaned_data['overtime_multiplier'],
+                )
+            except SimulationError as e:
+                raise ValidationError(str(e))
+        return cleaned_data
+
+
+class ProductAnalyticsForm(forms.Form):
+    """Период и параметры аналитики продаж товаров"""
+    
+    ORDER_CHOICES = (
+        ('quantity', 'По количеству'),
+        ('revenue', 'По выручке'),
+    )
+    
+    start = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='С'
+    )
+    end = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='По'
+    )
+    category = forms.ChoiceField(
+        choices=[('', 'Все категории')] + list(Product.CATEGORY_CHOICES),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Категория'
+    )
+    order_by = forms.ChoiceField(
+        choices=ORDER_CHOICES,
+        initial='quantity',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Сортировка'
+    )
+    limit = forms.IntegerField(
+        min_value=1,
+        max_value=100,
+        initial=10,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Сколько товаров'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['end'].initial = date.today()
+        self.fields['start'].initial = date.today() - timedelta(days=30)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise ValidationError('Начало периода позже конца')
+        return cleaned_data
+
+
+class AnalyticsPeriodForm(forms.Form):
+    """Период аналитики продаж и период для сравнения"""
+    
+    MAX_DAYS = 731
+    
+    start = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='С'
+    )
+    end = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='По'
+    )
+    compare = forms.ChoiceField(
+        choices=COMPARE_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Сравнить'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['end'].initial = date.today()
+        self.fields['start'].initial = date.today() - timedelta(days=30)
+        self.fields['compare'].initial = ''
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end:
+            if start > end:
+                raise ValidationError('Начало периода позже конца')
+            if (end - start).days >= self.MAX_DAYS:
+                raise ValidationError(f'Период не длиннее {self.MAX_DAYS} дней')
+        return cleaned_data
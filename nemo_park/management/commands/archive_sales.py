@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.archive_service import SalesArchive
+
+
+class Command(BaseCommand):
+    help = 'Перенести старые билеты и заказы в архив с сохранением итогов выручки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Архивировать продажи до этой даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--older-than-days', type=int, default=365,
+                            help='Архивировать продажи старше N дней (если не задан --before)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одной транзакции')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+        else:
+            cutoff = date.today() - timedelta(days=options['older_than_days'])
+
+        archive = SalesArchive(cutoff, batch_size=options['batch_size'])
+        tickets = archive.archive_tickets()
+        orders = archive.archive_orders()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'В архив до {cutoff}: билетов {tickets}, заказов {orders}'
+        ))
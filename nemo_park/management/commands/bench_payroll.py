@@ -0,0 +1,148 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...schedule import compile_schedule
+from ...services.calendar_service import ProductionCalendar
+from ...services.money import to_kopecks, from_kopecks
+from ...services.payroll_service import PayrollCalculator, payslip_kopecks
+
+
+FIELDS = ('total_hours', 'overtime_hours', 'base_salary', 'overtime_pay', 'gross_salary', 'ndfl_tax', 'net_salary',
+          'holiday_pay')
+
+
+def decimal_payslip(work_days, minutes_per_day, hourly_rate, holiday_days=0, holiday_percent=100):
+    """Эталонный расчёт на Decimal.
+
+    Делим на 60 последним действием: тогда точные «половины копейки»
+    не искажаются приближением 1/60 часа и округляются по правилам.
+    """
+    standard_minutes = PayrollCalculator.STANDARD_HOURS_PER_DAY * 60
+    total_minutes = work_days * minutes_per_day
+    overtime_minutes = work_days * max(0, minutes_per_day - standard_minutes)
+    regular_minutes = total_minutes - overtime_minutes
+
+    base_salary = regular_minutes * hourly_rate / 60
+    overtime_pay = overtime_minutes * hourly_rate * PayrollCalculator.OVERTIME_MULTIPLIER / 60
+    overtime_per_day = max(0, minutes_per_day - standard_minutes)
+    day_pay = (minutes_per_day - overtime_per_day) * hourly_rate \
+        + overtime_per_day * hourly_rate * PayrollCalculator.OVERTIME_MULTIPLIER
+    holiday_pay = holiday_days * day_pay * (holiday_percent - 100) / 6000
+    gross_salary = base_salary + overtime_pay + holiday_pay
+    ndfl_tax = (gross_salary * PayrollCalculator.NDFL_RATE).quantize(Decimal('0.01'))
+    net_salary = gross_salary - ndfl_tax
+
+    return tuple(v.quantize(Decimal('0.01')) for v in (
+        Decimal(total_minutes) / 60, Decimal(overtime_minutes) / 60,
+        base_salary, overtime_pay, gross_salary, ndfl_tax, net_salary, holiday_pay
+    ))
+
+
+def kopeck_payslip(work_days, minutes_per_day, hourly_rate, holiday_days=0, holiday_percent=100):
+    result = payslip_kopecks(
+        work_days, minutes_per_day, to_kopecks(hourly_rate),
+        PayrollCalculator.STANDARD_HOURS_PER_DAY * 60,
+        PayrollCalculator.OVERTIME_RATIO,
+        PayrollCalculator.NDFL_RATIO,
+        ((holiday_days, holiday_percent),) if holiday_days else (),
+    )
+    return tuple(from_kopecks(v) for v in result)
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк расчёта зарплаты в копейках против Decimal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=200000, help='Число случайных сотрудников')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        cases = []
+        for _ in range(options['cases']):
+            work_days = rng.randint(0, 31)
+            cases.append((
+                work_days,
+                rng.randint(0, 24 * 60) - rng.choice((0, 30, 45, 60)),  # минут в день
+                Decimal(rng.randint(0, 300000)) / 100,                # ставка ₽/час
+                rng.randint(0, min(work_days, 3)),                    # из них в праздники
+                rng.choice((100, 150, 200, 300)),                     # коэффициент праздника, %
+            ))
+
+        # Совпадение копейка в копейку с Decimal проверяют тесты (python manage.py test nemo_park)
+        # Скорость: только арифметика, без преобразования в Decimal на выходе
+        params = (
+            PayrollCalculator.STANDARD_HOURS_PER_DAY * 60,
+            PayrollCalculator.OVERTIME_RATIO,
+            PayrollCalculator.NDFL_RATIO,
+        )
+        started = time.perf_counter()
+        for case in cases:
+            decimal_payslip(*case)
+        decimal_time = time.perf_counter() - started
+
+        kopeck_cases = [
+            (days, minutes, to_kopecks(rate), ((holidays, percent),) if holidays else ())
+            for days, minutes, rate, holidays, percent in cases
+        ]
+        started = time.perf_counter()
+        for days, minutes, rate, holidays in kopeck_cases:
+            payslip_kopecks(days, minutes, rate, *params, holidays)
+        kopeck_time = time.perf_counter() - started
+
+        self.stdout.write(f'Decimal:  {len(cases) / decimal_time:,.0f} расчётов/с')
+        self.stdout.write(f'Копейки:  {len(cases) / kopeck_time:,.0f} расчётов/с')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{decimal_time / kopeck_time:.2f}'))
+
+        self._check_calendar(rng, min(options['cases'], 20000))
+
+    def _check_calendar(self, rng, count):
+        """Рабочие дни по календарю против перебора дней и скорость против недельного подсчёта"""
+        schedules = [
+            compile_schedule('09:00', '18:00', 60, ','.join(map(str, sorted(rng.sample(range(1, 8), rng.randint(1, 7))))))
+            for _ in range(64)
+        ]
+        today = date.today()
+        periods = []
+        for _ in range(count):
+            start = today + timedelta(days=rng.randint(-400, 400))
+            periods.append((rng.choice(schedules), start, start + timedelta(days=rng.randint(0, 400))))
+
+        percents = ProductionCalendar.holiday_percents(today - timedelta(days=400), today + timedelta(days=800))
+        for schedule, start, end in periods[:500]:
+            for follows_calendar in (True, False):
+                expected_total = 0
+                expected_holidays = 0
+                day = start
+                while day <= end:
+                    calendar = ProductionCalendar.get_year(day.year)
+                    bit = calendar.day_bit(day)
+                    works = schedule.works_on(day)
+                    if follows_calendar:
+                        works = (works and not calendar.holidays & bit) or bool(calendar.transferred_workdays(schedule.mask) & bit)
+                    elif works and day in percents:
+                        expected_holidays += 1
+                    expected_total += works
+                    day += timedelta(days=1)
+                total = ProductionCalendar.count_work_days(schedule, start, end, follows_calendar)
+                holidays = ProductionCalendar.holiday_work_days(schedule, start, end) if not follows_calendar else ()
+                if (total, sum(days for days, _ in holidays)) != (expected_total, expected_holidays):
+                    raise CommandError(f'Календарь: расхождение для {schedule.work_days} {start}..{end}')
+        self.stdout.write(self.style.SUCCESS('Календарь совпадает с перебором дней'))
+
+        started = time.perf_counter()
+        for schedule, start, end in periods:
+            schedule.count_work_days(start, end)
+        weekday_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for schedule, start, end in periods:
+            ProductionCalendar.count_work_days(schedule, start, end)
+        calendar_time = time.perf_counter() - started
+
+        self.stdout.write(f'Дни недели: {count / weekday_time:,.0f} периодов/с')
+        self.stdout.write(f'Календарь:  {count / calendar_time:,.0f} периодов/с')
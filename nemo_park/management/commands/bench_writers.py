@@ -0,0 +1,157 @@
+import time
+import multiprocessing
+from contextlib import contextmanager
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction, OperationalError
+
+from ...models import CustomUser, Visitor, Ticket, Product, Order, OrderItem
+
+
+BENCH_USERNAME = 'bench_cashier'
+BENCH_EMAIL = 'bench@nemopark.local'
+
+# Стоковая конфигурация Django для SQLite — с ней сравниваем настройки проекта
+DEFAULT_SQLITE_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+DEFAULT_SQLITE_OPTIONS = {'timeout': 5}
+
+
+def _writer(duration, visitor_id, cashier_id, products, queue):
+    """Процесс-касса: продаёт билеты и заказы, пока не выйдет время"""
+    sold = 0
+    errors = 0
+    step = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        try:
+            with transaction.atomic():
+                if step % 2 == 0:
+                    Ticket.objects.create(
+                        visitor_id=visitor_id,
+                        ticket_type='adult',
+                        valid_date=date.today(),
+                        cashier_id=cashier_id,
+                    )
+                else:
+                    order = Order.objects.create(visitor_id=visitor_id, cashier_id=cashier_id, total_price=0)
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product_id=product_id, quantity=1, price=price)
+                        for product_id, price in products
+                    ])
+                    order.total_price = sum(price for _, price in products)
+                    order.save(update_fields=['total_price'])
+            sold += 1
+        except OperationalError:
+            errors += 1
+        step += 1
+
+    connections.close_all()
+    queue.put((sold, errors))
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест: параллельные кассы продают билеты и заказы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Число параллельных касс (процессов)')
+        parser.add_argument('--seconds', type=float, default=5, help='Длительность каждого прогона')
+        parser.add_argument(
+            '--mode',
+            choices=['both', 'tuned', 'default'],
+            default='both',
+            help='SQLite: настройки проекта, стоковые настройки Django или оба прогона'
+        )
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('Нужна ОС с поддержкой fork')
+
+        visitor, cashier, products = self._prepare()
+        try:
+            if connection.vendor != 'sqlite':
+                modes = ['tuned']
+            elif options['mode'] == 'both':
+                modes = ['default', 'tuned']
+            else:
+                modes = [options['mode']]
+
+            results = {}
+            for mode in modes:
+                with self._sqlite_mode(mode):
+                    results[mode] = self._run(options['workers'], options['seconds'], visitor, cashier, products)
+                sold, errors, rate = results[mode]
+                self.stdout.write(
+                    f'{connection.vendor} [{mode}]: {sold} продаж, {errors} ошибок блокировки, {rate:.1f} продаж/с'
+                )
+
+            if len(results) == 2 and results['default'][2]:
+                speedup = results['tuned'][2] / results['default'][2]
+                self.stdout.write(self.style.SUCCESS(f'Ускорение: x{speedup:.2f}'))
+        finally:
+            self._cleanup()
+
+    def _prepare(self):
+        self._cleanup()
+        cashier = CustomUser.objects.create_user(username=BENCH_USERNAME, password=None, role='cashier')
+        visitor = Visitor.objects.create(first_name='Бенчмарк', last_name='Кассы', email=BENCH_EMAIL, phone='')
+        products = list(Product.objects.values_list('id', 'price')[:3])
+        if not products:
+            raise CommandError('Нет товаров. Выполните python create_test_data.py')
+        return visitor, cashier, products
+
+    def _cleanup(self):
+        # Билеты и заказы удаляются каскадом
+        Visitor.objects.filter(email=BENCH_EMAIL).delete()
+        CustomUser.objects.filter(username=BENCH_USERNAME).delete()
+
+    @contextmanager
+    def _sqlite_mode(self, mode):
+        """Временно переключить SQLite на стоковые настройки Django"""
+        if connection.vendor != 'sqlite' or mode == 'tuned':
+            yield
+            return
+
+        pragmas = settings.SQLITE_PRAGMAS
+        sqlite_options = connection.settings_dict['OPTIONS']
+        settings.SQLITE_PRAGMAS = DEFAULT_SQLITE_PRAGMAS
+        connection.settings_dict['OPTIONS'] = DEFAULT_SQLITE_OPTIONS
+        self._reconnect()
+        try:
+            yield
+        finally:
+            settings.SQLITE_PRAGMAS = pragmas
+            connection.settings_dict['OPTIONS'] = sqlite_options
+            self._reconnect()
+
+    def _reconnect(self):
+        # Новое соединение применит PRAGMA (journal_mode сохраняется в файле БД)
+        connections.close_all()
+        connection.ensure_connection()
+        connections.close_all()
+
+    def _run(self, workers, seconds, visitor, cashier, products):
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+
+        # Дочерние процессы не должны наследовать открытые соединения и пул PostgreSQL
+        connections.close_all()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+        processes = [
+            ctx.Process(target=_writer, args=(seconds, visitor.id, cashier.id, products, queue))
+            for _ in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        totals = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        sold = sum(s for s, _ in totals)
+        errors = sum(e for _, e in totals)
+        return sold, errors, sold / elapsed
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...services.loyalty_service import LoyaltyLedger
+
+
+class Command(BaseCommand):
+    help = 'Свернуть новые события журнала баллов в снимки балансов'
+
+    def handle(self, *args, **options):
+        result = LoyaltyLedger.compact()
+        self.stdout.write(self.style.SUCCESS(
+            f'Свёрнуто событий: {result.events}, посетителей: {result.visitors}, граница: #{result.compacted_to}'
+        ))
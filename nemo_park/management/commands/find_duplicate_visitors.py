@@ -0,0 +1,20 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...services.dedup_service import VisitorDeduplicator
+
+
+class Command(BaseCommand):
+    help = 'Найти вероятные дубли посетителей (блокирующий индекс + нечёткое сравнение имён в пуле процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Процессов (по умолчанию VISITOR_DEDUP_WORKERS)')
+
+    def handle(self, *args, **options):
+        deduplicator = VisitorDeduplicator(workers=options['workers'] or settings.VISITOR_DEDUP_WORKERS)
+        started = time.perf_counter()
+        matches = deduplicator.run()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Найдено пар: {len(matches)} за {elapsed:.2f} с'))
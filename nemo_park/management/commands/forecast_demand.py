@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from ...services.demand_service import DemandForecaster, SalesSeries
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать прогноз продаж по дням недели и часам (запускать по расписанию, например ночью)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', type=date.fromisoformat, help='Прогноз по неделям до этой даты (по умолчанию сегодня)')
+        parser.add_argument('--rebuild', action='store_true', help='Сначала пересобрать почасовой ряд продаж')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = SalesSeries.rebuild()
+            self.stdout.write(f'Почасовой ряд пересобран: строк {rows}')
+
+        as_of = DemandForecaster.fit(options['as_of'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогноз рассчитан по {as_of:%d.%m.%Y} (недель: до {DemandForecaster.WEEKS})'
+        ))
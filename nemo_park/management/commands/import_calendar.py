@@ -0,0 +1,81 @@
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Holiday
+
+
+KINDS = {
+    'holiday': Holiday.HOLIDAY,
+    'праздник': Holiday.HOLIDAY,
+    'workday': Holiday.WORKDAY,
+    'рабочий': Holiday.WORKDAY,
+}
+
+
+class Command(BaseCommand):
+    help = 'Импорт производственного календаря из CSV (дата;тип;название;коэффициент;выходной перенесён на)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV-файл: дата (ГГГГ-ММ-ДД);holiday|workday;название;коэффициент оплаты;'
+                                          'дата, на которую перенесён выходной (для workday)')
+        parser.add_argument('--replace', action='store_true',
+                            help='Удалить существующие дни за годы, которые есть в файле')
+
+    def handle(self, *args, **options):
+        days = self._read(options['path'])
+        if not days:
+            raise CommandError('В файле нет дней')
+
+        years = sorted({holiday.date.year for holiday in days})
+        with transaction.atomic():
+            if options['replace']:
+                Holiday.objects.filter(date__year__in=years).delete()
+            Holiday.objects.bulk_create(
+                days,
+                update_conflicts=True,
+                unique_fields=['date'],
+                update_fields=['name', 'kind', 'pay_multiplier', 'moved_to'],
+            )
+        # bulk_create не вызывает save(), кэши сбрасываем сами
+        Holiday.invalidate_caches()
+
+        holidays = sum(1 for holiday in days if holiday.kind == Holiday.HOLIDAY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Календарь на {", ".join(map(str, years))}: праздников {holidays}, '
+            f'перенесённых рабочих дней {len(days) - holidays}'
+        ))
+
+    def _read(self, path):
+        days = {}
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            for line_no, row in enumerate(csv.reader(f, delimiter=';'), start=1):
+                if not row or not row[0].strip() or row[0].startswith('#'):
+                    continue
+                try:
+                    day = date.fromisoformat(row[0].strip())
+                except ValueError:
+                    if line_no == 1:
+                        continue  # заголовок
+                    raise CommandError(f'Строка {line_no}: дата должна быть в формате ГГГГ-ММ-ДД')
+
+                kind = KINDS.get((row[1] if len(row) > 1 else 'holiday').strip().lower() or 'holiday')
+                if kind is None:
+                    raise CommandError(f'Строка {line_no}: тип дня — holiday или workday')
+                name = row[2].strip() if len(row) > 2 else ''
+                try:
+                    multiplier = Decimal(row[3].strip()) if len(row) > 3 and row[3].strip() else Decimal('2')
+                except InvalidOperation:
+                    raise CommandError(f'Строка {line_no}: неверный коэффициент оплаты')
+                try:
+                    moved_to = date.fromisoformat(row[4].strip()) if len(row) > 4 and row[4].strip() else None
+                except ValueError:
+                    raise CommandError(f'Строка {line_no}: дата переноса должна быть в формате ГГГГ-ММ-ДД')
+                if moved_to and kind != Holiday.WORKDAY:
+                    raise CommandError(f'Строка {line_no}: дата переноса указывается только для workday')
+
+                days[day] = Holiday(date=day, kind=kind, name=name, pay_multiplier=multiplier, moved_to=moved_to)
+        return list(days.values())
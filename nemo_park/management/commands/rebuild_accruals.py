@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Employee
+from ...services.timesheet_service import Timesheet
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать нарастающие начисления табеля из закрытых смен'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employee', type=int, help='ID сотрудника (по умолчанию — все)')
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.all()
+        if options['employee']:
+            employees = employees.filter(pk=options['employee'])
+
+        count = 0
+        for employee in employees:
+            Timesheet.rebuild(employee)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Начисления пересобраны: сотрудников {count}'))
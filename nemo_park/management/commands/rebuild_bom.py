@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...services.bom_service import BillOfMaterials
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать развёрнутые составы товаров (комбо и рецепты)'
+
+    def handle(self, *args, **options):
+        count = BillOfMaterials.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Составы пересобраны, изменено товаров: {count}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...services.product_sales_service import ProductSales
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать итоги продаж товаров по часам из рабочих и архивных заказов'
+
+    def handle(self, *args, **options):
+        count = ProductSales.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Итоги продаж товаров пересобраны: строк {count}'))
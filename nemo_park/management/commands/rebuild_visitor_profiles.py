@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...services.visitor_service import VisitorProfiles
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать профили посетителей из рабочих и архивных билетов и заказов'
+
+    def handle(self, *args, **options):
+        count = VisitorProfiles.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Профили посетителей пересобраны: {count}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...services.payroll_service import PayrollRecalculator
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать черновики, помеченные после изменения ставки или графика'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employee', type=int, action='append', help='ID сотрудника (можно несколько раз)')
+
+    def handle(self, *args, **options):
+        count = PayrollRecalculator.recompute(options['employee'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано черновиков: {count}'))
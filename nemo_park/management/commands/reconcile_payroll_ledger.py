@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ...services.ledger_service import Ledger
+
+
+class Command(BaseCommand):
+    help = 'Сверить книгу итогов расчётных листов с самими листами и при необходимости пересобрать'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Пересобрать книгу, если есть расхождения')
+
+    def handle(self, *args, **options):
+        discrepancies = Ledger.discrepancies()
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS('Книга итогов сходится с расчётными листами'))
+            return
+
+        for (employee_id, period, status), actual, expected in discrepancies[:20]:
+            scope = f'сотрудник {employee_id}' if employee_id else (f'месяц {period:%Y-%m}' if period else 'всего')
+            self.stdout.write(f'{scope} [{status}]: в книге {actual}, по листам {expected}')
+        self.stdout.write(self.style.WARNING(f'Расхождений: {len(discrepancies)}'))
+
+        if options['fix']:
+            rows = Ledger.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Книга пересобрана: {rows} строк итогов'))
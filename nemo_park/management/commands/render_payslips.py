@@ -0,0 +1,40 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Payroll
+from ...services.payslip_service import PayslipRenderer
+
+
+class Command(BaseCommand):
+    help = 'Расчётные листы за период одним zip-архивом (рендеринг в пуле процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, required=True, help='Начало периода (ГГГГ-ММ-ДД)')
+        parser.add_argument('--end', type=date.fromisoformat, required=True, help='Конец периода (ГГГГ-ММ-ДД)')
+        parser.add_argument('--output', help='Файл архива (по умолчанию payslips_<начало>_<конец>.zip)')
+        parser.add_argument('--workers', type=int, help='Процессов рендеринга (по умолчанию PAYSLIP_WORKERS)')
+        parser.add_argument('--format', choices=['html', 'pdf'], help='По умолчанию PAYSLIP_FORMAT из настроек')
+
+    def handle(self, *args, **options):
+        try:
+            renderer = PayslipRenderer(options['format'], options['workers'] or settings.PAYSLIP_WORKERS)
+        except ValueError as error:
+            raise CommandError(error)
+
+        payrolls = Payroll.objects.filter(period_start__gte=options['start'], period_end__lte=options['end'])
+        count = payrolls.count()
+        if not count:
+            raise CommandError('За этот период расчётных листов нет')
+
+        output = options['output'] or f"payslips_{options['start']}_{options['end']}.zip"
+        started = time.perf_counter()
+        with open(output, 'wb') as archive:
+            archive.write(renderer.zip(renderer.render(payrolls)))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{output}: листов {count} ({renderer.fmt}), {elapsed:.2f} с'
+        ))
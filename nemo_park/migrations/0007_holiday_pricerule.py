@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0006_payroll_work_days_delete_workshift'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Holiday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('name', models.CharField(blank=True, max_length=200, verbose_name='Название')),
+            ],
+            options={
+                'verbose_name': 'Праздник',
+                'verbose_name_plural': 'Праздники',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('ticket_type', models.CharField(blank=True, choices=[('adult', 'Взрослый'), ('child', 'Детский'), ('family', 'Семейный'), ('vip', 'VIP всё включено'), ('water', 'Водная зона'), ('extreme', 'Экстрим-пакет')], help_text='Пусто = все типы', max_length=10, verbose_name='Тип билета')),
+                ('weekdays', models.CharField(blank=True, help_text='1=Пн ... 7=Вс, пусто = все дни', max_length=20, verbose_name='Дни недели')),
+                ('date_from', models.DateField(blank=True, null=True, verbose_name='Действует с')),
+                ('date_to', models.DateField(blank=True, null=True, verbose_name='Действует по')),
+                ('holidays_only', models.BooleanField(default=False, verbose_name='Только праздники')),
+                ('min_occupancy', models.PositiveIntegerField(default=0, help_text='Правило включается, когда на дату продано не меньше билетов', verbose_name='От проданных билетов')),
+                ('multiplier', models.DecimalField(decimal_places=2, default=1, max_digits=5, verbose_name='Множитель')),
+                ('surcharge', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Надбавка ₽')),
+                ('priority', models.IntegerField(default=0, verbose_name='Порядок применения')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активно')),
+            ],
+            options={
+                'verbose_name': 'Правило цены',
+                'verbose_name_plural': 'Правила цен',
+                'ordering': ['priority', 'id'],
+            },
+        ),
+    ]
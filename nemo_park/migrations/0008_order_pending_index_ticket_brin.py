@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:51
+
+from django.db import migrations, models
+
+
+def create_ticket_brin(apps, schema_editor):
+    # BRIN есть только в PostgreSQL: билеты пишутся по возрастанию purchase_date
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ticket_purchase_date_brin '
+        'ON nemo_park_ticket USING brin (purchase_date)'
+    )
+
+
+def drop_ticket_brin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ticket_purchase_date_brin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0007_holiday_pricerule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='order_pending_created_idx'),
+        ),
+        migrations.RunPython(create_ticket_brin, drop_ticket_brin),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0008_order_pending_index_ticket_brin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Итого')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('preparing', 'Готовится'), ('ready', 'Готов'), ('delivered', 'Выдан'), ('cancelled', 'Отменён')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата заказа')),
+                ('notes', models.TextField(blank=True, verbose_name='Примечания')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')),
+                ('cashier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кассир')),
+                ('visitor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='nemo_park.visitor', verbose_name='Посетитель')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архив заказов',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Цена')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='nemo_park.archivedorder', verbose_name='Заказ')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='nemo_park.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Позиция архивного заказа',
+                'verbose_name_plural': 'Позиции архивных заказов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTicket',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ticket_type', models.CharField(choices=[('adult', 'Взрослый'), ('child', 'Детский'), ('family', 'Семейный'), ('vip', 'VIP всё включено'), ('water', 'Водная зона'), ('extreme', 'Экстрим-пакет')], max_length=10, verbose_name='Тип билета')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Цена')),
+                ('purchase_date', models.DateTimeField(verbose_name='Дата покупки')),
+                ('valid_date', models.DateField(verbose_name='Действителен до')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')),
+                ('cashier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кассир')),
+                ('visitor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='nemo_park.visitor', verbose_name='Посетитель')),
+            ],
+            options={
+                'verbose_name': 'Архивный билет',
+                'verbose_name_plural': 'Архив билетов',
+                'ordering': ['-purchase_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchiveRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('kind', models.CharField(choices=[('ticket', 'Билеты'), ('order', 'Заказы')], max_length=10, verbose_name='Вид')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('cashier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кассир')),
+            ],
+            options={
+                'verbose_name': 'Итог архива',
+                'verbose_name_plural': 'Итоги архива',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'kind', 'cashier'), name='archive_rollup_unique')],
+            },
+        ),
+    ]
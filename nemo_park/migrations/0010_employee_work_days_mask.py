@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:55
+
+from django.db import migrations, models
+
+from nemo_park.schedule import days_to_mask, parse_work_days
+
+
+def fill_work_days_mask(apps, schema_editor):
+    Employee = apps.get_model('nemo_park', 'Employee')
+    employees = list(Employee.objects.only('id', 'work_days'))
+    for employee in employees:
+        employee.work_days_mask = days_to_mask(parse_work_days(employee.work_days))
+    Employee.objects.bulk_update(employees, ['work_days_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0009_sales_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='work_days_mask',
+            field=models.PositiveSmallIntegerField(default=31, editable=False, help_text='Бит 0 = Пн ... бит 6 = Вс, пересчитывается при сохранении', verbose_name='Рабочие дни (битовая маска)'),
+        ),
+        migrations.RunPython(fill_work_days_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0010_employee_work_days_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('minutes', models.PositiveIntegerField(default=0, verbose_name='Отработано (мин)')),
+                ('overtime_minutes', models.PositiveIntegerField(default=0, verbose_name='Переработка (мин)')),
+                ('base_units', models.BigIntegerField(default=0, verbose_name='Базовая оплата (units)')),
+                ('overtime_units', models.BigIntegerField(default=0, verbose_name='За переработку (units)')),
+                ('cum_days', models.PositiveIntegerField(default=0, verbose_name='Дней нарастающим итогом')),
+                ('cum_minutes', models.BigIntegerField(default=0, verbose_name='Минут нарастающим итогом')),
+                ('cum_overtime_minutes', models.BigIntegerField(default=0, verbose_name='Переработка нарастающим итогом')),
+                ('cum_base_units', models.BigIntegerField(default=0, verbose_name='Базовая оплата нарастающим итогом')),
+                ('cum_overtime_units', models.BigIntegerField(default=0, verbose_name='За переработку нарастающим итогом')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accruals', to='nemo_park.employee', verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Начисление за день',
+                'verbose_name_plural': 'Начисления за дни',
+                'ordering': ['employee', 'day'],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'day'), name='payroll_accrual_unique_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkShift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Начало смены')),
+                ('ended_at', models.DateTimeField(blank=True, null=True, verbose_name='Конец смены')),
+                ('break_minutes', models.PositiveIntegerField(default=0, verbose_name='Перерыв (мин)')),
+                ('worked_minutes', models.PositiveIntegerField(default=0, verbose_name='Отработано (мин)')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shifts', to='nemo_park.employee', verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Смена',
+                'verbose_name_plural': 'Смены',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['employee', '-started_at'], name='nemo_park_w_employe_c873ea_idx')],
+            },
+        ),
+    ]
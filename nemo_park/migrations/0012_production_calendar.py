@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:02
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0011_workshift_payrollaccrual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='follows_calendar',
+            field=models.BooleanField(default=True, help_text='Праздники — выходные, перенесённые рабочие дни — рабочие. Если выключено, работа в праздник по графику оплачивается с повышением', verbose_name='По производственному календарю'),
+        ),
+        migrations.AddField(
+            model_name='holiday',
+            name='kind',
+            field=models.CharField(choices=[('holiday', 'Праздник (выходной)'), ('workday', 'Перенесённый рабочий день')], default='holiday', max_length=10, verbose_name='Тип дня'),
+        ),
+        migrations.AddField(
+            model_name='holiday',
+            name='pay_multiplier',
+            field=models.DecimalField(decimal_places=2, default=Decimal('2'), help_text='Оплата работы в этот праздник (x2 по ТК РФ)', max_digits=4, verbose_name='Коэффициент оплаты'),
+        ),
+        migrations.AddField(
+            model_name='payroll',
+            name='holiday_pay',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='За работу в праздники'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:07
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_payroll_ledger(apps, schema_editor):
+    Payroll = apps.get_model('nemo_park', 'Payroll')
+    PayrollLedger = apps.get_model('nemo_park', 'PayrollLedger')
+
+    totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    rows = (
+        Payroll.objects.order_by()
+        .annotate(month=TruncMonth('period_start'))
+        .values('employee_id', 'month', 'status')
+        .annotate(count=Count('id'), gross=Sum('gross_salary'), net=Sum('net_salary'))
+    )
+    for row in rows:
+        status = row['status']
+        for key in ((None, None, status), (row['employee_id'], None, status), (None, row['month'], status)):
+            totals[key][0] += row['count']
+            totals[key][1] += row['gross']
+            totals[key][2] += row['net']
+
+    PayrollLedger.objects.bulk_create([
+        PayrollLedger(employee_id=employee_id, period=period, status=status,
+                      count=count, gross_total=gross, net_total=net)
+        for (employee_id, period, status), (count, gross, net) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0012_production_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(blank=True, null=True, verbose_name='Месяц')),
+                ('status', models.CharField(choices=[('draft', 'Черновик'), ('confirmed', 'Подтверждён'), ('paid', 'Выплачено')], max_length=20, verbose_name='Статус')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Листов')),
+                ('gross_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Начислено')),
+                ('net_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='К выплате')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payroll_ledger', to='nemo_park.employee', verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Итог расчётных листов',
+                'verbose_name_plural': 'Итоги расчётных листов',
+                'constraints': [models.UniqueConstraint(fields=('employee', 'period', 'status'), name='payroll_ledger_unique')],
+            },
+        ),
+        migrations.RunPython(fill_payroll_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0013_payroll_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payroll',
+            name='from_timesheet',
+            field=models.BooleanField(default=False, verbose_name='По табелю'),
+        ),
+        migrations.AddField(
+            model_name='payroll',
+            name='is_stale',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Требует пересчёта'),
+        ),
+    ]
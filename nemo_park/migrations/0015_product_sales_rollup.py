@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:13
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_product_sales(apps, schema_editor):
+    ProductSalesRollup = apps.get_model('nemo_park', 'ProductSalesRollup')
+
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    for model_name in ('OrderItem', 'ArchivedOrderItem'):
+        items = (
+            apps.get_model('nemo_park', model_name).objects
+            .exclude(order__status='cancelled').filter(product__isnull=False)
+            .values_list('order__created_at', 'product_id', 'quantity', 'price').iterator()
+        )
+        for created_at, product_id, quantity, price in items:
+            created = timezone.localtime(created_at)
+            key = (created.date(), created.hour, product_id)
+            totals[key][0] += quantity
+            totals[key][1] += price * quantity
+
+    ProductSalesRollup.objects.bulk_create([
+        ProductSalesRollup(day=day, hour=hour, product_id=product_id, quantity=quantity, revenue=revenue)
+        for (day, hour, product_id), (quantity, revenue) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0014_payroll_stale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='Час')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Количество')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='nemo_park.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за час',
+                'verbose_name_plural': 'Продажи товаров по часам',
+                'ordering': ['-day', '-hour'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'hour', 'product'), name='product_sales_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(fill_product_sales, migrations.RunPython.noop),
+    ]
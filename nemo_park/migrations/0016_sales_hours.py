@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:16
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_sales_hours(apps, schema_editor):
+    SalesHour = apps.get_model('nemo_park', 'SalesHour')
+
+    sources = (
+        ('ticket', 'Ticket', 'purchase_date', 'price'),
+        ('ticket', 'ArchivedTicket', 'purchase_date', 'price'),
+        ('order', 'Order', 'created_at', 'total_price'),
+        ('order', 'ArchivedOrder', 'created_at', 'total_price'),
+    )
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    for channel, model_name, moment_field, revenue_field in sources:
+        rows = apps.get_model('nemo_park', model_name).objects.all()
+        if channel == 'order':
+            rows = rows.exclude(status='cancelled')
+        for moment, cashier_id, revenue in rows.values_list(moment_field, 'cashier_id', revenue_field).iterator():
+            moment = timezone.localtime(moment)
+            key = (moment.date(), moment.hour, channel, cashier_id)
+            totals[key][0] += 1
+            totals[key][1] += revenue
+
+    SalesHour.objects.bulk_create([
+        SalesHour(day=day, hour=hour, channel=channel, cashier_id=cashier_id, count=count, revenue=revenue)
+        for (day, hour, channel, cashier_id), (count, revenue) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0015_product_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(verbose_name='День недели')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='Час')),
+                ('channel', models.CharField(choices=[('ticket', 'Билеты'), ('order', 'Заказы')], max_length=10, verbose_name='Канал')),
+                ('expected', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Ожидается продаж')),
+                ('fitted_on', models.DateField(verbose_name='Рассчитан по')),
+            ],
+            options={
+                'verbose_name': 'Прогноз продаж',
+                'verbose_name_plural': 'Прогноз продаж',
+                'ordering': ['weekday', 'hour', 'channel'],
+                'constraints': [models.UniqueConstraint(fields=('weekday', 'hour', 'channel'), name='demand_forecast_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='Час')),
+                ('channel', models.CharField(choices=[('ticket', 'Билеты'), ('order', 'Заказы')], max_length=10, verbose_name='Канал')),
+                ('count', models.IntegerField(default=0, verbose_name='Продаж')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('cashier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кассир')),
+            ],
+            options={
+                'verbose_name': 'Продажи за час',
+                'verbose_name_plural': 'Продажи по часам',
+                'ordering': ['-day', '-hour'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'hour', 'channel', 'cashier'), name='sales_hour_unique')],
+            },
+        ),
+        migrations.RunPython(fill_sales_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:22
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_visitor_profiles(apps, schema_editor):
+    VisitorProfile = apps.get_model('nemo_park', 'VisitorProfile')
+    VisitorProduct = apps.get_model('nemo_park', 'VisitorProduct')
+
+    profiles = defaultdict(lambda: {'days': set(), 'tickets': 0, 'orders': 0,
+                                    'ticket_spend': Decimal('0'), 'food_spend': Decimal('0')})
+    for model_name in ('Ticket', 'ArchivedTicket'):
+        rows = apps.get_model('nemo_park', model_name).objects.filter(visitor__isnull=False)
+        for visitor_id, valid_date, price in rows.values_list('visitor_id', 'valid_date', 'price').iterator():
+            profile = profiles[visitor_id]
+            profile['days'].add(valid_date)
+            profile['tickets'] += 1
+            profile['ticket_spend'] += price
+    for model_name in ('Order', 'ArchivedOrder'):
+        rows = apps.get_model('nemo_park', model_name).objects.filter(visitor__isnull=False).exclude(status='cancelled')
+        for visitor_id, total_price in rows.values_list('visitor_id', 'total_price').iterator():
+            profile = profiles[visitor_id]
+            profile['orders'] += 1
+            profile['food_spend'] += total_price
+
+    products = defaultdict(int)
+    for model_name in ('OrderItem', 'ArchivedOrderItem'):
+        rows = (
+            apps.get_model('nemo_park', model_name).objects
+            .filter(order__visitor__isnull=False, product__isnull=False).exclude(order__status='cancelled')
+        )
+        for visitor_id, product_id, quantity in rows.values_list('order__visitor_id', 'product_id', 'quantity').iterator():
+            products[visitor_id, product_id] += quantity
+
+    VisitorProfile.objects.bulk_create([
+        VisitorProfile(
+            visitor_id=visitor_id,
+            visits=len(profile['days']),
+            last_visit=max(profile['days'], default=None),
+            tickets=profile['tickets'],
+            orders=profile['orders'],
+            ticket_spend=profile['ticket_spend'],
+            food_spend=profile['food_spend'],
+            total_spend=profile['ticket_spend'] + profile['food_spend'],
+        )
+        for visitor_id, profile in profiles.items()
+    ], batch_size=1000)
+    VisitorProduct.objects.bulk_create([
+        VisitorProduct(visitor_id=visitor_id, product_id=product_id, quantity=quantity)
+        for (visitor_id, product_id), quantity in products.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0016_sales_hours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorProfile',
+            fields=[
+                ('visitor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to='nemo_park.visitor', verbose_name='Посетитель')),
+                ('visits', models.IntegerField(default=0, verbose_name='Визитов')),
+                ('last_visit', models.DateField(blank=True, null=True, verbose_name='Последний визит')),
+                ('tickets', models.IntegerField(default=0, verbose_name='Билетов')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('ticket_spend', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='На билеты')),
+                ('food_spend', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='На еду')),
+                ('total_spend', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Всего')),
+            ],
+            options={
+                'verbose_name': 'Профиль посетителя',
+                'verbose_name_plural': 'Профили посетителей',
+                'ordering': ['-total_spend'],
+                'indexes': [models.Index(fields=['-total_spend'], name='visitor_profile_spend_idx'), models.Index(fields=['-visits', '-total_spend'], name='visitor_profile_visits_idx'), models.Index(fields=['last_visit'], name='visitor_profile_last_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitorProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Количество')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='nemo_park.product', verbose_name='Товар')),
+                ('visitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='nemo_park.visitor', verbose_name='Посетитель')),
+            ],
+            options={
+                'verbose_name': 'Товар посетителя',
+                'verbose_name_plural': 'Товары посетителей',
+                'constraints': [models.UniqueConstraint(fields=('visitor', 'product'), name='visitor_product_unique')],
+            },
+        ),
+        migrations.RunPython(fill_visitor_profiles, migrations.RunPython.noop),
+    ]
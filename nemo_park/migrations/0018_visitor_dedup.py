@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:25
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+EMAIL_DOMAINS = {
+    'googlemail.com': 'gmail.com',
+    'ya.ru': 'yandex.ru',
+    'yandex.com': 'yandex.ru',
+    'yandex.by': 'yandex.ru',
+    'yandex.kz': 'yandex.ru',
+    'yandex.ua': 'yandex.ru',
+}
+
+
+def phone_key(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits.startswith('8'):
+        return '7' + digits[1:]
+    if len(digits) == 10:
+        return '7' + digits
+    if len(digits) == 11 and digits.startswith('7'):
+        return digits
+    return ''
+
+
+def email_key(email):
+    email = (email or '').strip().lower()
+    local, at, domain = email.rpartition('@')
+    if not at:
+        return email
+    domain = EMAIL_DOMAINS.get(domain, domain)
+    local = local.split('+', 1)[0]
+    if domain == 'gmail.com':
+        local = local.replace('.', '')
+    elif domain == 'yandex.ru':
+        local = local.replace('.', '-')
+    return f'{local}@{domain}'
+
+
+def fill_visitor_keys(apps, schema_editor):
+    Visitor = apps.get_model('nemo_park', 'Visitor')
+    visitors = list(Visitor.objects.only('id', 'phone', 'email'))
+    for visitor in visitors:
+        visitor.phone_key = phone_key(visitor.phone)
+        visitor.email_key = email_key(visitor.email)
+    Visitor.objects.bulk_update(visitors, ['phone_key', 'email_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0017_visitor_profiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitor',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=254, verbose_name='Ключ email'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=11, verbose_name='Ключ телефона'),
+        ),
+        migrations.CreateModel(
+            name='VisitorDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('phone', 'Телефон'), ('email', 'Email'), ('phone_email', 'Телефон и email'), ('name', 'Имя и похожий телефон')], max_length=20, verbose_name='Совпадение')),
+                ('score', models.DecimalField(decimal_places=3, max_digits=4, verbose_name='Сходство имён')),
+                ('found_at', models.DateTimeField(auto_now_add=True, verbose_name='Найден')),
+                ('duplicate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='nemo_park.visitor', verbose_name='Дубль')),
+                ('visitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='nemo_park.visitor', verbose_name='Посетитель')),
+            ],
+            options={
+                'verbose_name': 'Дубль посетителя',
+                'verbose_name_plural': 'Дубли посетителей',
+                'ordering': ['-score'],
+                'constraints': [models.UniqueConstraint(fields=('visitor', 'duplicate'), name='visitor_duplicate_unique')],
+            },
+        ),
+        migrations.RunPython(fill_visitor_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:28
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_loyalty(apps, schema_editor):
+    """Баллы за уже совершённые покупки (рабочие и архивные) — сразу свёрнутые в снимки"""
+    LoyaltyEvent = apps.get_model('nemo_park', 'LoyaltyEvent')
+    LoyaltyBalance = apps.get_model('nemo_park', 'LoyaltyBalance')
+    LoyaltyCompaction = apps.get_model('nemo_park', 'LoyaltyCompaction')
+
+    events = []
+    sources = (
+        ('ticket', 'Ticket', 'price'),
+        ('ticket', 'ArchivedTicket', 'price'),
+        ('order', 'Order', 'total_price'),
+        ('order', 'ArchivedOrder', 'total_price'),
+    )
+    for kind, model_name, amount_field in sources:
+        rows = apps.get_model('nemo_park', model_name).objects.filter(visitor__isnull=False)
+        if kind == 'order':
+            rows = rows.exclude(status='cancelled')
+        for source_id, visitor_id, amount in rows.values_list('id', 'visitor_id', amount_field).iterator():
+            points = int(amount // settings.LOYALTY_RUBLES_PER_POINT)
+            if points:
+                events.append(LoyaltyEvent(visitor_id=visitor_id, kind=kind, points=points,
+                                           **{f'{kind}_id': source_id}))
+    LoyaltyEvent.objects.bulk_create(events, batch_size=1000)
+
+    compacted_to = LoyaltyEvent.objects.aggregate(last=models.Max('id'))['last']
+    if compacted_to is None:
+        return
+    totals = defaultdict(int)
+    for event in events:
+        totals[event.visitor_id] += event.points
+    LoyaltyBalance.objects.bulk_create([
+        LoyaltyBalance(visitor_id=visitor_id, points=points, earned=points, compacted_to=compacted_to)
+        for visitor_id, points in totals.items()
+    ], batch_size=1000)
+    LoyaltyCompaction.objects.create(compacted_to=compacted_to, events=len(events), visitors=len(totals))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0018_visitor_dedup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoyaltyBalance',
+            fields=[
+                ('visitor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='loyalty', serialize=False, to='nemo_park.visitor', verbose_name='Посетитель')),
+                ('points', models.IntegerField(default=0, verbose_name='Баллов')),
+                ('earned', models.IntegerField(default=0, verbose_name='Начислено всего')),
+                ('compacted_to', models.BigIntegerField(default=0, verbose_name='По событие')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлён')),
+            ],
+            options={
+                'verbose_name': 'Баланс баллов',
+                'verbose_name_plural': 'Балансы баллов',
+            },
+        ),
+        migrations.CreateModel(
+            name='LoyaltyCompaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compacted_to', models.BigIntegerField(db_index=True, verbose_name='По событие')),
+                ('events', models.PositiveIntegerField(default=0, verbose_name='Событий')),
+                ('visitors', models.PositiveIntegerField(default=0, verbose_name='Посетителей')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Когда')),
+            ],
+            options={
+                'verbose_name': 'Свёртка баллов',
+                'verbose_name_plural': 'Свёртки баллов',
+                'ordering': ['-compacted_to'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoyaltyEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('ticket', 'Билет'), ('order', 'Заказ')], max_length=10, verbose_name='За что')),
+                ('points', models.IntegerField(verbose_name='Баллы')),
+                ('ticket_id', models.BigIntegerField(blank=True, null=True, verbose_name='Билет')),
+                ('order_id', models.BigIntegerField(blank=True, null=True, verbose_name='Заказ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Когда')),
+                ('visitor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='nemo_park.visitor', verbose_name='Посетитель')),
+            ],
+            options={
+                'verbose_name': 'Событие баллов',
+                'verbose_name_plural': 'Журнал баллов',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['visitor', 'id'], name='loyalty_event_visitor_idx'), models.Index(condition=models.Q(('ticket_id__isnull', False)), fields=['ticket_id'], name='loyalty_event_ticket_idx'), models.Index(condition=models.Q(('order_id__isnull', False)), fields=['order_id'], name='loyalty_event_order_idx')],
+            },
+        ),
+        migrations.RunPython(fill_loyalty, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:33
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0020_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название')),
+                ('unit', models.CharField(choices=[('pcs', 'шт'), ('g', 'г'), ('ml', 'мл')], default='g', max_length=5, verbose_name='Единица')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент',
+                'verbose_name_plural': 'Ингредиенты',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='bom',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Развёрнутый состав'),
+        ),
+        migrations.CreateModel(
+            name='ProductComponent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_in', to='nemo_park.product', verbose_name='Входит товар')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='components', to='nemo_park.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Состав комбо',
+                'verbose_name_plural': 'Составы комбо',
+                'constraints': [models.UniqueConstraint(fields=('product', 'component'), name='product_component_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=3, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Расход')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='nemo_park.ingredient', verbose_name='Ингредиент')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe', to='nemo_park.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Строка рецепта',
+                'verbose_name_plural': 'Рецепты',
+                'constraints': [models.UniqueConstraint(fields=('product', 'ingredient'), name='product_ingredient_unique')],
+            },
+        ),
+    ]
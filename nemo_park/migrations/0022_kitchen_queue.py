@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+# Время готовки по умолчанию по категориям; комбо готовится из своего состава
+PREP_MINUTES = {'pizza': 12, 'burger': 8, 'snack': 5, 'drink': 1, 'dessert': 3, 'combo': 0}
+
+
+def fill_prep_minutes(apps, schema_editor):
+    Product = apps.get_model('nemo_park', 'Product')
+    for category, minutes in PREP_MINUTES.items():
+        Product.objects.filter(category=category).update(prep_minutes=minutes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0021_bill_of_materials'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='is_rush',
+            field=models.BooleanField(default=False, verbose_name='Срочный'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начат на кухне'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='prep_minutes',
+            field=models.PositiveSmallIntegerField(default=5, help_text='На 1 шт., без учёта состава комбо', verbose_name='Готовка, мин'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'preparing'])), fields=['created_at'], name='order_open_created_idx'),
+        ),
+        migrations.RunPython(fill_prep_minutes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """Слить строки итогов, размножившиеся из-за NULL в ключе, — до создания ограничений"""
+    PayrollLedger = apps.get_model('nemo_park', 'PayrollLedger')
+    rows = {}
+    for row in PayrollLedger.objects.order_by('id'):
+        key = (row.employee_id, row.period, row.status)
+        kept = rows.get(key)
+        if kept is None:
+            rows[key] = row
+            continue
+        kept.count += row.count
+        kept.gross_total += row.gross_total
+        kept.net_total += row.net_total
+        kept.save(update_fields=['count', 'gross_total', 'net_total'])
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0022_kitchen_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payrollledger',
+            constraint=models.UniqueConstraint(condition=models.Q(('employee__isnull', True), ('period__isnull', True)), fields=('status',), name='payroll_ledger_unique_total'),
+        ),
+        migrations.AddConstraint(
+            model_name='payrollledger',
+            constraint=models.UniqueConstraint(condition=models.Q(('period__isnull', True)), fields=('employee', 'status'), name='payroll_ledger_unique_employee'),
+        ),
+        migrations.AddConstraint(
+            model_name='payrollledger',
+            constraint=models.UniqueConstraint(condition=models.Q(('employee__isnull', True)), fields=('period', 'status'), name='payroll_ledger_unique_period'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """Слить часы без кассира, размножившиеся из-за NULL в ключе, — до создания ограничения"""
+    SalesHour = apps.get_model('nemo_park', 'SalesHour')
+    rows = {}
+    for row in SalesHour.objects.filter(cashier__isnull=True).order_by('id'):
+        key = (row.day, row.hour, row.channel)
+        kept = rows.get(key)
+        if kept is None:
+            rows[key] = row
+            continue
+        kept.count += row.count
+        kept.revenue += row.revenue
+        kept.save(update_fields=['count', 'revenue'])
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0023_payroll_ledger_null_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='saleshour',
+            constraint=models.UniqueConstraint(condition=models.Q(('cashier__isnull', True)), fields=('day', 'hour', 'channel'), name='sales_hour_unique_no_cashier'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """Слить итоги без кассира, размножившиеся из-за NULL в ключе, — до создания ограничения"""
+    ArchiveRollup = apps.get_model('nemo_park', 'ArchiveRollup')
+    rows = {}
+    for row in ArchiveRollup.objects.filter(cashier__isnull=True).order_by('id'):
+        key = (row.day, row.kind)
+        kept = rows.get(key)
+        if kept is None:
+            rows[key] = row
+            continue
+        kept.count += row.count
+        kept.revenue += row.revenue
+        kept.save(update_fields=['count', 'revenue'])
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0024_sales_hour_null_cashier'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='archiverollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('cashier__isnull', True)), fields=('day', 'kind'), name='archive_rollup_unique_no_cashier'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:47
+
+from django.db import migrations, models
+
+
+def close_duplicates(apps, schema_editor):
+    """Оставить открытой только последнюю смену сотрудника, лишние закрыть без начислений"""
+    WorkShift = apps.get_model('nemo_park', 'WorkShift')
+    seen = set()
+    for shift in WorkShift.objects.filter(ended_at__isnull=True).order_by('-started_at', '-id'):
+        if shift.employee_id not in seen:
+            seen.add(shift.employee_id)
+            continue
+        shift.ended_at = shift.started_at
+        shift.break_minutes = 0
+        shift.worked_minutes = 0
+        shift.save(update_fields=['ended_at', 'break_minutes', 'worked_minutes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0025_archive_rollup_null_cashier'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='workshift',
+            constraint=models.UniqueConstraint(condition=models.Q(('ended_at__isnull', True)), fields=('employee',), name='work_shift_one_open'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0026_work_shift_one_open'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='payrollaccrual',
+            name='base_units',
+        ),
+        migrations.RemoveField(
+            model_name='payrollaccrual',
+            name='cum_base_units',
+        ),
+        migrations.RemoveField(
+            model_name='payrollaccrual',
+            name='cum_overtime_units',
+        ),
+        migrations.RemoveField(
+            model_name='payrollaccrual',
+            name='overtime_units',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0027_payroll_accrual_minutes_only'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loyaltyevent',
+            name='kind',
+            field=models.CharField(choices=[('ticket', 'Билет'), ('order', 'Заказ'), ('merge', 'Слияние')], max_length=10, verbose_name='За что'),
+        ),
+    ]
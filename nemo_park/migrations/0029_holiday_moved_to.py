@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nemo_park', '0028_loyalty_event_merge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='holiday',
+            name='moved_to',
+            field=models.DateField(blank=True, help_text='Для перенесённого рабочего дня: день, ставший выходным. Рабочим день станет только у графиков, работающих в этот день недели; без даты — у всех графиков', null=True, verbose_name='Выходной перенесён на'),
+        ),
+    ]
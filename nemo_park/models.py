@@ -1,8 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.utils import timezone 
 from decimal import Decimal
 
+from .schedule import WorkSchedule, compile_schedule
+
 class CustomUser(AbstractUser):
     ROLE_CHOICES = (
         ('user', 'Пользователь'),
@@ -69,6 +73,18 @@ class Employee(models.Model):
         verbose_name='Рабочие дни',
         help_text='1=Пн, 2=Вт, 3=Ср, 4=Чт, 5=Пт, 6=Сб, 7=Вс'
     )
+    work_days_mask = models.PositiveSmallIntegerField(
+        default=0b0011111,
+        editable=False,
+        verbose_name='Рабочие дни (битовая маска)',
+        help_text='Бит 0 = Пн ... бит 6 = Вс, пересчитывается при сохранении'
+    )
+    follows_calendar = models.BooleanField(
+        default=True,
+        verbose_name='По производственному календарю',
+        help_text='Праздники — выходные, перенесённые рабочие дни — рабочие. '
+                  'Если выключено, работа в праздник по графику оплачивается с повышением'
+    )
     
     salary = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Зарплата', default=0)
     hire_date = models.DateField(verbose_name='Дата приема', default=timezone.now) 
@@ -78,40 +94,45 @@ class Employee(models.Model):
     def save(self, *args, **kwargs):
         if self.hourly_rate == 0:
             self.hourly_rate = self.DEFAULT_HOURLY_RATES.get(self.position, Decimal('200'))
+        self.work_days_mask = self.schedule.mask
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'work_days' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'work_days_mask'}
         super().save(*args, **kwargs)
     
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
     
+    @property
+    def schedule(self) -> WorkSchedule:
+        """Скомпилированный график (общий кэш по значениям полей)"""
+        return compile_schedule(self.work_start, self.work_end, self.break_minutes, self.work_days)
+    
+    @property
+    def minutes_per_day(self):
+        """Рабочих минут в день"""
+        return self.schedule.minutes_per_day
+    
     @property
     def hours_per_day(self):
         """Рабочих часов в день"""
-        from datetime import datetime, timedelta
-        start = datetime.combine(datetime.today(), self.work_start)
-        end = datetime.combine(datetime.today(), self.work_end)
-        if end < start:
-            end += timedelta(days=1)
-        total_minutes = (end - start).seconds // 60 - self.break_minutes
-        return Decimal(total_minutes) / 60
+        return self.schedule.hours_per_day
     
     @property
     def work_days_list(self):
         """Список рабочих дней как числа"""
-        if not self.work_days:
-            return [1, 2, 3, 4, 5]
-        return [int(d.strip()) for d in self.work_days.split(',') if d.strip().isdigit()]
+        return list(self.schedule.work_days)
     
     @property
     def work_days_display(self):
         """Красивое отображение рабочих дней"""
-        days_names = {1: 'Пн', 2: 'Вт', 3: 'Ср', 4: 'Чт', 5: 'Пт', 6: 'Сб', 7: 'Вс'}
-        return ', '.join(days_names.get(d, '') for d in self.work_days_list)
+        return self.schedule.work_days_display
     
     @property
     def schedule_display(self):
         """Красивое отображение графика"""
-        return f"{self.work_start.strftime('%H:%M')} - {self.work_end.strftime('%H:%M')}"
+        return self.schedule.schedule_display
     
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.get_position_display()}"
@@ -141,6 +162,7 @@ class Payroll(models.Model):
     # Начисления
     base_salary = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Оклад/Базовая')
     overtime_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='За переработку')
+    holiday_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='За работу в праздники')
     bonus = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Премия')
     
     gross_salary = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Начислено')
@@ -155,6 +177,10 @@ class Payroll(models.Model):
     paid_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата выплаты')
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name='Создал')
     
+    # Как считался лист и нужно ли его пересчитать (ставка или график сотрудника изменились)
+    from_timesheet = models.BooleanField(default=False, verbose_name='По табелю')
+    is_stale = models.BooleanField(default=False, db_index=True, verbose_name='Требует пересчёта')
+    
     def __str__(self):
         return f"{self.employee.full_name} | {self.period_start} - {self.period_end} | {self.net_salary} ₽"
     
@@ -162,50 +188,118 @@ class Payroll(models.Model):
         verbose_name = 'Расчётный лист'
         verbose_name_plural = 'Расчётные листы'
         ordering = ['-period_end', 'employee']
-    """Расчётный лист зарплаты"""
-    STATUS_CHOICES = (
-        ('draft', 'Черновик'),
-        ('confirmed', 'Подтверждён'),
-        ('paid', 'Выплачено'),
-    )
+
+
+class WorkShift(models.Model):
+    """Смена сотрудника: отметка прихода и ухода"""
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name='Сотрудник', related_name='shifts')
+    started_at = models.DateTimeField(verbose_name='Начало смены')
+    ended_at = models.DateTimeField(null=True, blank=True, verbose_name='Конец смены')
+    break_minutes = models.PositiveIntegerField(default=0, verbose_name='Перерыв (мин)')
+    worked_minutes = models.PositiveIntegerField(default=0, verbose_name='Отработано (мин)')
     
-    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name='Сотрудник', related_name='payrolls')
+    @property
+    def is_open(self):
+        return self.ended_at is None
     
-    # Период
-    period_start = models.DateField(verbose_name='Начало периода')
-    period_end = models.DateField(verbose_name='Конец периода')
+    @property
+    def worked_hours(self):
+        return Decimal(self.worked_minutes) / 60
     
-    # Отработанное время (для почасовых)
-    total_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0, verbose_name='Всего часов')
-    overtime_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0, verbose_name='Переработка')
+    def __str__(self):
+        return f"{self.employee.full_name} | {self.started_at:%d.%m.%Y %H:%M}"
     
-    # Начисления
-    base_salary = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Оклад/Базовая')
-    overtime_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='За переработку')
-    bonus = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Премия')
+    class Meta:
+        verbose_name = 'Смена'
+        verbose_name_plural = 'Смены'
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['employee', '-started_at']),
+        ]
+        constraints = [
+            # Не больше одной открытой смены у сотрудника
+            models.UniqueConstraint(
+                fields=['employee'], condition=models.Q(ended_at__isnull=True), name='work_shift_one_open',
+            ),
+        ]
+
+
+class PayrollAccrual(models.Model):
+    """Отработанное сотрудником время за день с нарастающими итогами.
     
-    # Итого начислено
-    gross_salary = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Начислено')
+    Хранятся только минуты: оплата считается по ставке на момент расчёта
+    листа, а не закрытия смены. Итоги за период — разность нарастающих
+    итогов на границах периода.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name='Сотрудник', related_name='accruals')
+    day = models.DateField(verbose_name='День')
     
-    # Удержания
-    ndfl_tax = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='НДФЛ (13%)')
-    other_deductions = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Прочие удержания')
+    minutes = models.PositiveIntegerField(default=0, verbose_name='Отработано (мин)')
+    overtime_minutes = models.PositiveIntegerField(default=0, verbose_name='Переработка (мин)')
     
-    # На руки
-    net_salary = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='К выплате')
+    cum_days = models.PositiveIntegerField(default=0, verbose_name='Дней нарастающим итогом')
+    cum_minutes = models.BigIntegerField(default=0, verbose_name='Минут нарастающим итогом')
+    cum_overtime_minutes = models.BigIntegerField(default=0, verbose_name='Переработка нарастающим итогом')
     
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', verbose_name='Статус')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
-    paid_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата выплаты')
-    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name='Создал')
+    def __str__(self):
+        return f"{self.employee.full_name} | {self.day} | {self.minutes} мин"
+    
+    class Meta:
+        verbose_name = 'Начисление за день'
+        verbose_name_plural = 'Начисления за дни'
+        ordering = ['employee', 'day']
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'day'], name='payroll_accrual_unique_day'),
+        ]
+
+
+class PayrollLedger(models.Model):
+    """Итоги расчётных листов по статусам.
+    
+    Строки трёх видов: employee и period пустые — итог по всем листам;
+    задан только employee — итог сотрудника; задан только period (первое
+    число месяца начала периода) — итог месяца. Обновляется в одной
+    транзакции с созданием, сменой статуса и удалением листов.
+    """
+    employee = models.ForeignKey(
+        Employee, on_delete=models.CASCADE, null=True, blank=True,
+        verbose_name='Сотрудник', related_name='payroll_ledger'
+    )
+    period = models.DateField(null=True, blank=True, verbose_name='Месяц')
+    status = models.CharField(max_length=20, choices=Payroll.STATUS_CHOICES, verbose_name='Статус')
+    
+    count = models.PositiveIntegerField(default=0, verbose_name='Листов')
+    gross_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Начислено')
+    net_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='К выплате')
     
     def __str__(self):
-        return f"{self.employee.full_name} | {self.period_start} - {self.period_end} | {self.net_salary} ₽"
+        scope = self.employee.full_name if self.employee else (self.period or 'Все')
+        return f"{scope} | {self.get_status_display()} | {self.count} шт. | {self.net_total} ₽"
     
     class Meta:
-        verbose_name = 'Расчётный лист'
-        verbose_name_plural = 'Расчётные листы'
-        ordering = ['-period_end', 'employee']
+        verbose_name = 'Итог расчётных листов'
+        verbose_name_plural = 'Итоги расчётных листов'
+        # NULL в уникальном ключе не равен другому NULL, поэтому у каждого вида строк — своё
+        # частичное ограничение (nulls_distinct=False работает только на PostgreSQL 15+)
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'period', 'status'], name='payroll_ledger_unique'),
+            models.UniqueConstraint(
+                fields=['status'],
+                condition=models.Q(employee__isnull=True, period__isnull=True),
+                name='payroll_ledger_unique_total',
+            ),
+            models.UniqueConstraint(
+                fields=['employee', 'status'],
+                condition=models.Q(period__isnull=True),
+                name='payroll_ledger_unique_employee',
+            ),
+            models.UniqueConstraint(
+                fields=['period', 'status'],
+                condition=models.Q(employee__isnull=True),
+                name='payroll_ledger_unique_period',
+            ),
+        ]
+
 
 class Visitor(models.Model):
     first_name = models.CharField(max_length=100, verbose_name='Имя')
@@ -213,6 +307,15 @@ class Visitor(models.Model):
     email = models.EmailField(verbose_name='Email')
     phone = models.CharField(max_length=20, verbose_name='Телефон')
     registration_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата регистрации')
+    # Нормализованные телефон и email — ключи поиска дублей
+    phone_key = models.CharField(max_length=11, blank=True, db_index=True, editable=False, verbose_name='Ключ телефона')
+    email_key = models.CharField(max_length=254, blank=True, db_index=True, editable=False, verbose_name='Ключ email')
+    
+    def save(self, *args, **kwargs):
+        from .services.dedup_service import phone_key, email_key
+        self.phone_key = phone_key(self.phone)
+        self.email_key = email_key(self.email)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -251,7 +354,8 @@ class Ticket(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.price:
-            self.price = self.TICKET_PRICES.get(self.ticket_type, 0)
+            from .services.pricing_service import PricingEngine
+            self.price = PricingEngine.get_price(self.ticket_type, self.valid_date)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -262,6 +366,123 @@ class Ticket(models.Model):
         verbose_name_plural = 'Билеты'
 
 
+class Holiday(models.Model):
+    """Праздничные дни парка и производственный календарь"""
+    HOLIDAY = 'holiday'
+    WORKDAY = 'workday'
+    KIND_CHOICES = (
+        (HOLIDAY, 'Праздник (выходной)'),
+        (WORKDAY, 'Перенесённый рабочий день'),
+    )
+    
+    date = models.DateField(unique=True, verbose_name='Дата')
+    name = models.CharField(max_length=200, blank=True, verbose_name='Название')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=HOLIDAY, verbose_name='Тип дня')
+    pay_multiplier = models.DecimalField(
+        max_digits=4,
+        decimal_places=2,
+        default=Decimal('2'),
+        verbose_name='Коэффициент оплаты',
+        help_text='Оплата работы в этот праздник (x2 по ТК РФ)'
+    )
+    moved_to = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='Выходной перенесён на',
+        help_text='Для перенесённого рабочего дня: день, ставший выходным. Рабочим день станет только '
+                  'у графиков, работающих в этот день недели; без даты — у всех графиков'
+    )
+    
+    def clean(self):
+        if self.moved_to and self.kind != self.WORKDAY:
+            raise ValidationError({'moved_to': 'Дата переноса указывается только для перенесённого рабочего дня'})
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.invalidate_caches()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.invalidate_caches()
+        return result
+    
+    @staticmethod
+    def invalidate_caches():
+        """Сбросить кэши цен, календаря и моделирования ФОТ (в т.ч. после bulk-импорта)"""
+        from .services.pricing_service import PricingEngine
+        from .services.calendar_service import ProductionCalendar
+        from .services.simulation_service import PayrollSimulator
+        PricingEngine.invalidate()
+        ProductionCalendar.invalidate()
+        PayrollSimulator.invalidate()
+    
+    def __str__(self):
+        return f"{self.date} {self.name}"
+    
+    class Meta:
+        verbose_name = 'Праздник'
+        verbose_name_plural = 'Праздники'
+        ordering = ['date']
+
+
+class PriceRule(models.Model):
+    """Правило динамического ценообразования билетов.
+    
+    Цена = базовая цена из Ticket.TICKET_PRICES, к которой по порядку
+    priority применяются все подходящие правила: price * multiplier + surcharge.
+    """
+    name = models.CharField(max_length=200, verbose_name='Название')
+    ticket_type = models.CharField(
+        max_length=10,
+        choices=Ticket.TICKET_TYPES,
+        blank=True,
+        verbose_name='Тип билета',
+        help_text='Пусто = все типы'
+    )
+    weekdays = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name='Дни недели',
+        help_text='1=Пн ... 7=Вс, пусто = все дни'
+    )
+    date_from = models.DateField(null=True, blank=True, verbose_name='Действует с')
+    date_to = models.DateField(null=True, blank=True, verbose_name='Действует по')
+    holidays_only = models.BooleanField(default=False, verbose_name='Только праздники')
+    min_occupancy = models.PositiveIntegerField(
+        default=0,
+        verbose_name='От проданных билетов',
+        help_text='Правило включается, когда на дату продано не меньше билетов'
+    )
+    multiplier = models.DecimalField(max_digits=5, decimal_places=2, default=1, verbose_name='Множитель')
+    surcharge = models.DecimalField(max_digits=8, decimal_places=2, default=0, verbose_name='Надбавка ₽')
+    priority = models.IntegerField(default=0, verbose_name='Порядок применения')
+    is_active = models.BooleanField(default=True, verbose_name='Активно')
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .services.pricing_service import PricingEngine
+        PricingEngine.invalidate()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from .services.pricing_service import PricingEngine
+        PricingEngine.invalidate()
+        return result
+    
+    @property
+    def weekdays_list(self):
+        """Список дней недели как числа"""
+        return [int(d.strip()) for d in self.weekdays.split(',') if d.strip().isdigit()]
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        verbose_name = 'Правило цены'
+        verbose_name_plural = 'Правила цен'
+        ordering = ['priority', 'id']
+
+
 class Attraction(models.Model):
     """Аттракционы и зоны парка Немо"""
     ZONE_CHOICES = (
@@ -303,6 +524,12 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Цена')
     image_emoji = models.CharField(max_length=10, default='🍽️', verbose_name='Иконка')
     is_available = models.BooleanField(default=True, verbose_name='В наличии')
+    stock = models.PositiveIntegerField(null=True, blank=True, verbose_name='Остаток',
+                                        help_text='Пусто — остаток не учитывается')
+    # Развёрнутый состав (все вложенные товары и ингредиенты на 1 шт.) — пересобирается BillOfMaterials
+    bom = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Развёрнутый состав')
+    prep_minutes = models.PositiveSmallIntegerField(default=5, verbose_name='Готовка, мин',
+                                                    help_text='На 1 шт., без учёта состава комбо')
     is_popular = models.BooleanField(default=False, verbose_name='Популярное')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Добавлено')
     
@@ -315,6 +542,69 @@ class Product(models.Model):
         ordering = ['category', 'name']
 
 
+class Ingredient(models.Model):
+    """Ингредиенты (сырьё кухни)"""
+    UNIT_CHOICES = (
+        ('pcs', 'шт'),
+        ('g', 'г'),
+        ('ml', 'мл'),
+    )
+    
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название')
+    unit = models.CharField(max_length=5, choices=UNIT_CHOICES, default='g', verbose_name='Единица')
+    
+    def __str__(self):
+        return f"{self.name} ({self.get_unit_display()})"
+    
+    class Meta:
+        verbose_name = 'Ингредиент'
+        verbose_name_plural = 'Ингредиенты'
+        ordering = ['name']
+
+
+class ProductComponent(models.Model):
+    """Состав комбо: товар входит в другой товар"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='components', verbose_name='Товар')
+    component = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='used_in', verbose_name='Входит товар')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    
+    def __str__(self):
+        return f"{self.product_id} ← {self.component_id} ×{self.quantity}"
+    
+    def clean(self):
+        # Развёрнутый состав готов заранее: цикл виден без обхода дерева
+        if self.product_id and self.component_id:
+            if self.product_id == self.component_id:
+                raise ValidationError('Товар не может входить сам в себя')
+            if self.product_id in dict(self.component.bom.get('products', [])):
+                raise ValidationError(f'«{self.component.name}» уже содержит этот товар')
+    
+    class Meta:
+        verbose_name = 'Состав комбо'
+        verbose_name_plural = 'Составы комбо'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'component'], name='product_component_unique'),
+        ]
+
+
+class ProductIngredient(models.Model):
+    """Рецепт: расход ингредиента на 1 шт. товара"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recipe', verbose_name='Товар')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, verbose_name='Ингредиент')
+    amount = models.DecimalField(max_digits=10, decimal_places=3, validators=[MinValueValidator(0)],
+                                 verbose_name='Расход')
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.ingredient_id} {self.amount}"
+    
+    class Meta:
+        verbose_name = 'Строка рецепта'
+        verbose_name_plural = 'Рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'ingredient'], name='product_ingredient_unique'),
+        ]
+
+
 class Order(models.Model):
     """Заказы еды"""
     STATUS_CHOICES = (
@@ -332,6 +622,8 @@ class Order(models.Model):
     cashier = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='Кассир')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата заказа')
     notes = models.TextField(blank=True, verbose_name='Примечания')
+    is_rush = models.BooleanField(default=False, verbose_name='Срочный')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начат на кухне')
     
     def __str__(self):
         return f"Заказ #{self.id} - {self.total_price} ₽"
@@ -340,6 +632,20 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # Очередь необработанных заказов — малая доля таблицы
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status='pending'),
+                name='order_pending_created_idx',
+            ),
+            # Открытые заказы для очереди кухни
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status__in=['pending', 'preparing']),
+                name='order_open_created_idx',
+            ),
+        ]
 
 
 class OrderItem(models.Model):
@@ -357,4 +663,309 @@ class OrderItem(models.Model):
     
     class Meta:
         verbose_name = 'Позиция заказа'
-        verbose_name_plural = 'Позиции заказа'
\ No newline at end of file
+        verbose_name_plural = 'Позиции заказа'
+
+# ==================== АРХИВ ====================
+
+class ArchivedTicket(models.Model):
+    """Билет, перенесённый в архив (id сохраняется)"""
+    id = models.BigIntegerField(primary_key=True)
+    visitor = models.ForeignKey(Visitor, on_delete=models.SET_NULL, null=True, verbose_name='Посетитель')
+    ticket_type = models.CharField(max_length=10, choices=Ticket.TICKET_TYPES, verbose_name='Тип билета')
+    price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Цена')
+    purchase_date = models.DateTimeField(verbose_name='Дата покупки')
+    valid_date = models.DateField(verbose_name='Действителен до')
+    cashier = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name='Кассир')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')
+    
+    def __str__(self):
+        return f"Архив: {self.visitor} - {self.get_ticket_type_display()}"
+    
+    class Meta:
+        verbose_name = 'Архивный билет'
+        verbose_name_plural = 'Архив билетов'
+        ordering = ['-purchase_date']
+
+
+class ArchivedOrder(models.Model):
+    """Заказ, перенесённый в архив (id сохраняется)"""
+    id = models.BigIntegerField(primary_key=True)
+    visitor = models.ForeignKey(Visitor, on_delete=models.SET_NULL, null=True, verbose_name='Посетитель')
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Итого')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Статус')
+    cashier = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name='Кассир')
+    created_at = models.DateTimeField(verbose_name='Дата заказа')
+    notes = models.TextField(blank=True, verbose_name='Примечания')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')
+    
+    def __str__(self):
+        return f"Архив: заказ #{self.id} - {self.total_price} ₽"
+    
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ['-created_at']
+
+
+class ArchivedOrderItem(models.Model):
+    """Позиция архивного заказа"""
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items', verbose_name='Заказ')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, verbose_name='Товар')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Цена')
+    
+    def get_total(self):
+        return self.price * self.quantity
+    
+    class Meta:
+        verbose_name = 'Позиция архивного заказа'
+        verbose_name_plural = 'Позиции архивных заказов'
+
+
+class ArchiveRollup(models.Model):
+    """Итоги продаж, ушедших в архив: день × вид продажи × кассир"""
+    KIND_CHOICES = (
+        ('ticket', 'Билеты'),
+        ('order', 'Заказы'),
+    )
+    
+    day = models.DateField(verbose_name='День')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name='Вид')
+    cashier = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name='Кассир')
+    count = models.PositiveIntegerField(default=0, verbose_name='Количество')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    
+    def __str__(self):
+        return f"{self.day} {self.get_kind_display()}: {self.count} / {self.revenue} ₽"
+    
+    class Meta:
+        verbose_name = 'Итог архива'
+        verbose_name_plural = 'Итоги архива'
+        ordering = ['-day']
+        # Итоги без кассира (NULL) — отдельным частичным ограничением: NULL не равен NULL
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'kind', 'cashier'], name='archive_rollup_unique'),
+            models.UniqueConstraint(
+                fields=['day', 'kind'],
+                condition=models.Q(cashier__isnull=True),
+                name='archive_rollup_unique_no_cashier',
+            ),
+        ]
+
+
+# ==================== АНАЛИТИКА ====================
+
+class ProductSalesRollup(models.Model):
+    """Продажи товара за час: день × час × товар (отменённые заказы не учитываются)"""
+    day = models.DateField(verbose_name='День')
+    hour = models.PositiveSmallIntegerField(verbose_name='Час')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Товар')
+    quantity = models.IntegerField(default=0, verbose_name='Количество')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    
+    def __str__(self):
+        return f"{self.day} {self.hour}:00 {self.product_id}: {self.quantity} / {self.revenue} ₽"
+    
+    class Meta:
+        verbose_name = 'Продажи товара за час'
+        verbose_name_plural = 'Продажи товаров по часам'
+        ordering = ['-day', '-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'hour', 'product'], name='product_sales_rollup_unique'),
+        ]
+
+
+class SalesHour(models.Model):
+    """Продажи за час: день × час × канал (билеты / заказы) × кассир"""
+    CHANNEL_CHOICES = (
+        ('ticket', 'Билеты'),
+        ('order', 'Заказы'),
+    )
+    
+    day = models.DateField(verbose_name='День')
+    hour = models.PositiveSmallIntegerField(verbose_name='Час')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, verbose_name='Канал')
+    cashier = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name='Кассир')
+    count = models.IntegerField(default=0, verbose_name='Продаж')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    
+    def __str__(self):
+        return f"{self.day} {self.hour}:00 {self.get_channel_display()}: {self.count} / {self.revenue} ₽"
+    
+    class Meta:
+        verbose_name = 'Продажи за час'
+        verbose_name_plural = 'Продажи по часам'
+        ordering = ['-day', '-hour']
+        # Продажи без кассира (NULL) — отдельным частичным ограничением: NULL не равен NULL
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'hour', 'channel', 'cashier'], name='sales_hour_unique'),
+            models.UniqueConstraint(
+                fields=['day', 'hour', 'channel'],
+                condition=models.Q(cashier__isnull=True),
+                name='sales_hour_unique_no_cashier',
+            ),
+        ]
+
+
+class DemandForecast(models.Model):
+    """Прогноз продаж на день недели и час (пересчитывается по расписанию)"""
+    weekday = models.PositiveSmallIntegerField(verbose_name='День недели')  # 1 = Пн
+    hour = models.PositiveSmallIntegerField(verbose_name='Час')
+    channel = models.CharField(max_length=10, choices=SalesHour.CHANNEL_CHOICES, verbose_name='Канал')
+    expected = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Ожидается продаж')
+    fitted_on = models.DateField(verbose_name='Рассчитан по')
+    
+    def __str__(self):
+        return f"{self.weekday} {self.hour}:00 {self.get_channel_display()}: {self.expected}"
+    
+    class Meta:
+        verbose_name = 'Прогноз продаж'
+        verbose_name_plural = 'Прогноз продаж'
+        ordering = ['weekday', 'hour', 'channel']
+        constraints = [
+            models.UniqueConstraint(fields=['weekday', 'hour', 'channel'], name='demand_forecast_unique'),
+        ]
+
+
+# ==================== ПРОФИЛИ ПОСЕТИТЕЛЕЙ ====================
+
+class VisitorProfile(models.Model):
+    """Итоги посетителя: визиты и траты (обновляются вместе с билетами и заказами)"""
+    visitor = models.OneToOneField(
+        Visitor, on_delete=models.CASCADE, primary_key=True, related_name='profile', verbose_name='Посетитель'
+    )
+    visits = models.IntegerField(default=0, verbose_name='Визитов')  # дней с билетом
+    last_visit = models.DateField(null=True, blank=True, verbose_name='Последний визит')
+    tickets = models.IntegerField(default=0, verbose_name='Билетов')
+    orders = models.IntegerField(default=0, verbose_name='Заказов')
+    ticket_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='На билеты')
+    food_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='На еду')
+    total_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Всего')
+    
+    def __str__(self):
+        return f"{self.visitor}: {self.visits} визитов / {self.total_spend} ₽"
+    
+    class Meta:
+        verbose_name = 'Профиль посетителя'
+        verbose_name_plural = 'Профили посетителей'
+        ordering = ['-total_spend']
+        indexes = [
+            # Сегменты: лучшие по тратам, постоянные, давно не приходившие
+            models.Index(fields=['-total_spend'], name='visitor_profile_spend_idx'),
+            models.Index(fields=['-visits', '-total_spend'], name='visitor_profile_visits_idx'),
+            models.Index(fields=['last_visit'], name='visitor_profile_last_idx'),
+        ]
+
+
+class VisitorProduct(models.Model):
+    """Сколько товара купил посетитель (для любимых товаров)"""
+    visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, verbose_name='Посетитель')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Товар')
+    quantity = models.IntegerField(default=0, verbose_name='Количество')
+    
+    def __str__(self):
+        return f"{self.visitor} — {self.product}: {self.quantity}"
+    
+    class Meta:
+        verbose_name = 'Товар посетителя'
+        verbose_name_plural = 'Товары посетителей'
+        constraints = [
+            models.UniqueConstraint(fields=['visitor', 'product'], name='visitor_product_unique'),
+        ]
+
+
+class VisitorDuplicate(models.Model):
+    """Вероятный дубль посетителя (находит команда find_duplicate_visitors)"""
+    REASON_CHOICES = (
+        ('phone', 'Телефон'),
+        ('email', 'Email'),
+        ('phone_email', 'Телефон и email'),
+        ('name', 'Имя и похожий телефон'),
+    )
+    
+    visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='+', verbose_name='Посетитель')
+    duplicate = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='+', verbose_name='Дубль')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name='Совпадение')
+    score = models.DecimalField(max_digits=4, decimal_places=3, verbose_name='Сходство имён')
+    found_at = models.DateTimeField(auto_now_add=True, verbose_name='Найден')
+    
+    def __str__(self):
+        return f"{self.visitor} ≈ {self.duplicate} ({self.get_reason_display()}, {self.score})"
+    
+    class Meta:
+        verbose_name = 'Дубль посетителя'
+        verbose_name_plural = 'Дубли посетителей'
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['visitor', 'duplicate'], name='visitor_duplicate_unique'),
+        ]
+
+
+# ==================== БАЛЛЫ ЛОЯЛЬНОСТИ ====================
+
+class LoyaltyEvent(models.Model):
+    """Начисление или списание баллов (журнал только дописывается)"""
+    KIND_CHOICES = (
+        ('ticket', 'Билет'),
+        ('order', 'Заказ'),
+        ('merge', 'Слияние'),  # баллы за покупку переходят от дубля к посетителю
+    )
+    
+    id = models.BigAutoField(primary_key=True)
+    visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, db_index=False, verbose_name='Посетитель')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name='За что')
+    points = models.IntegerField(verbose_name='Баллы')  # меньше нуля — отмена или удаление покупки
+    # Без внешних ключей: билеты и заказы удаляются и уходят в архив, а журнал остаётся
+    ticket_id = models.BigIntegerField(null=True, blank=True, verbose_name='Билет')
+    order_id = models.BigIntegerField(null=True, blank=True, verbose_name='Заказ')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Когда')
+    
+    def __str__(self):
+        return f"{self.visitor_id}: {self.points:+d} ({self.get_kind_display()})"
+    
+    class Meta:
+        verbose_name = 'Событие баллов'
+        verbose_name_plural = 'Журнал баллов'
+        ordering = ['-id']
+        indexes = [
+            # Хвост журнала посетителя после снимка: visitor = ? AND id > ?
+            models.Index(fields=['visitor', 'id'], name='loyalty_event_visitor_idx'),
+            # Баллы за конкретную покупку (для отмены)
+            models.Index(fields=['ticket_id'], condition=models.Q(ticket_id__isnull=False), name='loyalty_event_ticket_idx'),
+            models.Index(fields=['order_id'], condition=models.Q(order_id__isnull=False), name='loyalty_event_order_idx'),
+        ]
+
+
+class LoyaltyBalance(models.Model):
+    """Снимок баланса: сумма событий посетителя до compacted_to включительно"""
+    visitor = models.OneToOneField(
+        Visitor, on_delete=models.CASCADE, primary_key=True, related_name='loyalty', verbose_name='Посетитель'
+    )
+    points = models.IntegerField(default=0, verbose_name='Баллов')
+    earned = models.IntegerField(default=0, verbose_name='Начислено всего')
+    compacted_to = models.BigIntegerField(default=0, verbose_name='По событие')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлён')
+    
+    def __str__(self):
+        return f"{self.visitor}: {self.points} баллов"
+    
+    class Meta:
+        verbose_name = 'Баланс баллов'
+        verbose_name_plural = 'Балансы баллов'
+
+
+class LoyaltyCompaction(models.Model):
+    """Свёртка журнала баллов в снимки (последняя строка — текущая граница)"""
+    compacted_to = models.BigIntegerField(db_index=True, verbose_name='По событие')
+    events = models.PositiveIntegerField(default=0, verbose_name='Событий')
+    visitors = models.PositiveIntegerField(default=0, verbose_name='Посетителей')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Когда')
+    
+    def __str__(self):
+        return f"{self.created_at:%d.%m.%Y %H:%M}: до #{self.compacted_to}, событий {self.events}"
+    
+    class Meta:
+        verbose_name = 'Свёртка баллов'
+        verbose_name_plural = 'Свёртки баллов'
+        ordering = ['-compacted_to']
@@ -0,0 +1,101 @@
+"""Скомпилированный график работы сотрудника.
+
+Строка work_days ("1,2,3,4,5") и время начала/конца разбираются один раз
+в неизменяемый WorkSchedule. Одинаковые графики у разных сотрудников
+делят один объект из кэша.
+"""
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+DAY_NAMES = {1: 'Пн', 2: 'Вт', 3: 'Ср', 4: 'Чт', 5: 'Пт', 6: 'Сб', 7: 'Вс'}
+DEFAULT_WORK_DAYS = (1, 2, 3, 4, 5)
+ALL_DAYS_MASK = 0b1111111
+
+# Единица в каждом 7-м бите: умножение 7-битной недели на неё повторяет неделю на весь год
+_WEEKLY_REPEAT = sum(1 << (7 * week) for week in range(53))
+
+
+class WorkSchedule(namedtuple('WorkSchedule', [
+    'mask', 'work_days', 'minutes_per_day', 'hours_per_day', 'work_days_display', 'schedule_display',
+])):
+    """График: битовая маска дней (бит 0 = Пн), минуты и часы в день, подписи"""
+
+    __slots__ = ()
+
+    def works_on(self, day: date) -> bool:
+        return bool(self.mask >> (day.isoweekday() - 1) & 1)
+
+    def count_work_days(self, start: date, end: date) -> int:
+        """Рабочих дней в периоде без перебора каждого дня"""
+        if end < start:
+            return 0
+        days = (end - start).days + 1
+        full_weeks, rest = divmod(days, 7)
+        count = full_weeks * bin(self.mask).count('1')
+        weekday = start.isoweekday() - 1
+        for offset in range(rest):
+            count += self.mask >> ((weekday + offset) % 7) & 1
+        return count
+
+    def year_bits(self, year: int) -> int:
+        """Дни года по графику битами (см. year_bits)"""
+        return year_bits(self.mask, year)
+
+
+def days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+
+@lru_cache(maxsize=1024)
+def year_bits(mask: int, year: int) -> int:
+    """Дни года по недельной маске: бит i = i-й день года (бит 0 = 1 января)"""
+    jan1 = date(year, 1, 1).weekday()
+    # Поворачиваем неделю так, чтобы бит 0 пришёлся на день недели 1 января
+    week = ((mask >> jan1) | (mask << (7 - jan1))) & ALL_DAYS_MASK
+    return (week * _WEEKLY_REPEAT) & ((1 << days_in_year(year)) - 1)
+
+
+def parse_work_days(work_days: str) -> tuple:
+    """'1,2,3' -> (1, 2, 3); пустая строка -> Пн-Пт"""
+    if not work_days:
+        return DEFAULT_WORK_DAYS
+    return tuple(int(d.strip()) for d in work_days.split(',') if d.strip().isdigit())
+
+
+def days_to_mask(days) -> int:
+    mask = 0
+    for day in days:
+        if 1 <= day <= 7:
+            mask |= 1 << (day - 1)
+    return mask
+
+
+def _as_time(value) -> time:
+    # До сохранения в поле может лежать строка из default='09:00'
+    if isinstance(value, str):
+        return time.fromisoformat(value)
+    return value
+
+
+@lru_cache(maxsize=1024)
+def compile_schedule(work_start, work_end, break_minutes: int, work_days: str) -> WorkSchedule:
+    work_start = _as_time(work_start)
+    work_end = _as_time(work_end)
+
+    start = datetime.combine(date.min, work_start)
+    end = datetime.combine(date.min, work_end)
+    if end < start:
+        end += timedelta(days=1)
+    minutes_per_day = (end - start).seconds // 60 - break_minutes
+
+    days = parse_work_days(work_days)
+    return WorkSchedule(
+        mask=days_to_mask(days),
+        work_days=days,
+        minutes_per_day=minutes_per_day,
+        hours_per_day=Decimal(minutes_per_day) / 60,
+        work_days_display=', '.join(DAY_NAMES.get(d, '') for d in days),
+        schedule_display=f"{work_start.strftime('%H:%M')} - {work_end.strftime('%H:%M')}",
+    )
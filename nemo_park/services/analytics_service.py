@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from ..models import SalesHour
+
+
+DayBucket = namedtuple('DayBucket', ['day', 'tickets', 'ticket_revenue', 'orders', 'order_revenue'])
+
+PeriodSummary = namedtuple('PeriodSummary', [
+    'start', 'end', 'days', 'tickets', 'ticket_revenue', 'orders', 'order_revenue', 'revenue',
+])
+
+DayComparison = namedtuple('DayComparison', ['day', 'current', 'previous'])
+
+Comparison = namedtuple('Comparison', ['current', 'previous', 'changes', 'rows'])
+
+COMPARE_CHOICES = (
+    ('', 'Без сравнения'),
+    ('previous', 'С предыдущим периодом'),
+    ('year', 'С прошлым годом'),
+)
+
+SUMMARY_FIELDS = ('tickets', 'ticket_revenue', 'orders', 'order_revenue', 'revenue')
+
+
+def _year_back(day: date) -> date:
+    """Та же дата год назад (29 февраля → 28 февраля)"""
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+def _change(current, previous):
+    """Изменение в процентах; None, если сравнивать не с чем"""
+    if not previous:
+        return None
+    return (Decimal(current - previous) * 100 / Decimal(previous)).quantize(Decimal('0.1'))
+
+
+class SalesAnalytics:
+    """Продажи билетов и заказов за произвольный период по дням.
+
+    Период собирается из дневных корзин (DayBucket), которые считаются из
+    счётчиков SalesHour и кэшируются в памяти процесса по кассиру и дню.
+    Запрос нового периода досчитывает только отсутствующие в кэше дни —
+    по одному агрегату на каждый непрерывный отрезок пропусков, поэтому
+    расширение периода и сравнение с соседним периодом почти не нагружают
+    базу. Сегодняшний день не кэшируется; прошлые дни сбрасываются при
+    отмене или удалении их продаж в этом процессе, а весь кэш — раз в
+    BUCKET_TTL секунд и при переполнении MAX_CACHED_BUCKETS корзин.
+    """
+
+    BUCKET_TTL = 600
+    MAX_CACHED_BUCKETS = 20000
+
+    # {id кассира или None: {день: DayBucket}}
+    _buckets = {}
+    _size = 0
+    _loaded_at = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def invalidate(cls, day: date = None):
+        """Сбросить корзины дня (или все)"""
+        with cls._lock:
+            if day is None:
+                cls._buckets.clear()
+                cls._size = 0
+                cls._loaded_at = None
+            else:
+                for buckets in cls._buckets.values():
+                    if buckets.pop(day, None) is not None:
+                        cls._size -= 1
+
+    @classmethod
+    def _expire(cls):
+        """Сбросить устаревший кэш: продажи могли отменить в другом процессе (вызывать под _lock)"""
+        if cls._loaded_at is None or time.monotonic() - cls._loaded_at > cls.BUCKET_TTL:
+            cls._buckets.clear()
+            cls._size = 0
+            cls._loaded_at = time.monotonic()
+
+    # ==================== ДНЕВНЫЕ КОРЗИНЫ ====================
+
+    @staticmethod
+    def _missing_spans(missing: list) -> list:
+        """Отсортированные дни → непрерывные отрезки [(начало, конец), ...]"""
+        spans = []
+        for day in missing:
+            if spans and spans[-1][1] + timedelta(days=1) == day:
+                spans[-1][1] = day
+            else:
+                spans.append([day, day])
+        return spans
+
+    @staticmethod
+    def _load(spans: list, cashier_id) -> dict:
+        """Корзины за отрезки одним агрегатом: {день: DayBucket} (дни без продаж — нулевые)"""
+        totals = {}
+        for start, end in spans:
+            day = start
+            while day <= end:
+                totals[day] = [0, Decimal('0'), 0, Decimal('0')]
+                day += timedelta(days=1)
+
+        period = Q()
+        for start, end in spans:
+            period |= Q(day__gte=start, day__lte=end)
+        rows = SalesHour.objects.filter(period)
+        if cashier_id is not None:
+            rows = rows.filter(cashier_id=cashier_id)
+        rows = rows.values('day', 'channel').annotate(count=Sum('count'), revenue=Sum('revenue')).order_by()
+
+        for row in rows:
+            offset = 0 if row['channel'] == 'ticket' else 2
+            totals[row['day']][offset] += row['count']
+            totals[row['day']][offset + 1] += row['revenue']
+        return {day: DayBucket(day, *values) for day, values in totals.items()}
+
+    @classmethod
+    def days(cls, start: date, end: date, cashier_id=None) -> list:
+        """Продажи по дням за период [DayBucket, ...] — каждый день, включая дни без продаж"""
+        today = timezone.localdate()
+        with cls._lock:
+            cls._expire()
+            cached = cls._buckets.get(cashier_id, {})
+            result, missing = {}, []
+            day = start
+            while day <= end:
+                bucket = cached.get(day)
+                if bucket is not None:
+                    result[day] = bucket
+                else:
+                    missing.append(day)
+                day += timedelta(days=1)
+
+        if missing:
+            loaded = cls._load(cls._missing_spans(missing), cashier_id)
+            result.update(loaded)
+            # Сегодня продажи ещё идут — такой день не кэшируем
+            past = {day: bucket for day, bucket in loaded.items() if day < today}
+            with cls._lock:
+                if cls._size + len(past) > cls.MAX_CACHED_BUCKETS:
+                    cls._buckets.clear()
+                    cls._size = 0
+                cached = cls._buckets.setdefault(cashier_id, {})
+                cls._size += len(past.keys() - cached.keys())
+                cached.update(past)
+
+        return [result[day] for day in sorted(result)]
+
+    # ==================== ПЕРИОДЫ ====================
+
+    @classmethod
+    def summary(cls, start: date, end: date, cashier_id=None, buckets: list = None) -> PeriodSummary:
+        """Итоги периода"""
+        if buckets is None:
+            buckets = cls.days(start, end, cashier_id)
+        tickets = sum(bucket.tickets for bucket in buckets)
+        ticket_revenue = sum((bucket.ticket_revenue for bucket in buckets), Decimal('0'))
+        orders = sum(bucket.orders for bucket in buckets)
+        order_revenue = sum((bucket.order_revenue for bucket in buckets), Decimal('0'))
+        return PeriodSummary(
+            start, end, len(buckets), tickets, ticket_revenue, orders, order_revenue,
+            ticket_revenue + order_revenue,
+        )
+
+    @staticmethod
+    def comparison_period(start: date, end: date, compare: str) -> tuple:
+        """Период для сравнения: предыдущий такой же длины или те же даты год назад"""
+        if compare == 'previous':
+            previous_end = start - timedelta(days=1)
+            return previous_end - (end - start), previous_end
+        if compare == 'year':
+            return _year_back(start), _year_back(end)
+        raise ValueError(f'Неизвестный режим сравнения: {compare}')
+
+    @classmethod
+    def compare(cls, start: date, end: date, compare: str = '', cashier_id=None) -> Comparison:
+        """Период и (если задан compare) период сравнения: итоги, изменения в % и дни попарно"""
+        current_days = cls.days(start, end, cashier_id)
+        current = cls.summary(start, end, buckets=current_days)
+        if not compare:
+            rows = [DayComparison(bucket.day, bucket, None) for bucket in current_days]
+            return Comparison(current, None, {}, rows)
+
+        previous_start, previous_end = cls.comparison_period(start, end, compare)
+        previous_days = cls.days(previous_start, previous_end, cashier_id)
+        previous = cls.summary(previous_start, previous_end, buckets=previous_days)
+        changes = {field: _change(getattr(current, field), getattr(previous, field)) for field in SUMMARY_FIELDS}
+
+        # Каждому дню — его день в периоде сравнения (29 февраля год назад → 28 февраля)
+        if compare == 'previous':
+            shift = end - start + timedelta(days=1)
+            previous_day = lambda day: day - shift
+        else:
+            previous_day = _year_back
+        previous_by_day = {bucket.day: bucket for bucket in previous_days}
+        rows = [
+            DayComparison(bucket.day, bucket, previous_by_day.get(previous_day(bucket.day)))
+            for bucket in current_days
+        ]
+        return Comparison(current, previous, changes, rows)
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from decimal import Decimal
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.db.models import BooleanField, Count, F, Sum, Value, prefetch_related_objects
+from django.utils import timezone
+
+from ..models import (Ticket, Order, OrderItem, ArchivedTicket, ArchivedOrder,
+                      ArchivedOrderItem, ArchiveRollup)
+
+
+TICKET_FIELDS = ('id', 'visitor_id', 'ticket_type', 'price', 'purchase_date', 'valid_date', 'cashier_id')
+ORDER_FIELDS = ('id', 'visitor_id', 'total_price', 'status', 'cashier_id', 'created_at', 'notes')
+
+
+class SalesArchive:
+    """Перенос старых билетов и заказов в архив.
+
+    Строки старше cutoff (по дате покупки) копируются в архивные таблицы,
+    их суммы складываются в ArchiveRollup, после чего строки удаляются из
+    рабочих таблиц. Каждая пачка переносится в своей транзакции.
+    """
+
+    def __init__(self, cutoff: date, batch_size: int = 1000):
+        self.cutoff = cutoff
+        self.cutoff_dt = timezone.make_aware(datetime.combine(cutoff, time.min))
+        self.batch_size = batch_size
+
+    def archive_tickets(self) -> int:
+        """Архивировать билеты, вернуть количество"""
+        moved = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Ticket.objects.filter(purchase_date__lt=self.cutoff_dt)
+                    .order_by('id').values(*TICKET_FIELDS)[:self.batch_size]
+                )
+                if not batch:
+                    return moved
+
+                ArchivedTicket.objects.bulk_create([ArchivedTicket(**row) for row in batch])
+
+                totals = defaultdict(lambda: [0, Decimal('0')])
+                for row in batch:
+                    key = (timezone.localtime(row['purchase_date']).date(), 'ticket', row['cashier_id'])
+                    totals[key][0] += 1
+                    totals[key][1] += row['price']
+                self._add_to_rollup(totals)
+
+                Ticket.objects.filter(id__in=[row['id'] for row in batch]).delete()
+                moved += len(batch)
+
+    def archive_orders(self) -> int:
+        """Архивировать заказы вместе с позициями, вернуть количество"""
+        moved = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Order.objects.filter(created_at__lt=self.cutoff_dt)
+                    .order_by('id').values(*ORDER_FIELDS)[:self.batch_size]
+                )
+                if not batch:
+                    return moved
+
+                order_ids = [row['id'] for row in batch]
+                items = OrderItem.objects.filter(order_id__in=order_ids).values(
+                    'id', 'order_id', 'product_id', 'quantity', 'price'
+                )
+
+                ArchivedOrder.objects.bulk_create([ArchivedOrder(**row) for row in batch])
+                ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**item) for item in items])
+
+                totals = defaultdict(lambda: [0, Decimal('0')])
+                for row in batch:
+                    key = (timezone.localtime(row['created_at']).date(), 'order', row['cashier_id'])
+                    totals[key][0] += 1
+                    totals[key][1] += row['total_price']
+                self._add_to_rollup(totals)
+
+                Order.objects.filter(id__in=order_ids).delete()
+                moved += len(batch)
+
+    @staticmethod
+    def _add_to_rollup(totals: dict):
+        for (day, kind, cashier_id), (count, revenue) in totals.items():
+            rollup, _ = ArchiveRollup.objects.get_or_create(day=day, kind=kind, cashier_id=cashier_id)
+            ArchiveRollup.objects.filter(pk=rollup.pk).update(
+                count=F('count') + count,
+                revenue=F('revenue') + revenue,
+            )
+
+
+# ==================== ЕДИНОЕ ЧТЕНИЕ ====================
+
+def sales_totals(cashier=None) -> dict:
+    """Количество и выручка билетов и заказов: рабочие таблицы + итоги архива"""
+    tickets = Ticket.objects.all()
+    orders = Order.objects.all()
+    rollups = ArchiveRollup.objects.all()
+    if cashier is not None:
+        tickets = tickets.filter(cashier=cashier)
+        orders = orders.filter(cashier=cashier)
+        rollups = rollups.filter(cashier=cashier)
+
+    hot_tickets = tickets.aggregate(count=Count('id'), revenue=Sum('price'))
+    hot_orders = orders.aggregate(count=Count('id'), revenue=Sum('total_price'))
+
+    archived = {
+        row['kind']: row
+        for row in rollups.values('kind').annotate(count=Sum('count'), revenue=Sum('revenue'))
+    }
+    archived_tickets = archived.get('ticket', {})
+    archived_orders = archived.get('order', {})
+
+    return {
+        'tickets_count': hot_tickets['count'] + (archived_tickets.get('count') or 0),
+        'tickets_revenue': (hot_tickets['revenue'] or 0) + (archived_tickets.get('revenue') or 0),
+        'orders_count': hot_orders['count'] + (archived_orders.get('count') or 0),
+        'orders_revenue': (hot_orders['revenue'] or 0) + (archived_orders.get('revenue') or 0),
+    }
+
+
+def all_tickets(**filters):
+    """Билеты из рабочей таблицы и архива одним запросом (values + UNION ALL)"""
+    hot = (Ticket.objects.filter(**filters).values(*TICKET_FIELDS)
+           .annotate(archived=Value(False, BooleanField())).order_by())
+    archived = (ArchivedTicket.objects.filter(**filters).values(*TICKET_FIELDS)
+                .annotate(archived=Value(True, BooleanField())).order_by())
+    return hot.union(archived, all=True)
+
+
+def all_orders(**filters):
+    """Заказы из рабочей таблицы и архива одним запросом (values + UNION ALL)"""
+    hot = (Order.objects.filter(**filters).values(*ORDER_FIELDS)
+           .annotate(items_count=Count('orderitem'), archived=Value(False, BooleanField())).order_by())
+    archived = (ArchivedOrder.objects.filter(**filters).values(*ORDER_FIELDS)
+                .annotate(items_count=Count('items'), archived=Value(True, BooleanField())).order_by())
+    return hot.union(archived, all=True)
+
+
+def as_instances(model, rows) -> list:
+    """Строки all_tickets/all_orders как несохранённые экземпляры model.
+
+    Посетитель и кассир подгружаются двумя запросами на всю выборку,
+    признак архива и прочие аннотации остаются атрибутами экземпляра.
+    """
+    field_names = {field.attname for field in model._meta.concrete_fields}
+    instances = []
+    for row in rows:
+        instance = model(**{key: value for key, value in row.items() if key in field_names})
+        for key, value in row.items():
+            if key not in field_names:
+                setattr(instance, key, value)
+        instances.append(instance)
+    prefetch_related_objects(instances, 'visitor', 'cashier')
+    return instances
@@ -0,0 +1,144 @@
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from ..models import Ingredient, Product, ProductComponent, ProductIngredient, ProductSalesRollup
+
+
+# Развёрнутый заказ: {id товара: количество} — сами товары и всё, что в них входит; {id ингредиента: расход}
+Explosion = namedtuple('Explosion', ['products', 'ingredients'])
+
+ProductUsage = namedtuple('ProductUsage', ['product_id', 'name', 'emoji', 'sold', 'used'])
+
+IngredientUsage = namedtuple('IngredientUsage', ['ingredient_id', 'name', 'unit', 'amount'])
+
+
+class BomCycleError(ValueError):
+    """Товар прямо или через другие комбо входит сам в себя"""
+
+
+class BillOfMaterials:
+    """Состав товаров: комбо из товаров, рецепты из ингредиентов.
+
+    Для каждого товара заранее разворачивается весь состав на 1 шт. —
+    вложенные товары и ингредиенты с перемноженными количествами — и
+    хранится в Product.bom. Состав меняется редко, поэтому при любом
+    изменении пересобирается всё меню за один проход (три запроса).
+    Списание остатков заказа и расход за период берут готовые векторы
+    одним запросом на все товары, без рекурсивного обхода.
+    """
+
+    # ==================== РАЗВОРАЧИВАНИЕ ====================
+
+    @staticmethod
+    def flatten(components: dict, recipes: dict) -> dict:
+        """{товар: [(вложенный товар, кол-во)]}, {товар: [(ингредиент, расход)]} → {товар: Explosion на 1 шт.}"""
+        flat, visiting = {}, set()
+
+        def expand(product_id):
+            if product_id in flat:
+                return flat[product_id]
+            if product_id in visiting:
+                raise BomCycleError(f'Товар #{product_id} входит сам в себя')
+            visiting.add(product_id)
+            products, ingredients = defaultdict(int), defaultdict(Decimal)
+            for ingredient_id, amount in recipes.get(product_id, ()):
+                ingredients[ingredient_id] += amount
+            for component_id, quantity in components.get(product_id, ()):
+                products[component_id] += quantity
+                nested = expand(component_id)
+                for nested_id, nested_quantity in nested.products.items():
+                    products[nested_id] += nested_quantity * quantity
+                for ingredient_id, amount in nested.ingredients.items():
+                    ingredients[ingredient_id] += amount * quantity
+            visiting.discard(product_id)
+            flat[product_id] = Explosion(dict(products), dict(ingredients))
+            return flat[product_id]
+
+        for product_id in components.keys() | recipes.keys():
+            expand(product_id)
+        return flat
+
+    @staticmethod
+    def _to_json(explosion: Explosion) -> dict:
+        if not explosion.products and not explosion.ingredients:
+            return {}
+        return {
+            'products': [[product_id, quantity] for product_id, quantity in sorted(explosion.products.items())],
+            'ingredients': [[ingredient_id, str(amount)] for ingredient_id, amount in sorted(explosion.ingredients.items())],
+        }
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Пересобрать развёрнутый состав всех товаров, вернуть число изменённых"""
+        components, recipes = defaultdict(list), defaultdict(list)
+        for product_id, component_id, quantity in ProductComponent.objects.values_list('product_id', 'component_id', 'quantity'):
+            components[product_id].append((component_id, quantity))
+        for product_id, ingredient_id, amount in ProductIngredient.objects.values_list('product_id', 'ingredient_id', 'amount'):
+            recipes[product_id].append((ingredient_id, amount))
+        flat = cls.flatten(components, recipes)
+
+        changed = []
+        for product in Product.objects.only('id', 'bom'):
+            bom = cls._to_json(flat.get(product.id, Explosion({}, {})))
+            if product.bom != bom:
+                product.bom = bom
+                changed.append(product)
+        Product.objects.bulk_update(changed, ['bom'], batch_size=500)
+        return len(changed)
+
+    # ==================== ЗАКАЗЫ ====================
+
+    @staticmethod
+    def explode(quantities: dict, boms: dict = None) -> Explosion:
+        """{товар: количество} → сами товары со всем составом и ингредиенты (один запрос;
+        без запросов, если составы {товар: Product.bom} уже загружены)"""
+        if boms is None:
+            boms = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'bom'))
+        products, ingredients = defaultdict(int), defaultdict(Decimal)
+        for product_id, quantity in quantities.items():
+            if product_id not in boms:
+                continue
+            bom = boms[product_id]
+            products[product_id] += quantity
+            for component_id, component_quantity in bom.get('products', ()):
+                products[component_id] += component_quantity * quantity
+            for ingredient_id, amount in bom.get('ingredients', ()):
+                ingredients[ingredient_id] += Decimal(amount) * quantity
+        return Explosion(dict(products), dict(ingredients))
+
+    @classmethod
+    def usage(cls, start: date, end: date) -> tuple:
+        """Расход за период по итогам продаж: ([ProductUsage, ...], [IngredientUsage, ...])
+
+        Товары — проданные сами и в составе комбо; отменённые заказы не
+        учитываются, архивные — учитываются (из ProductSalesRollup).
+        """
+        sold = dict(
+            ProductSalesRollup.objects.filter(day__gte=start, day__lte=end)
+            .values('product').annotate(total=Sum('quantity')).filter(total__gt=0)
+            .values_list('product', 'total')
+        )
+        explosion = cls.explode(sold)
+
+        products = Product.objects.in_bulk(explosion.products)
+        product_usage = sorted(
+            (
+                ProductUsage(product_id, products[product_id].name, products[product_id].image_emoji,
+                             sold.get(product_id, 0), quantity)
+                for product_id, quantity in explosion.products.items() if product_id in products
+            ),
+            key=lambda row: (-row.used, row.name),
+        )
+        ingredients = Ingredient.objects.in_bulk(explosion.ingredients)
+        ingredient_usage = sorted(
+            (
+                IngredientUsage(ingredient_id, ingredients[ingredient_id].name,
+                                ingredients[ingredient_id].get_unit_display(), amount)
+                for ingredient_id, amount in explosion.ingredients.items() if ingredient_id in ingredients
+            ),
+            key=lambda row: row.name,
+        )
+        return product_usage, ingredient_usage
@@ -0,0 +1,187 @@
+import time
+from collections import namedtuple
+from datetime import date
+
+from ..models import Holiday
+from ..schedule import ALL_DAYS_MASK, WorkSchedule, days_in_year, year_bits
+
+
+class CalendarYear(namedtuple('CalendarYear', [
+    'year', 'first_ordinal', 'length', 'holidays', 'workdays', 'holiday_pay', 'schedules',
+])):
+    """Год календаря битами: бит i — i-й день года (бит 0 = 1 января).
+
+    workdays — пары (недельная маска, перенесённые рабочие дни): день становится рабочим
+    только у графиков, работающих в один из дней недели маски (в день, куда перенесён выходной),
+    holiday_pay — пары (коэффициент в процентах, маска праздников с этим коэффициентом),
+    schedules — кэш масок рабочих дней графиков, уже пересечённых с календарём.
+    """
+
+    __slots__ = ()
+
+    def day_bit(self, day: date) -> int:
+        return 1 << (day.toordinal() - self.first_ordinal)
+
+    def transferred_workdays(self, mask: int) -> int:
+        """Перенесённые рабочие дни, которые касаются графика с недельной маской mask"""
+        bits = 0
+        for weekdays, days in self.workdays:
+            if mask & weekdays:
+                bits |= days
+        return bits
+
+    def schedule_bits(self, mask: int, follows_calendar: bool) -> int:
+        """Рабочие дни года по недельной маске графика"""
+        key = (mask, follows_calendar)
+        bits = self.schedules.get(key)
+        if bits is None:
+            bits = year_bits(mask, self.year)
+            if follows_calendar:
+                bits = (bits & ~self.holidays) | self.transferred_workdays(mask)
+            self.schedules[key] = bits
+        return bits
+
+    def count(self, bits: int, start_ordinal: int, end_ordinal: int) -> int:
+        """Число единичных бит в периоде (обрезается по границам года)"""
+        first = start_ordinal - self.first_ordinal
+        if first < 0:
+            first = 0
+        last = end_ordinal - self.first_ordinal
+        if last >= self.length:
+            last = self.length - 1
+        if last < first:
+            return 0
+        return (bits >> first & ((2 << (last - first)) - 1)).bit_count()
+
+    def period(self, start: date, end: date) -> int:
+        """Маска дней периода, обрезанного по границам года"""
+        first = max(start.toordinal() - self.first_ordinal, 0)
+        last = min(end.toordinal() - self.first_ordinal, self.length - 1)
+        if last < first:
+            return 0
+        return ((2 << (last - first)) - 1) << first
+
+
+class ProductionCalendar:
+    """Производственный календарь: праздники и перенесённые рабочие дни.
+
+    Каждый год компилируется в битовые маски и хранится в памяти процесса.
+    Маска графика пересекается с масками календаря один раз на год,
+    дальше рабочие дни за период — подсчёт единичных бит, без перебора дней.
+    Календарь импортируют отдельной командой (другой процесс), поэтому
+    скомпилированные годы живут не дольше YEARS_TTL секунд.
+    """
+
+    YEARS_TTL = 300
+
+    _years = {}
+    _loaded_at = None
+
+    # ==================== КЭШ ====================
+
+    @classmethod
+    def invalidate(cls):
+        """Сбросить кэш (после изменения праздников)"""
+        cls._years.clear()
+        cls._loaded_at = None
+
+    @classmethod
+    def _expire(cls):
+        if cls._loaded_at is None or time.monotonic() - cls._loaded_at > cls.YEARS_TTL:
+            cls._years.clear()
+            cls._loaded_at = time.monotonic()
+
+    @classmethod
+    def get_year(cls, year: int) -> CalendarYear:
+        """Скомпилированный год (из кэша или одним запросом)"""
+        cls._expire()
+        compiled = cls._years.get(year)
+        if compiled is None:
+            rows = Holiday.objects.filter(date__year=year).values_list('date', 'kind', 'pay_multiplier', 'moved_to')
+            compiled = cls._compile(year, rows)
+            cls._years[year] = compiled
+        return compiled
+
+    @staticmethod
+    def _compile(year: int, rows) -> CalendarYear:
+        first_ordinal = date(year, 1, 1).toordinal()
+        holidays = 0
+        workdays = {}
+        by_percent = {}
+        for day, kind, multiplier, moved_to in rows:
+            bit = 1 << (day.toordinal() - first_ordinal)
+            if kind == Holiday.WORKDAY:
+                # Рабочая суббота отрабатывает день, куда перенесён выходной: нужна тем, кто в него работает
+                weekdays = 1 << moved_to.weekday() if moved_to else ALL_DAYS_MASK
+                workdays[weekdays] = workdays.get(weekdays, 0) | bit
+            else:
+                holidays |= bit
+                percent = int(multiplier * 100)
+                by_percent[percent] = by_percent.get(percent, 0) | bit
+        return CalendarYear(
+            year, first_ordinal, days_in_year(year), holidays, tuple(sorted(workdays.items())),
+            tuple(sorted(by_percent.items())), {}
+        )
+
+    # ==================== ДНИ ====================
+
+    @classmethod
+    def is_holiday(cls, day: date) -> bool:
+        calendar = cls.get_year(day.year)
+        return bool(calendar.holidays & calendar.day_bit(day))
+
+    @classmethod
+    def holiday_percents(cls, start: date, end: date) -> dict:
+        """Праздники периода: {дата: коэффициент оплаты в процентах}"""
+        result = {}
+        for year in range(start.year, end.year + 1):
+            calendar = cls.get_year(year)
+            period = calendar.period(start, end)
+            for percent, bits in calendar.holiday_pay:
+                bits &= period
+                while bits:
+                    low = bits & -bits
+                    result[date.fromordinal(calendar.first_ordinal + low.bit_length() - 1)] = percent
+                    bits ^= low
+        return result
+
+    @classmethod
+    def count_work_days(cls, schedule: WorkSchedule, start: date, end: date, follows_calendar: bool = True) -> int:
+        """Рабочие дни по графику за период.
+
+        follows_calendar=True: праздники исключаются, перенесённые рабочие
+        дни добавляются. Иначе считается чистый график, а дни, выпавшие
+        на праздники, отдаёт holiday_work_days.
+        """
+        cls._expire()
+        start_ordinal = start.toordinal()
+        end_ordinal = end.toordinal()
+        total = 0
+        for year in range(start.year, end.year + 1):
+            calendar = cls._years.get(year) or cls.get_year(year)
+            bits = calendar.schedule_bits(schedule.mask, follows_calendar)
+            # То же, что calendar.count(), без вызова метода: это горячий путь массового расчёта
+            first = start_ordinal - calendar.first_ordinal
+            if first < 0:
+                first = 0
+            last = end_ordinal - calendar.first_ordinal
+            if last >= calendar.length:
+                last = calendar.length - 1
+            if last >= first:
+                total += (bits >> first & ((2 << (last - first)) - 1)).bit_count()
+        return total
+
+    @classmethod
+    def holiday_work_days(cls, schedule: WorkSchedule, start: date, end: date) -> tuple:
+        """Рабочие дни графика, выпавшие на праздники: пары (дней, коэффициент в процентах)"""
+        start_ordinal = start.toordinal()
+        end_ordinal = end.toordinal()
+        on_holidays = {}
+        for year in range(start.year, end.year + 1):
+            calendar = cls.get_year(year)
+            bits = calendar.schedule_bits(schedule.mask, False)
+            for percent, holiday_bits in calendar.holiday_pay:
+                days = calendar.count(bits & holiday_bits, start_ordinal, end_ordinal)
+                if days:
+                    on_holidays[percent] = on_holidays.get(percent, 0) + days
+        return tuple((days, percent) for percent, days in sorted(on_holidays.items()))
@@ -0,0 +1,234 @@
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Q
+
+from ..forms import phone_digits
+from ..models import Visitor, Ticket, Order, ArchivedTicket, ArchivedOrder, VisitorDuplicate
+from .loyalty_service import LoyaltyLedger
+from .parallel import fork_map
+from .visitor_service import VisitorProfiles
+
+
+# Псевдонимы почтовых доменов: один ящик — один ключ
+EMAIL_DOMAINS = {
+    'googlemail.com': 'gmail.com',
+    'ya.ru': 'yandex.ru',
+    'yandex.com': 'yandex.ru',
+    'yandex.by': 'yandex.ru',
+    'yandex.kz': 'yandex.ru',
+    'yandex.ua': 'yandex.ru',
+}
+
+# Порог сходства имён: при общем телефоне или email, при общих обоих, без общих контактов
+NAME_THRESHOLD = 0.8
+CONTACTS_THRESHOLD = 0.7
+NAME_ONLY_THRESHOLD = 0.9
+
+VisitorRow = namedtuple('VisitorRow', ['id', 'name', 'phone', 'email'])
+
+Match = namedtuple('Match', ['visitor_id', 'duplicate_id', 'reason', 'score'])
+
+MergeResult = namedtuple('MergeResult', ['tickets', 'orders', 'archived_tickets', 'archived_orders'])
+
+
+# ==================== НОРМАЛИЗАЦИЯ ====================
+
+def phone_key(phone) -> str:
+    """Телефон как 11 цифр (та же логика, что clean_phone в формах); '' — не распознан"""
+    return phone_digits(phone) or ''
+
+
+def email_key(email) -> str:
+    """Email в нижнем регистре без +метки, с единым доменом; точки в gmail не различаются"""
+    email = (email or '').strip().lower()
+    local, at, domain = email.rpartition('@')
+    if not at:
+        return email
+    domain = EMAIL_DOMAINS.get(domain, domain)
+    local = local.split('+', 1)[0]
+    if domain == 'gmail.com':
+        local = local.replace('.', '')
+    elif domain == 'yandex.ru':
+        # Яндекс не различает точку и дефис в логине
+        local = local.replace('.', '-')
+    return f'{local}@{domain}'
+
+
+def name_key(first_name, last_name) -> tuple:
+    """(фамилия, имя) в нижнем регистре, ё → е"""
+    def normalize(value):
+        return ' '.join((value or '').lower().replace('ё', 'е').replace('-', ' ').split())
+    return normalize(last_name), normalize(first_name)
+
+
+# ==================== СРАВНЕНИЕ ====================
+
+def _name_similarity(a: tuple, b: tuple) -> float:
+    """Сходство имён 0..1; имя и фамилию могли ввести в любом порядке"""
+    direct = SequenceMatcher(None, f'{a[0]} {a[1]}', f'{b[0]} {b[1]}').ratio()
+    swapped = SequenceMatcher(None, f'{a[0]} {a[1]}', f'{b[1]} {b[0]}').ratio()
+    return max(direct, swapped)
+
+
+def _phone_typo(a: str, b: str) -> bool:
+    """Номера отличаются одной цифрой"""
+    return bool(a) and len(a) == len(b) and sum(x != y for x, y in zip(a, b)) == 1
+
+
+def _score_chunk(pairs):
+    """Процесс-сравниватель: [(VisitorRow, VisitorRow), ...] -> [Match, ...]"""
+    matches = []
+    for a, b in pairs:
+        same_phone = bool(a.phone) and a.phone == b.phone
+        same_email = bool(a.email) and a.email == b.email
+        score = _name_similarity(a.name, b.name)
+
+        if same_phone and same_email:
+            reason, threshold = 'phone_email', CONTACTS_THRESHOLD
+        elif same_phone:
+            reason, threshold = 'phone', NAME_THRESHOLD
+        elif same_email:
+            reason, threshold = 'email', NAME_THRESHOLD
+        elif _phone_typo(a.phone, b.phone):
+            reason, threshold = 'name', NAME_ONLY_THRESHOLD
+        else:
+            continue
+
+        if score >= threshold:
+            # Старший (первый зарегистрированный) посетитель — основной
+            first, second = sorted((a.id, b.id))
+            matches.append(Match(first, second, reason, Decimal(score).quantize(Decimal('0.001'))))
+    return matches
+
+
+class VisitorDeduplicator:
+    """Поиск дублей посетителей.
+
+    Посетители раскладываются по блокам — общий телефон, общий email,
+    первые буквы фамилии и имени, — и сравниваются только внутри блока
+    (слишком большие блоки — скользящим окном по отсортированным именам).
+    Пары-кандидаты сравниваются нечётко по именам — пачками в пуле
+    процессов, если команда find_duplicate_visitors передала workers, иначе
+    в текущем процессе. Найденные дубли сохраняются в VisitorDuplicate
+    и сливаются вручную (merge) после проверки администратором.
+    """
+
+    MIN_PARALLEL = 5000
+    MAX_BLOCK = 200
+    WINDOW = 20
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or 1
+
+    # ==================== КАНДИДАТЫ ====================
+
+    @staticmethod
+    def rows(visitors=None) -> list:
+        visitors = Visitor.objects.all() if visitors is None else visitors
+        rows = visitors.values_list('id', 'first_name', 'last_name', 'phone_key', 'email_key')
+        return [
+            VisitorRow(visitor_id, name_key(first_name, last_name), phone, email)
+            for visitor_id, first_name, last_name, phone, email in rows.iterator()
+        ]
+
+    @classmethod
+    def blocks(cls, rows: list) -> dict:
+        """Блокирующий индекс: {ключ блока: [VisitorRow, ...]}"""
+        blocks = defaultdict(list)
+        for row in rows:
+            if row.phone:
+                blocks['phone', row.phone].append(row)
+            if row.email:
+                blocks['email', row.email].append(row)
+            last_name, first_name = row.name
+            if last_name:
+                blocks['name', last_name[:3], first_name[:1]].append(row)
+        return blocks
+
+    @classmethod
+    def candidate_pairs(cls, rows: list) -> list:
+        """Пары для сравнения (каждая — один раз)"""
+        seen = set()
+        pairs = []
+        for block in cls.blocks(rows).values():
+            if len(block) < 2:
+                continue
+            if len(block) <= cls.MAX_BLOCK:
+                candidates = ((a, b) for i, a in enumerate(block) for b in block[i + 1:])
+            else:
+                # Однофамильцев слишком много — сравниваем соседей по алфавиту
+                block = sorted(block, key=lambda row: row.name)
+                candidates = ((a, b) for i, a in enumerate(block) for b in block[i + 1:i + 1 + cls.WINDOW])
+            for a, b in candidates:
+                pair = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if pair not in seen:
+                    seen.add(pair)
+                    pairs.append((a, b))
+        return pairs
+
+    # ==================== СРАВНЕНИЕ ====================
+
+    def score(self, pairs: list) -> list:
+        """Сравнить пары, вернуть найденные дубли [Match, ...]"""
+        workers = min(self.workers, len(pairs) // self.MIN_PARALLEL)
+        return [match for matches in fork_map(_score_chunk, pairs, workers) for match in matches]
+
+    def run(self) -> list:
+        """Найти дубли среди всех посетителей и заменить ими список VisitorDuplicate"""
+        matches = self.score(self.candidate_pairs(self.rows()))
+        with transaction.atomic():
+            VisitorDuplicate.objects.all().delete()
+            VisitorDuplicate.objects.bulk_create([
+                VisitorDuplicate(visitor_id=match.visitor_id, duplicate_id=match.duplicate_id,
+                                 reason=match.reason, score=match.score)
+                for match in matches
+            ], batch_size=1000)
+        return matches
+
+    @staticmethod
+    def similar(phone: str, email: str, exclude_id=None):
+        """Посетители с тем же телефоном или email (по индексам ключей) — проверка при регистрации"""
+        lookup = Q()
+        if phone_key(phone):
+            lookup |= Q(phone_key=phone_key(phone))
+        if email_key(email):
+            lookup |= Q(email_key=email_key(email))
+        if not lookup:
+            return Visitor.objects.none()
+        return Visitor.objects.filter(lookup).exclude(pk=exclude_id).order_by('id')
+
+    @classmethod
+    def check(cls, visitor: Visitor) -> list:
+        """Сравнить нового или изменённого посетителя с посетителями с тем же телефоном или email,
+        сохранить найденные дубли"""
+        others = cls.rows(cls.similar(visitor.phone, visitor.email, exclude_id=visitor.pk)[:cls.MAX_BLOCK])
+        row = VisitorRow(visitor.pk, name_key(visitor.first_name, visitor.last_name),
+                         visitor.phone_key, visitor.email_key)
+        matches = _score_chunk([(row, other) for other in others])
+        for match in matches:
+            VisitorDuplicate.objects.update_or_create(
+                visitor_id=match.visitor_id, duplicate_id=match.duplicate_id,
+                defaults={'reason': match.reason, 'score': match.score},
+            )
+        return matches
+
+    # ==================== СЛИЯНИЕ ====================
+
+    @staticmethod
+    def merge(visitor: Visitor, duplicate: Visitor) -> MergeResult:
+        """Перенести продажи (UPDATE на таблицу) и баллы (события журнала) дубля на посетителя и удалить дубль"""
+        if visitor.pk == duplicate.pk:
+            raise ValueError('Нельзя слить посетителя с самим собой')
+        with transaction.atomic():
+            result = MergeResult(*(
+                model.objects.filter(visitor=duplicate).update(visitor=visitor)
+                for model in (Ticket, Order, ArchivedTicket, ArchivedOrder)
+            ))
+            # Журнал баллов только дописывается: перенос — новыми событиями
+            LoyaltyLedger.transfer(duplicate.pk, visitor.pk)
+            duplicate.delete()
+            VisitorProfiles.rebuild([visitor.pk])
+        return result
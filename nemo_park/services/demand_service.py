@@ -0,0 +1,229 @@
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from math import ceil
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min, Sum
+from django.utils import timezone
+
+from ..models import (Ticket, Order, ArchivedTicket, ArchivedOrder, Employee, SalesHour,
+                      DemandForecast)
+from .calendar_service import ProductionCalendar
+from .analytics_service import SalesAnalytics
+from .leaderboard_service import CashierLeaderboard
+
+
+CHANNELS = tuple(code for code, _ in SalesHour.CHANNEL_CHOICES)
+
+StaffingHour = namedtuple('StaffingHour', [
+    'hour', 'tickets', 'orders', 'demand', 'actual', 'needed', 'scheduled', 'gap',
+])
+
+
+class SalesSeries:
+    """Почасовой ряд продаж (SalesHour).
+
+    Каждая продажа билета и каждый заказ сразу прибавляются к своему часу
+    (F-выражения), отмена и удаление — вычитаются. Ряд переживает перенос
+    продаж в архив и служит основой прогноза и рейтинга кассиров.
+    """
+
+    # ==================== ИЗМЕНЕНИЯ ====================
+
+    @staticmethod
+    def record(channel: str, cashier_id, moment: datetime, revenue, sign: int = 1):
+        moment = timezone.localtime(moment)
+        row, _ = SalesHour.objects.get_or_create(
+            day=moment.date(), hour=moment.hour, channel=channel, cashier_id=cashier_id
+        )
+        SalesHour.objects.filter(pk=row.pk).update(
+            count=F('count') + sign,
+            revenue=F('revenue') + sign * revenue,
+        )
+        # Живой рейтинг «сегодня» и кэш аналитики — только после фиксации продажи
+        transaction.on_commit(
+            lambda: CashierLeaderboard.record_sale(cashier_id, channel, moment.date(), revenue, sign)
+        )
+        transaction.on_commit(lambda: SalesAnalytics.invalidate(moment.date()))
+
+    @classmethod
+    def record_ticket(cls, ticket: Ticket, sign: int = 1):
+        cls.record('ticket', ticket.cashier_id, ticket.purchase_date, ticket.price, sign)
+
+    @classmethod
+    def record_order(cls, order: Order, sign: int = 1):
+        """Учесть заказ (отменённые заказы в ряд не входят — вызывать с sign=-1 при отмене)"""
+        cls.record('order', order.cashier_id, order.created_at, order.total_price, sign)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Пересобрать ряд из рабочих и архивных продаж, вернуть число строк"""
+        sources = (
+            ('ticket', Ticket.objects.all(), 'purchase_date', 'price'),
+            ('ticket', ArchivedTicket.objects.all(), 'purchase_date', 'price'),
+            ('order', Order.objects.exclude(status='cancelled'), 'created_at', 'total_price'),
+            ('order', ArchivedOrder.objects.exclude(status='cancelled'), 'created_at', 'total_price'),
+        )
+        totals = defaultdict(lambda: [0, Decimal('0')])
+        for channel, rows, moment_field, revenue_field in sources:
+            for moment, cashier_id, revenue in rows.values_list(moment_field, 'cashier_id', revenue_field).iterator():
+                moment = timezone.localtime(moment)
+                key = (moment.date(), moment.hour, channel, cashier_id)
+                totals[key][0] += 1
+                totals[key][1] += revenue
+
+        with transaction.atomic():
+            SalesHour.objects.all().delete()
+            SalesHour.objects.bulk_create([
+                SalesHour(day=day, hour=hour, channel=channel, cashier_id=cashier_id, count=count, revenue=revenue)
+                for (day, hour, channel, cashier_id), (count, revenue) in totals.items()
+            ], batch_size=1000)
+        CashierLeaderboard.invalidate()
+        SalesAnalytics.invalidate()
+        return len(totals)
+
+    # ==================== ЧТЕНИЕ ====================
+
+    @staticmethod
+    def hourly(day: date) -> dict:
+        """Продажи за день по часам: {канал: [24 значения]}"""
+        series = {channel: [0] * 24 for channel in CHANNELS}
+        rows = SalesHour.objects.filter(day=day).values('channel', 'hour').annotate(total=Sum('count')).order_by()
+        for row in rows:
+            series[row['channel']][row['hour']] = row['total']
+        return series
+
+
+class DemandForecaster:
+    """Сезонный прогноз продаж: день недели × час.
+
+    Прогноз часа — взвешенное среднее того же часа того же дня недели за
+    последние WEEKS недель, свежие недели весят больше (вес DECAY^возраст).
+    Расчёт — один агрегат по SalesHour и проход по 2 × 168 ячейкам; результат
+    хранится в DemandForecast (команда forecast_demand по расписанию),
+    а загруженный профиль кэшируется в памяти процесса до следующего расчёта.
+    """
+
+    WEEKS = 8
+    DECAY = 0.7
+
+    _profiles = {}
+
+    @classmethod
+    def invalidate(cls):
+        cls._profiles.clear()
+
+    @classmethod
+    def fit(cls, as_of: date = None) -> date:
+        """Пересчитать прогноз по неделям до as_of (не включая), вернуть as_of"""
+        as_of = as_of or date.today()
+        start = as_of - timedelta(weeks=cls.WEEKS)
+
+        # Недели до первой продажи не считаем нулевыми — иначе молодой ряд занижает прогноз
+        first_day = SalesHour.objects.aggregate(first=Min('day'))['first']
+        weeks = cls.WEEKS
+        if first_day is not None and first_day > start:
+            weeks = max(1, ceil((as_of - first_day).days / 7))
+
+        sums = defaultdict(float)
+        rows = (
+            SalesHour.objects.filter(day__gte=as_of - timedelta(weeks=weeks), day__lt=as_of)
+            .values('day', 'hour', 'channel').annotate(total=Sum('count')).order_by()
+        )
+        for row in rows:
+            # Возраст недели: 0 — последние 7 дней перед as_of
+            age = ((as_of - row['day']).days - 1) // 7
+            sums[row['channel'], row['day'].isoweekday(), row['hour']] += cls.DECAY ** age * row['total']
+
+        weight = sum(cls.DECAY ** age for age in range(weeks))
+        forecasts = [
+            DemandForecast(
+                weekday=weekday, hour=hour, channel=channel, fitted_on=as_of,
+                expected=Decimal(sums.get((channel, weekday, hour), 0) / weight).quantize(Decimal('0.01')),
+            )
+            for channel in CHANNELS for weekday in range(1, 8) for hour in range(24)
+        ]
+        with transaction.atomic():
+            DemandForecast.objects.all().delete()
+            DemandForecast.objects.bulk_create(forecasts)
+        cls.invalidate()
+        return as_of
+
+    @classmethod
+    def profile(cls) -> tuple:
+        """(дата расчёта, {(канал, день недели, час): ожидается}); при пустой таблице — расчёт"""
+        version = DemandForecast.objects.aggregate(version=Max('id'))['version']
+        if version is None:
+            cls.fit()
+            version = DemandForecast.objects.aggregate(version=Max('id'))['version']
+
+        profile = cls._profiles.get(version)
+        if profile is None:
+            rows = list(DemandForecast.objects.values_list('channel', 'weekday', 'hour', 'expected', 'fitted_on'))
+            fitted_on = rows[0][4] if rows else None
+            profile = (fitted_on, {(channel, weekday, hour): expected for channel, weekday, hour, expected, _ in rows})
+            cls._profiles.clear()
+            cls._profiles[version] = profile
+        return profile
+
+    @classmethod
+    def day_forecast(cls, day: date) -> dict:
+        """Прогноз на дату по часам: {канал: [24 значения]}"""
+        _, expected = cls.profile()
+        weekday = day.isoweekday()
+        return {
+            channel: [expected.get((channel, weekday, hour), Decimal('0')) for hour in range(24)]
+            for channel in CHANNELS
+        }
+
+
+# ==================== ПОТРЕБНОСТЬ В КАССИРАХ ====================
+
+def _hour_coverage(schedule_start, schedule_end) -> list:
+    """Доля каждого часа суток (0..1), покрытая сменой с schedule_start до schedule_end"""
+    start = schedule_start.hour * 60 + schedule_start.minute
+    end = schedule_end.hour * 60 + schedule_end.minute
+    if end <= start:
+        # Ночная смена: до полуночи этого дня
+        end = 24 * 60
+    return [max(0, min(end, (hour + 1) * 60) - max(start, hour * 60)) / 60 for hour in range(24)]
+
+
+def staffing_plan(day: date, capacity: int = None) -> list:
+    """Прогноз спроса по часам против кассиров по графику: [StaffingHour, ...]
+
+    needed — сколько кассиров нужно при capacity продажах в час на кассира,
+    scheduled — сколько выходит по графику (с учётом неполных часов),
+    gap — scheduled - needed (меньше нуля — не хватает).
+    """
+    capacity = capacity or settings.STAFFING_SALES_PER_CASHIER_HOUR
+    forecast = DemandForecaster.day_forecast(day)
+    actual = SalesSeries.hourly(day) if day <= date.today() else None
+
+    scheduled = [0.0] * 24
+    for employee in Employee.objects.filter(position='cashier'):
+        if ProductionCalendar.count_work_days(employee.schedule, day, day, employee.follows_calendar):
+            for hour, share in enumerate(_hour_coverage(employee.work_start, employee.work_end)):
+                scheduled[hour] += share
+
+    plan = []
+    for hour in range(24):
+        tickets = forecast['ticket'][hour]
+        orders = forecast['order'][hour]
+        demand = tickets + orders
+        if not demand and not scheduled[hour]:
+            continue
+        needed = ceil(demand / capacity)
+        plan.append(StaffingHour(
+            hour=hour,
+            tickets=tickets,
+            orders=orders,
+            demand=demand,
+            actual=sum(series[hour] for series in actual.values()) if actual is not None else None,
+            needed=needed,
+            scheduled=round(scheduled[hour], 1),
+            gap=round(scheduled[hour] - needed, 1),
+        ))
+    return plan
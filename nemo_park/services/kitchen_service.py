@@ -0,0 +1,297 @@
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import Order, OrderItem, Product
+from .bom_service import BillOfMaterials
+
+
+MenuItem = namedtuple('MenuItem', ['name', 'emoji', 'category', 'prep_minutes', 'bom'])
+
+# Заказ в очереди: products — что готовить (комбо развёрнуты по составу), minutes — время готовки
+KitchenTicket = namedtuple('KitchenTicket', [
+    'order_id', 'lane', 'minutes', 'created_at', 'started_at', 'notes', 'products',
+])
+
+OrderEta = namedtuple('OrderEta', ['order_id', 'lane', 'position', 'minutes_ahead', 'minutes', 'eta'])
+
+KitchenRow = namedtuple('KitchenRow', ['ticket', 'eta', 'items'])
+
+LANE_CHOICES = (
+    ('preparing', 'Готовится'),
+    ('rush', 'Срочный'),
+    ('normal', 'В очереди'),
+)
+
+
+class _Lane:
+    """Заказы одного приоритета в порядке поступления.
+
+    Дерево Фенвика по номерам поступления хранит число заказов и их время
+    готовки, поэтому «сколько заказов и минут впереди» считается за
+    O(log n). Ушедший заказ обнуляет свой номер; номера уплотняются, когда
+    дерево заполняется.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._reset(capacity)
+
+    def _reset(self, capacity: int):
+        self.capacity = capacity
+        self.counts = [0] * (capacity + 1)
+        self.times = [0] * (capacity + 1)
+        self.order_ids = []  # номер поступления → id заказа (None — ушёл)
+        self.slots = {}  # id заказа → (номер, минуты)
+        self.total_minutes = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return (order_id for order_id in self.order_ids if order_id is not None)
+
+    def __contains__(self, order_id):
+        return order_id in self.slots
+
+    def _update(self, slot: int, count: int, minutes: int):
+        i = slot + 1
+        while i <= self.capacity:
+            self.counts[i] += count
+            self.times[i] += minutes
+            i += i & -i
+
+    def push(self, order_id, minutes: int):
+        if len(self.order_ids) == self.capacity:
+            live = [(order_id, self.slots[order_id][1]) for order_id in self]
+            self._reset(max(64, 2 * (len(live) + 1)))
+            for live_id, live_minutes in live:
+                self.push(live_id, live_minutes)
+        slot = len(self.order_ids)
+        self.order_ids.append(order_id)
+        self.slots[order_id] = (slot, minutes)
+        self._update(slot, 1, minutes)
+        self.total_minutes += minutes
+
+    def remove(self, order_id):
+        slot, minutes = self.slots.pop(order_id)
+        self.order_ids[slot] = None
+        self._update(slot, -1, -minutes)
+        self.total_minutes -= minutes
+
+    def ahead(self, order_id) -> tuple:
+        """(заказов, минут) перед заказом в этой очереди"""
+        count = minutes = 0
+        i = self.slots[order_id][0]
+        while i > 0:
+            count += self.counts[i]
+            minutes += self.times[i]
+            i -= i & -i
+        return count, minutes
+
+
+class KitchenQueue:
+    """Очередь кухни: открытые заказы в порядке приготовления.
+
+    Заказы лежат в памяти процесса в трёх очередях по приоритету —
+    готовящиеся (по времени начала), срочные и обычные (по времени
+    заказа). Время готовки заказа — сумма Product.prep_minutes по всему
+    развёрнутому составу (комбо готовится из своих товаров). Позиция в
+    очереди и время готовности (KITCHEN_COOKS поваров работают
+    параллельно) считаются за O(log n) без запросов к базе. Очередь
+    собирается из базы при первом обращении, меняется после каждой
+    продажи и смены статуса в этом процессе и перечитывается раз в
+    REFRESH_SECONDS — так подтягиваются заказы из других процессов.
+    """
+
+    REFRESH_SECONDS = 60
+    OPEN_STATUSES = ('pending', 'preparing')
+    LANES = ('preparing', 'rush', 'normal')
+
+    _lanes = {}
+    _tickets = {}
+    _menu = {}
+    _loaded_at = None
+    _lock = threading.RLock()
+
+    # ==================== СБОРКА ====================
+
+    @staticmethod
+    def _load_menu() -> dict:
+        return {
+            product_id: MenuItem(name, emoji, category, prep_minutes, bom)
+            for product_id, name, emoji, category, prep_minutes, bom in Product.objects.values_list(
+                'pk', 'name', 'image_emoji', 'category', 'prep_minutes', 'bom',
+            )
+        }
+
+    @staticmethod
+    def lane_for(status: str, is_rush: bool) -> str:
+        if status == 'preparing':
+            return 'preparing'
+        return 'rush' if is_rush else 'normal'
+
+    @classmethod
+    def _ticket(cls, order, quantities: dict, menu: dict) -> KitchenTicket:
+        boms = {product_id: menu[product_id].bom for product_id in quantities if product_id in menu}
+        products = BillOfMaterials.explode(quantities, boms).products
+        minutes = sum(menu[product_id].prep_minutes * quantity for product_id, quantity in products.items()
+                      if product_id in menu)
+        return KitchenTicket(order['id'], cls.lane_for(order['status'], order['is_rush']), minutes,
+                             order['created_at'], order['started_at'], order['notes'], products)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Собрать очередь из открытых заказов (три запроса), вернуть число заказов"""
+        open_orders = Order.objects.filter(status__in=cls.OPEN_STATUSES)
+        orders = list(open_orders.order_by('created_at', 'id').values(
+            'id', 'status', 'is_rush', 'created_at', 'started_at', 'notes',
+        ))
+        quantities = defaultdict(lambda: defaultdict(int))
+        items = OrderItem.objects.filter(order__in=open_orders).values_list('order_id', 'product_id', 'quantity')
+        for order_id, product_id, quantity in items:
+            quantities[order_id][product_id] += quantity
+        menu = cls._load_menu()
+
+        tickets = [cls._ticket(order, quantities[order['id']], menu) for order in orders]
+        # Готовящиеся — по времени начала, остальные — по времени заказа
+        tickets.sort(key=lambda ticket: (ticket.lane != 'preparing' or ticket.started_at is None,
+                                         ticket.started_at or ticket.created_at, ticket.order_id))
+        lanes = {lane: _Lane(max(64, 2 * len(tickets))) for lane in cls.LANES}
+        for ticket in tickets:
+            lanes[ticket.lane].push(ticket.order_id, ticket.minutes)
+
+        with cls._lock:
+            cls._lanes = lanes
+            cls._tickets = {ticket.order_id: ticket for ticket in tickets}
+            cls._menu = menu
+            cls._loaded_at = time.monotonic()
+        return len(tickets)
+
+    @classmethod
+    def _ensure_loaded(cls):
+        if cls._loaded_at is None or time.monotonic() - cls._loaded_at > cls.REFRESH_SECONDS:
+            cls.rebuild()
+
+    # ==================== ИЗМЕНЕНИЯ ====================
+
+    @classmethod
+    def update(cls, order):
+        """Поставить заказ в очередь, передвинуть по новому статусу или убрать (готов, выдан, отменён).
+
+        Вызывается после сохранения заказа (transaction.on_commit).
+        """
+        with cls._lock:
+            if cls._loaded_at is None:
+                # Очереди ещё нет — соберётся целиком при первом чтении
+                return
+            previous = cls._tickets.pop(order.id, None)
+            if previous is not None:
+                cls._lanes[previous.lane].remove(order.id)
+        if order.status not in cls.OPEN_STATUSES:
+            return
+
+        values = {'id': order.id, 'status': order.status, 'is_rush': order.is_rush,
+                  'created_at': order.created_at, 'started_at': order.started_at, 'notes': order.notes}
+        if previous is not None:
+            ticket = previous._replace(lane=cls.lane_for(order.status, order.is_rush),
+                                       started_at=order.started_at, notes=order.notes)
+        else:
+            quantities = defaultdict(int)
+            for product_id, quantity in order.orderitem_set.values_list('product_id', 'quantity'):
+                quantities[product_id] += quantity
+            menu = cls._load_menu()
+            ticket = cls._ticket(values, quantities, menu)
+        with cls._lock:
+            if cls._loaded_at is None or order.id in cls._tickets:
+                return
+            cls._tickets[order.id] = ticket
+            cls._lanes[ticket.lane].push(order.id, ticket.minutes)
+            if previous is None:
+                cls._menu = menu
+
+    @classmethod
+    def remove(cls, order_id):
+        with cls._lock:
+            ticket = cls._tickets.pop(order_id, None)
+            if ticket is not None:
+                cls._lanes[ticket.lane].remove(order_id)
+
+    # ==================== ЧТЕНИЕ ====================
+
+    @classmethod
+    def _preparing_left(cls, now) -> float:
+        """Сколько минут ещё готовиться начатым заказам (их не больше, чем поваров)"""
+        left = 0.0
+        for order_id in cls._lanes['preparing']:
+            ticket = cls._tickets[order_id]
+            elapsed = (now - ticket.started_at).total_seconds() / 60 if ticket.started_at else 0
+            left += max(ticket.minutes - elapsed, 0)
+        return left
+
+    @classmethod
+    def _eta(cls, ticket: KitchenTicket, position: int, minutes_ahead: float, now) -> OrderEta:
+        if ticket.lane == 'preparing' and ticket.started_at:
+            eta = ticket.started_at + timedelta(minutes=ticket.minutes)
+        else:
+            # Заказ не готов быстрее собственного времени готовки
+            wait = max(ticket.minutes, (minutes_ahead + ticket.minutes) / max(settings.KITCHEN_COOKS, 1))
+            eta = now + timedelta(minutes=wait)
+        return OrderEta(ticket.order_id, ticket.lane, position, round(minutes_ahead), ticket.minutes, max(eta, now))
+
+    @classmethod
+    def eta(cls, order_id) -> OrderEta:
+        """Позиция и время готовности заказа; None — заказа нет в очереди"""
+        cls._ensure_loaded()
+        now = timezone.now()
+        with cls._lock:
+            ticket = cls._tickets.get(order_id)
+            if ticket is None:
+                return None
+            position = minutes_ahead = 0
+            for lane in cls.LANES:
+                if lane == ticket.lane:
+                    count, minutes = cls._lanes[lane].ahead(order_id)
+                    position += count
+                    minutes_ahead += minutes if lane != 'preparing' else 0
+                    break
+                position += len(cls._lanes[lane])
+                minutes_ahead += cls._preparing_left(now) if lane == 'preparing' else cls._lanes[lane].total_minutes
+            return cls._eta(ticket, position + 1, minutes_ahead, now)
+
+    @classmethod
+    def board(cls, station: str = None) -> list:
+        """Очередь по порядку [KitchenRow, ...]; station — категория товаров (только её позиции)"""
+        cls._ensure_loaded()
+        now = timezone.now()
+        rows = []
+        with cls._lock:
+            position, minutes_ahead = 0, 0.0
+            for lane in cls.LANES:
+                for order_id in cls._lanes[lane]:
+                    ticket = cls._tickets[order_id]
+                    position += 1
+                    items = [
+                        (cls._menu[product_id], quantity)
+                        for product_id, quantity in sorted(ticket.products.items())
+                        # Комбо собирается из своих позиций — на станцию идут они
+                        if product_id in cls._menu and not cls._menu[product_id].bom.get('products')
+                        and (station is None or cls._menu[product_id].category == station)
+                    ]
+                    if items or station is None:
+                        rows.append(KitchenRow(ticket, cls._eta(ticket, position, minutes_ahead, now), items))
+                    if lane != 'preparing':
+                        minutes_ahead += ticket.minutes
+                if lane == 'preparing':
+                    minutes_ahead = cls._preparing_left(now)
+        return rows
+
+    @classmethod
+    def summary(cls) -> dict:
+        """Размеры очередей {очередь: заказов}"""
+        cls._ensure_loaded()
+        with cls._lock:
+            return {lane: len(cls._lanes[lane]) for lane in cls.LANES}
@@ -0,0 +1,149 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import CustomUser, SalesHour
+
+
+CashierStat = namedtuple('CashierStat', [
+    'cashier_id', 'username', 'name', 'tickets', 'ticket_revenue', 'orders', 'order_revenue',
+    'sales', 'revenue', 'average_basket',
+])
+
+
+def _stat(cashier_id, names: dict, tickets, ticket_revenue, orders, order_revenue) -> CashierStat:
+    username, name = names.get(cashier_id, ('', ''))
+    sales = tickets + orders
+    revenue = ticket_revenue + order_revenue
+    return CashierStat(
+        cashier_id, username, name, tickets, ticket_revenue, orders, order_revenue, sales, revenue,
+        (revenue / sales).quantize(Decimal('0.01')) if sales else Decimal('0'),
+    )
+
+
+def _names(cashier_ids) -> dict:
+    """{id кассира: (логин, имя сотрудника)} одним запросом"""
+    rows = CustomUser.objects.filter(id__in=cashier_ids).values_list(
+        'id', 'username', 'employee_profile__first_name', 'employee_profile__last_name'
+    )
+    return {
+        cashier_id: (username, f'{first_name or ""} {last_name or ""}'.strip() or username)
+        for cashier_id, username, first_name, last_name in rows
+    }
+
+
+class CashierLeaderboard:
+    """Рейтинг кассиров по билетам и заказам.
+
+    Рейтинг за любой период собирается из счётчиков SalesHour (по кассиру,
+    дню и часу), без обращения к самим продажам. Рейтинг «сегодня» живёт
+    в памяти процесса: каждая продажа после фиксации транзакции обновляет
+    счётчики кассира и его место в отсортированном списке. Продажи,
+    прошедшие через другие процессы, подтягиваются перечитыванием из
+    SalesHour раз в LIVE_TTL секунд.
+    """
+
+    LIVE_TTL = 60
+
+    # Допустимые поля сортировки
+    ORDERS_BY = ('revenue', 'sales', 'average_basket')
+
+    # {'day': дата, 'loaded_at': время, 'counters': {id: [билеты, выручка, заказы, выручка]},
+    #  'order': [(-выручка, id), ...] по возрастанию, 'names': {id: (логин, имя)}}
+    _live = {}
+    _lock = threading.Lock()
+
+    # ==================== ПЕРИОД ====================
+
+    @staticmethod
+    def _counters(start: date, end: date) -> dict:
+        counters = {}
+        rows = (
+            SalesHour.objects.filter(day__gte=start, day__lte=end, cashier__isnull=False)
+            .values('cashier_id', 'channel').annotate(count=Sum('count'), revenue=Sum('revenue')).order_by()
+        )
+        for row in rows:
+            totals = counters.setdefault(row['cashier_id'], [0, Decimal('0'), 0, Decimal('0')])
+            offset = 0 if row['channel'] == 'ticket' else 2
+            totals[offset] += row['count']
+            totals[offset + 1] += row['revenue']
+        return counters
+
+    @classmethod
+    def ranking(cls, start: date, end: date, order_by: str = 'revenue', limit: int = None) -> list:
+        """Рейтинг кассиров за период [CashierStat, ...]"""
+        if start == end == timezone.localdate():
+            return cls.today(order_by, limit)
+
+        counters = cls._counters(start, end)
+        names = _names(counters)
+        stats = [_stat(cashier_id, names, *totals) for cashier_id, totals in counters.items() if any(totals)]
+        stats.sort(key=lambda stat: (-getattr(stat, order_by), stat.name))
+        return stats[:limit] if limit else stats
+
+    # ==================== СЕГОДНЯ ====================
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._live.clear()
+
+    @classmethod
+    def _today_board(cls) -> dict:
+        today = timezone.localdate()
+        board = cls._live
+        if board.get('day') != today or time.monotonic() - board['loaded_at'] > cls.LIVE_TTL:
+            counters = cls._counters(today, today)
+            board.clear()
+            board.update(
+                day=today,
+                loaded_at=time.monotonic(),
+                counters=counters,
+                order=sorted((-totals[1] - totals[3], cashier_id) for cashier_id, totals in counters.items()),
+                names=_names(counters),
+            )
+        return board
+
+    @classmethod
+    def record_sale(cls, cashier_id, channel: str, day: date, revenue, sign: int = 1):
+        """Обновить рейтинг «сегодня» после продажи (sign=-1 — отмена или удаление)"""
+        with cls._lock:
+            board = cls._live
+            if cashier_id is not None and board.get('day') == day:
+                cls._add(board, cashier_id, channel, revenue, sign)
+
+    @staticmethod
+    def _add(board: dict, cashier_id, channel: str, revenue, sign: int):
+        totals = board['counters'].get(cashier_id)
+        if totals is None:
+            totals = board['counters'][cashier_id] = [0, Decimal('0'), 0, Decimal('0')]
+            board['names'].update(_names([cashier_id]))
+        else:
+            # Убираем старое место кассира из отсортированного списка
+            order = board['order']
+            del order[bisect_left(order, (-totals[1] - totals[3], cashier_id))]
+
+        offset = 0 if channel == 'ticket' else 2
+        totals[offset] += sign
+        totals[offset + 1] += sign * revenue
+        insort(board['order'], (-totals[1] - totals[3], cashier_id))
+
+    @classmethod
+    def today(cls, order_by: str = 'revenue', limit: int = None) -> list:
+        """Живой рейтинг за сегодня — из памяти процесса"""
+        with cls._lock:
+            board = cls._today_board()
+            counters = board['counters']
+            stats = [
+                _stat(cashier_id, board['names'], *counters[cashier_id])
+                for _, cashier_id in board['order'] if any(counters[cashier_id])
+            ]
+        if order_by != 'revenue':
+            stats.sort(key=lambda stat: (-getattr(stat, order_by), stat.name))
+        return stats[:limit] if limit else stats
@@ -0,0 +1,215 @@
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Now, TruncMonth
+from django.utils import timezone
+
+from ..models import Payroll, PayrollLedger
+
+
+LedgerTotals = namedtuple('LedgerTotals', ['count', 'gross', 'net'])
+
+EMPTY_TOTALS = LedgerTotals(0, Decimal('0'), Decimal('0'))
+
+# Из каких статусов разрешён массовый переход
+TRANSITIONS = {
+    'confirmed': ('draft',),
+    'paid': ('draft', 'confirmed'),
+}
+
+
+class Ledger:
+    """Книга итогов расчётных листов (PayrollLedger).
+
+    Все изменения листов, влияющие на суммы, идут через эти методы:
+    они меняют листы и итоги в одной транзакции. Чтение итогов —
+    одна строка по ключу вместо агрегата по всем листам.
+    """
+
+    # ==================== ЧТЕНИЕ ====================
+
+    @staticmethod
+    def totals(status: str, employee=None, period=None) -> LedgerTotals:
+        """Итог по статусу: всего, по сотруднику или по месяцу"""
+        row = PayrollLedger.objects.filter(employee=employee, period=period, status=status).values_list(
+            'count', 'gross_total', 'net_total'
+        ).first()
+        return LedgerTotals(*row) if row else EMPTY_TOTALS
+
+    @staticmethod
+    def status_counts(employee=None) -> dict:
+        """Количество листов по статусам: {'draft': 3, 'paid': 5, ...}"""
+        rows = PayrollLedger.objects.filter(employee=employee, period=None).values_list('status', 'count')
+        counts = {status: 0 for status, _ in Payroll.STATUS_CHOICES}
+        counts.update(rows)
+        return counts
+
+    # ==================== ИЗМЕНЕНИЯ ====================
+
+    @classmethod
+    def record_created(cls, payrolls):
+        """Учесть новые листы (вызывать в транзакции их создания)"""
+        deltas = _Deltas()
+        for payroll in payrolls:
+            deltas.add(payroll.employee_id, payroll.period_start, payroll.status,
+                       1, payroll.gross_salary, payroll.net_salary)
+        deltas.apply()
+
+    @classmethod
+    def record_changed(cls, payrolls, previous):
+        """Учесть новые суммы листов; previous — [(начислено, к выплате), ...] до изменения"""
+        deltas = _Deltas()
+        for payroll, (gross, net) in zip(payrolls, previous):
+            deltas.add(payroll.employee_id, payroll.period_start, payroll.status,
+                       0, payroll.gross_salary - gross, payroll.net_salary - net)
+        deltas.apply()
+
+    @classmethod
+    def transition(cls, payroll: Payroll, status: str) -> Payroll:
+        """Сменить статус листа (черновик → подтверждён → выплачено)"""
+        with transaction.atomic():
+            payroll = Payroll.objects.select_for_update().get(pk=payroll.pk)
+            if payroll.status == status:
+                return payroll
+
+            deltas = _Deltas()
+            deltas.add(payroll.employee_id, payroll.period_start, payroll.status,
+                       -1, -payroll.gross_salary, -payroll.net_salary)
+            deltas.add(payroll.employee_id, payroll.period_start, status,
+                       1, payroll.gross_salary, payroll.net_salary)
+
+            payroll.status = status
+            payroll.paid_at = timezone.now() if status == 'paid' else None
+            payroll.save(update_fields=['status', 'paid_at'])
+            deltas.apply()
+            return payroll
+
+    @classmethod
+    def bulk_transition(cls, payrolls, status: str) -> LedgerTotals:
+        """Перевести листы (QuerySet) в статус одним UPDATE.
+
+        Листы, из статуса которых переход не разрешён (см. TRANSITIONS),
+        пропускаются. Возвращает количество и суммы переведённых листов,
+        посчитанные агрегатом, без загрузки самих листов.
+        """
+        with transaction.atomic():
+            scoped = _locked(payrolls.filter(status__in=TRANSITIONS[status]))
+
+            deltas = _Deltas()
+            moved = [0, Decimal('0'), Decimal('0')]
+            for row in _grouped(scoped):
+                deltas.add(row['employee_id'], row['month'], row['status'],
+                           -row['count'], -row['gross'], -row['net'])
+                deltas.add(row['employee_id'], row['month'], status,
+                           row['count'], row['gross'], row['net'])
+                moved[0] += row['count']
+                moved[1] += row['gross']
+                moved[2] += row['net']
+
+            if moved[0]:
+                scoped.update(status=status, paid_at=Now() if status == 'paid' else None)
+                deltas.apply()
+            return LedgerTotals(*moved)
+
+    @classmethod
+    def delete(cls, payrolls) -> int:
+        """Удалить листы (QuerySet) и вычесть их из итогов, вернуть количество"""
+        with transaction.atomic():
+            scoped = _locked(payrolls)
+            deltas = _Deltas()
+            for row in _grouped(scoped):
+                deltas.add(row['employee_id'], row['month'], row['status'],
+                           -row['count'], -row['gross'], -row['net'])
+            count, _ = scoped.delete()
+            deltas.apply()
+            return count
+
+    @staticmethod
+    def expected() -> dict:
+        """Итоги, посчитанные заново по листам: {(employee_id, period, status): (count, gross, net)}"""
+        deltas = _Deltas()
+        for row in _grouped(Payroll.objects.all()):
+            deltas.add(row['employee_id'], row['month'], row['status'], row['count'], row['gross'], row['net'])
+        return {key: tuple(totals) for key, totals in deltas.items()}
+
+    @classmethod
+    def discrepancies(cls) -> list:
+        """Строки книги, расходящиеся с листами: [(ключ, в книге, по листам), ...]"""
+        expected = cls.expected()
+        actual = {
+            (employee_id, period, status): (count, gross, net)
+            for employee_id, period, status, count, gross, net in PayrollLedger.objects.values_list(
+                'employee_id', 'period', 'status', 'count', 'gross_total', 'net_total'
+            )
+        }
+        empty = (0, Decimal('0'), Decimal('0'))
+        return [
+            (key, actual.get(key, empty), expected.get(key, empty))
+            for key in sorted(expected.keys() | actual.keys(), key=str)
+            if actual.get(key, empty) != expected.get(key, empty)
+        ]
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Пересобрать итоги из всех листов (сверка), вернуть число строк итогов"""
+        with transaction.atomic():
+            PayrollLedger.objects.all().delete()
+            expected = cls.expected()
+            PayrollLedger.objects.bulk_create([
+                PayrollLedger(employee_id=employee_id, period=period, status=status,
+                              count=count, gross_total=gross, net_total=net)
+                for (employee_id, period, status), (count, gross, net) in expected.items()
+            ])
+            return len(expected)
+
+
+def _locked(payrolls):
+    """Заблокировать листы и вернуть QuerySet ровно по ним.
+
+    PostgreSQL не разрешает FOR UPDATE вместе с GROUP BY, поэтому сначала
+    блокируются только id, а агрегат и UPDATE/DELETE идут по этим id —
+    итоги и изменённые строки гарантированно совпадают.
+    """
+    ids = list(payrolls.order_by().select_for_update().values_list('id', flat=True))
+    return Payroll.objects.filter(id__in=ids)
+
+
+def _grouped(payrolls):
+    """Суммы листов по (сотрудник, месяц, статус) одним запросом"""
+    return (
+        payrolls.order_by()
+        .annotate(month=TruncMonth('period_start'))
+        .values('employee_id', 'month', 'status')
+        .annotate(count=Count('id'), gross=Sum('gross_salary'), net=Sum('net_salary'))
+    )
+
+
+class _Deltas:
+    """Изменения итогов, разложенные по трём видам строк книги"""
+
+    def __init__(self):
+        self._totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+
+    def add(self, employee_id, period_start, status, count, gross, net):
+        month = period_start.replace(day=1)
+        for key in ((None, None, status), (employee_id, None, status), (None, month, status)):
+            totals = self._totals[key]
+            totals[0] += count
+            totals[1] += gross
+            totals[2] += net
+
+    def items(self):
+        return self._totals.items()
+
+    def apply(self):
+        for (employee_id, period, status), (count, gross, net) in self._totals.items():
+            if not (count or gross or net):
+                continue
+            row, _ = PayrollLedger.objects.get_or_create(employee_id=employee_id, period=period, status=status)
+            PayrollLedger.objects.filter(pk=row.pk).update(
+                count=F('count') + count,
+                gross_total=F('gross_total') + gross,
+                net_total=F('net_total') + net,
+            )
@@ -0,0 +1,185 @@
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from ..models import LoyaltyEvent, LoyaltyBalance, LoyaltyCompaction
+
+
+CompactionResult = namedtuple('CompactionResult', ['compacted_to', 'events', 'visitors'])
+
+# Поле журнала с id покупки
+SOURCE_FIELDS = {
+    'ticket': 'ticket_id',
+    'order': 'order_id',
+}
+
+
+class LoyaltyLedger:
+    """Баллы лояльности: журнал событий и снимки балансов.
+
+    Каждая покупка посетителя дописывает в журнал LoyaltyEvent событие
+    с баллами, отмена и удаление — событие с обратным знаком; старые
+    события не меняются. Свёртка (compact, по расписанию) складывает
+    новые события в снимки LoyaltyBalance и сдвигает границу compacted_to,
+    поэтому баланс — строка снимка плюс короткий хвост событий после
+    границы по индексу (visitor, id), сколько бы ни вырос журнал.
+    """
+
+    COMPACT_BATCH = 1000
+
+    @staticmethod
+    def points_for(amount) -> int:
+        """Баллы за покупку: 1 балл за каждые LOYALTY_RUBLES_PER_POINT рублей"""
+        return int(amount // settings.LOYALTY_RUBLES_PER_POINT)
+
+    # ==================== ЖУРНАЛ ====================
+
+    @staticmethod
+    def append(events: list) -> int:
+        """Дописать события в журнал одним INSERT, вернуть число событий"""
+        events = [event for event in events if event.points]
+        LoyaltyEvent.objects.bulk_create(events)
+        return len(events)
+
+    @classmethod
+    def sync(cls, kind: str, targets: dict) -> int:
+        """Довести баллы за покупки до нужных: {(id посетителя, id покупки): баллы}.
+
+        Дописывает разницу с уже начисленным, поэтому повторная отмена
+        или повторное начисление ничего не меняют.
+        """
+        field = SOURCE_FIELDS[kind]
+        targets = {key: points for key, points in targets.items() if key[0] is not None}
+        if not targets:
+            return 0
+        current = {
+            (row['visitor_id'], row[field]): row['total']
+            for row in LoyaltyEvent.objects.filter(**{f'{field}__in': {source for _, source in targets}})
+            .values('visitor_id', field).annotate(total=Sum('points')).order_by()
+        }
+        return cls.append([
+            LoyaltyEvent(visitor_id=visitor_id, kind=kind, points=points - current.get((visitor_id, source), 0),
+                         **{field: source})
+            for (visitor_id, source), points in targets.items()
+        ])
+
+    @classmethod
+    def record_ticket(cls, ticket, sign: int = 1) -> int:
+        """Начислить баллы за билет (sign=-1 — снять до удаления или изменения билета)"""
+        points = cls.points_for(ticket.price) if sign > 0 else 0
+        return cls.sync('ticket', {(ticket.visitor_id, ticket.pk): points})
+
+    @classmethod
+    def record_order(cls, order, sign: int = 1) -> int:
+        """Начислить баллы за заказ (sign=-1 — снять при отмене или удалении)"""
+        points = cls.points_for(order.total_price) if sign > 0 else 0
+        return cls.sync('order', {(order.visitor_id, order.pk): points})
+
+    @classmethod
+    def transfer(cls, from_visitor_id, to_visitor_id) -> int:
+        """Перенести баллы дубля на посетителя при слиянии, вернуть число перенесённых баллов.
+
+        Журнал не переписывается: по каждой покупке дописываются два
+        события «слияние» — списание у дубля и начисление посетителю с тем
+        же id покупки, поэтому поздняя отмена покупки (sync) снимет баллы
+        уже у посетителя. Снимки не трогаются — события попадут в хвост
+        после границы и в следующую свёртку.
+        """
+        rows = list(
+            LoyaltyEvent.objects.filter(visitor_id=from_visitor_id)
+            .values('ticket_id', 'order_id').annotate(total=Sum('points')).order_by()
+        )
+        events = []
+        for row in rows:
+            source = {'ticket_id': row['ticket_id'], 'order_id': row['order_id']}
+            events.append(LoyaltyEvent(visitor_id=from_visitor_id, kind='merge', points=-row['total'], **source))
+            events.append(LoyaltyEvent(visitor_id=to_visitor_id, kind='merge', points=row['total'], **source))
+        cls.append(events)
+        return sum(row['total'] for row in rows)
+
+    # ==================== БАЛАНС ====================
+
+    @staticmethod
+    def balances(visitor_ids) -> dict:
+        """Баланс посетителей: {id посетителя: баллы} — снимок плюс хвост журнала после него"""
+        visitor_ids = list(visitor_ids)
+        snapshots = {
+            visitor_id: (points, compacted_to)
+            for visitor_id, points, compacted_to in LoyaltyBalance.objects.filter(visitor_id__in=visitor_ids)
+            .values_list('visitor_id', 'points', 'compacted_to')
+        }
+
+        # Хвост — после границы своего снимка (у посетителей без снимка — весь журнал);
+        # граница одна на свёртку, поэтому условий немного
+        by_boundary = defaultdict(list)
+        for visitor_id in visitor_ids:
+            by_boundary[snapshots.get(visitor_id, (0, 0))[1]].append(visitor_id)
+        tail = Q()
+        for compacted_to, ids in by_boundary.items():
+            tail |= Q(visitor_id__in=ids, id__gt=compacted_to)
+
+        balances = {visitor_id: snapshots.get(visitor_id, (0, 0))[0] for visitor_id in visitor_ids}
+        if visitor_ids:
+            rows = LoyaltyEvent.objects.filter(tail).values('visitor_id').annotate(total=Sum('points')).order_by()
+            for row in rows:
+                balances[row['visitor_id']] += row['total']
+        return balances
+
+    @classmethod
+    def balance(cls, visitor_id) -> int:
+        """Баланс посетителя на кассе"""
+        return cls.balances([visitor_id])[visitor_id]
+
+    # ==================== СВЁРТКА ====================
+
+    @classmethod
+    def compact(cls) -> CompactionResult:
+        """Сложить события после прошлой свёртки в снимки балансов.
+
+        События моложе LOYALTY_SETTLE_SECONDS не сворачиваются: их
+        транзакции могли ещё не зафиксироваться, а граница не должна
+        обогнать ни одно событие.
+        """
+        settled = timezone.now() - timedelta(seconds=settings.LOYALTY_SETTLE_SECONDS)
+        with transaction.atomic():
+            previous = LoyaltyCompaction.objects.aggregate(last=Max('compacted_to'))['last'] or 0
+            upto = (
+                LoyaltyEvent.objects.filter(id__gt=previous, created_at__lte=settled)
+                .aggregate(last=Max('id'))['last']
+            )
+            if upto is None:
+                return CompactionResult(previous, 0, 0)
+
+            deltas = list(
+                LoyaltyEvent.objects.filter(id__gt=previous, id__lte=upto)
+                .values('visitor_id')
+                .annotate(delta=Sum('points'), delta_earned=Sum('points', filter=Q(points__gt=0)), events=Count('id'))
+                .order_by()
+            )
+            for start in range(0, len(deltas), cls.COMPACT_BATCH):
+                batch = deltas[start:start + cls.COMPACT_BATCH]
+                snapshots = LoyaltyBalance.objects.in_bulk([row['visitor_id'] for row in batch])
+                LoyaltyBalance.objects.bulk_create(
+                    [
+                        LoyaltyBalance(
+                            visitor_id=row['visitor_id'],
+                            points=(snapshots[row['visitor_id']].points if row['visitor_id'] in snapshots else 0)
+                            + row['delta'],
+                            earned=(snapshots[row['visitor_id']].earned if row['visitor_id'] in snapshots else 0)
+                            + (row['delta_earned'] or 0),
+                            compacted_to=upto,
+                        )
+                        for row in batch
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['visitor'],
+                    update_fields=['points', 'earned', 'compacted_to', 'updated_at'],
+                )
+
+            events = sum(row['events'] for row in deltas)
+            LoyaltyCompaction.objects.create(compacted_to=upto, events=events, visitors=len(deltas))
+        return CompactionResult(upto, events, len(deltas))
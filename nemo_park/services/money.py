@@ -0,0 +1,37 @@
+"""Денежная арифметика в целых копейках.
+
+Внутри расчётов суммы хранятся как int (копейки), в Decimal они переводятся
+только на границе с моделями. Округление — банковское (ROUND_HALF_EVEN),
+как у Decimal.quantize в контексте по умолчанию, поэтому результаты совпадают
+с прежними расчётами на Decimal.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+KOPECKS = 100
+_CENT = Decimal('0.01')
+
+
+def to_kopecks(value) -> int:
+    """Decimal / int / str в копейки"""
+    if isinstance(value, int):
+        return value * KOPECKS
+    return int((Decimal(value) * KOPECKS).to_integral_value(ROUND_HALF_EVEN))
+
+
+def from_kopecks(kopecks: int) -> Decimal:
+    """Копейки в Decimal с двумя знаками"""
+    return (Decimal(kopecks) / KOPECKS).quantize(_CENT)
+
+
+def div_round(numerator: int, denominator: int) -> int:
+    """Точное деление целых с банковским округлением (denominator > 0)"""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = remainder * 2
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def ratio(value: Decimal) -> tuple:
+    """Коэффициент как несократимая дробь: Decimal('0.13') -> (13, 100)"""
+    return Decimal(value).as_integer_ratio()
@@ -0,0 +1,25 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connection, connections
+
+
+def fork_map(func, jobs: list, workers: int, *args) -> list:
+    """Разбить jobs на workers пачек и вызвать func(пачка, *args) в пуле процессов (fork).
+
+    Функция не должна ходить в базу: перед fork закрываются все соединения
+    и пул PostgreSQL, чтобы дочерние процессы их не унаследовали. Поэтому
+    пул поднимают только management-команды, а не веб-запросы. При
+    workers < 2 или без fork — один вызов в текущем процессе.
+    Возвращает результаты func по пачкам.
+    """
+    if workers < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [func(jobs, *args)]
+
+    connections.close_all()
+    if hasattr(connection, 'close_pool'):
+        connection.close_pool()
+
+    chunks = [jobs[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        return list(pool.map(func, chunks, *([arg] * workers for arg in args)))
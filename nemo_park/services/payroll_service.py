@@ -1,7 +1,138 @@
+from collections import namedtuple
 from decimal import Decimal
 from datetime import date, timedelta
 
+from django.db import transaction
+
 from ..models import Employee, Payroll
+from .money import to_kopecks, from_kopecks, div_round, ratio
+from .calendar_service import ProductionCalendar
+from .ledger_service import Ledger
+
+
+KopeckPayslip = namedtuple('KopeckPayslip', [
+    'total_centihours', 'overtime_centihours',
+    'base_salary', 'overtime_pay', 'gross_salary', 'ndfl_tax', 'net_salary', 'holiday_pay',
+])
+
+# Коэффициенты праздников хранятся в процентах, поэтому суммы с праздничной
+# доплатой считаются в units * PERCENT
+PERCENT = 100
+
+
+def payslip_kopecks(work_days: int, minutes_per_day: int, rate_kopecks: int,
+                    standard_minutes: int, overtime_ratio: tuple, ndfl_ratio: tuple,
+                    holiday_days: tuple = ()) -> KopeckPayslip:
+    """Расчёт зарплаты в целых числах (часы в сотых, деньги в копейках).
+    
+    Коэффициенты передаются дробями (числитель, знаменатель). Промежуточные суммы
+    держатся точными дробями, округляется только результат. holiday_days — пары
+    (дней, коэффициент в процентах): сколько из work_days пришлось на праздники.
+    """
+    overtime_per_day = max(0, minutes_per_day - standard_minutes)
+    day_base, day_overtime = pay_units(minutes_per_day, overtime_per_day, rate_kopecks, overtime_ratio)
+    holiday_units = sum(
+        days * (day_base + day_overtime) * (percent - PERCENT) for days, percent in holiday_days
+    )
+    
+    return payslip_from_units(
+        work_days * minutes_per_day, work_days * overtime_per_day,
+        work_days * day_base * PERCENT, work_days * day_overtime * PERCENT,
+        60 * overtime_ratio[1] * PERCENT, ndfl_ratio, holiday_units,
+    )
+
+
+def pay_units(total_minutes: int, overtime_minutes: int, rate_kopecks: int, overtime_ratio: tuple) -> tuple:
+    """Оплата в долях копейки: 1 копейка = 60 * знаменатель коэффициента переработки"""
+    ot_num, ot_den = overtime_ratio
+    regular_minutes = total_minutes - overtime_minutes
+    return regular_minutes * rate_kopecks * ot_den, overtime_minutes * rate_kopecks * ot_num
+
+
+def payslip_from_units(total_minutes: int, overtime_minutes: int, base_units: int, overtime_units: int,
+                       units_per_kopeck: int, ndfl_ratio: tuple, holiday_units: int = 0) -> KopeckPayslip:
+    """Округление точных сумм до копеек и расчёт НДФЛ"""
+    tax_num, tax_den = ndfl_ratio
+    gross_units = base_units + overtime_units + holiday_units
+    ndfl_tax = div_round(gross_units * tax_num, units_per_kopeck * tax_den)
+    
+    return KopeckPayslip(
+        total_centihours=div_round(total_minutes * 100, 60),
+        overtime_centihours=div_round(overtime_minutes * 100, 60),
+        base_salary=div_round(base_units, units_per_kopeck),
+        overtime_pay=div_round(overtime_units, units_per_kopeck),
+        gross_salary=div_round(gross_units, units_per_kopeck),
+        ndfl_tax=ndfl_tax,
+        net_salary=div_round(gross_units - ndfl_tax * units_per_kopeck, units_per_kopeck),
+        holiday_pay=div_round(holiday_units, units_per_kopeck),
+    )
+
+
+class PayslipResult:
+    """Результат расчёта зарплаты одного сотрудника за период"""
+    
+    __slots__ = (
+        'employee', 'period_start', 'period_end', 'hourly_rate',
+        'work_days', 'hours_per_day', 'total_hours', 'overtime_hours',
+        'base_salary', 'overtime_pay', 'holiday_pay', 'bonus', 'gross_salary',
+        'ndfl_tax', 'other_deductions', 'net_salary', 'from_timesheet',
+    )
+    
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+    
+    def to_payroll(self, created_by=None) -> Payroll:
+        """Несохранённый расчётный лист"""
+        return Payroll(
+            employee=self.employee,
+            period_start=self.period_start,
+            period_end=self.period_end,
+            created_by=created_by,
+            work_days=self.work_days,
+            total_hours=self.total_hours,
+            overtime_hours=self.overtime_hours,
+            base_salary=self.base_salary,
+            overtime_pay=self.overtime_pay,
+            holiday_pay=self.holiday_pay,
+            bonus=self.bonus,
+            gross_salary=self.gross_salary,
+            ndfl_tax=self.ndfl_tax,
+            other_deductions=self.other_deductions,
+            net_salary=self.net_salary,
+            from_timesheet=self.from_timesheet,
+        )
+
+
+class PayslipBatch:
+    """Расчёты по нескольким сотрудникам с итогами, которые копятся при добавлении"""
+    
+    __slots__ = ('results', 'total_gross', 'total_ndfl', 'total_net')
+    
+    def __init__(self):
+        self.results = []
+        self.total_gross = Decimal('0')
+        self.total_ndfl = Decimal('0')
+        self.total_net = Decimal('0')
+    
+    def add(self, result: PayslipResult):
+        self.results.append(result)
+        self.total_gross += result.gross_salary
+        self.total_ndfl += result.ndfl_tax
+        self.total_net += result.net_salary
+    
+    def __iter__(self):
+        return iter(self.results)
+    
+    def __len__(self):
+        return len(self.results)
+    
+    def create_payrolls(self, created_by=None) -> list:
+        """Сохранить все расчётные листы одним запросом"""
+        with transaction.atomic():
+            payrolls = Payroll.objects.bulk_create([r.to_payroll(created_by) for r in self.results])
+            Ledger.record_created(payrolls)
+        return payrolls
 
 
 class PayrollCalculator:
@@ -11,85 +142,170 @@ class PayrollCalculator:
     OVERTIME_MULTIPLIER = Decimal('1.5')
     STANDARD_HOURS_PER_DAY = 8
     
-    def __init__(self, employee: Employee, period_start: date, period_end: date):
+    NDFL_RATIO = ratio(NDFL_RATE)
+    OVERTIME_RATIO = ratio(OVERTIME_MULTIPLIER)
+    UNITS_PER_KOPECK = 60 * OVERTIME_RATIO[1]
+    
+    def __init__(self, employee: Employee, period_start: date, period_end: date, use_timesheet: bool = False):
         self.employee = employee
         self.period_start = period_start
         self.period_end = period_end
+        self.use_timesheet = use_timesheet
     
     def count_work_days(self) -> int:
-        """Подсчёт рабочих дней в периоде"""
-        work_days = self.employee.work_days_list
-        count = 0
-        current = self.period_start
-        
-        while current <= self.period_end:
-            if current.isoweekday() in work_days:
-                count += 1
-            current += timedelta(days=1)
-        
-        return count
+        """Подсчёт рабочих дней в периоде по производственному календарю"""
+        return ProductionCalendar.count_work_days(
+            self.employee.schedule, self.period_start, self.period_end, self.employee.follows_calendar
+        )
+    
+    def holiday_work_days(self) -> tuple:
+        """Рабочие дни, выпавшие на праздники (только если сотрудник работает в праздники)"""
+        if self.employee.follows_calendar:
+            return ()
+        return ProductionCalendar.holiday_work_days(self.employee.schedule, self.period_start, self.period_end)
     
-    def calculate(self) -> dict:
+    @classmethod
+    def calculate_batch(cls, employees, period_start: date, period_end: date,
+                        use_timesheet: bool = False) -> PayslipBatch:
+        """Расчёт для группы сотрудников за один проход"""
+        batch = PayslipBatch()
+        for employee in employees:
+            batch.add(cls(employee, period_start, period_end, use_timesheet).calculate())
+        return batch
+    
+    def calculate(self) -> PayslipResult:
         """Полный расчёт зарплаты"""
+        if self.use_timesheet:
+            return self._calculate_from_timesheet()
         
         work_days_count = self.count_work_days()
-        hours_per_day = self.employee.hours_per_day
-        total_hours = work_days_count * hours_per_day
-        
-        overtime_per_day = max(Decimal('0'), hours_per_day - self.STANDARD_HOURS_PER_DAY)
-        overtime_hours = work_days_count * overtime_per_day
-        regular_hours = total_hours - overtime_hours
         
-        hourly_rate = self.employee.hourly_rate
-        
-        base_salary = regular_hours * hourly_rate
-        overtime_pay = overtime_hours * hourly_rate * self.OVERTIME_MULTIPLIER
-        bonus = Decimal('0')
+        kopecks = payslip_kopecks(
+            work_days_count,
+            self.employee.minutes_per_day,
+            to_kopecks(self.employee.hourly_rate),
+            self.STANDARD_HOURS_PER_DAY * 60,
+            self.OVERTIME_RATIO,
+            self.NDFL_RATIO,
+            self.holiday_work_days(),
+        )
+        return self._result(work_days_count, self.employee.hours_per_day, kopecks)
+    
+    def _calculate_from_timesheet(self) -> PayslipResult:
+        """Расчёт по отмеченным сменам: минуты берутся из накопленных начислений.
         
-        gross_salary = base_salary + overtime_pay + bonus
-        ndfl_tax = (gross_salary * self.NDFL_RATE).quantize(Decimal('0.01'))
-        other_deductions = Decimal('0')
-        net_salary = gross_salary - ndfl_tax - other_deductions
+        Оплата считается по текущей ставке, как и расчёт по графику: в
+        начислениях хранится только время.
+        """
+        from .timesheet_service import Timesheet
         
-        return {
-            'work_days': work_days_count,
-            'hours_per_day': hours_per_day,
-            'total_hours': total_hours.quantize(Decimal('0.01')),
-            'overtime_hours': overtime_hours.quantize(Decimal('0.01')),
-            'base_salary': base_salary.quantize(Decimal('0.01')),
-            'overtime_pay': overtime_pay.quantize(Decimal('0.01')),
-            'bonus': bonus,
-            'gross_salary': gross_salary.quantize(Decimal('0.01')),
-            'ndfl_tax': ndfl_tax,
-            'other_deductions': other_deductions,
-            'net_salary': net_salary.quantize(Decimal('0.01')),
-        }
+        rate_kopecks = to_kopecks(self.employee.hourly_rate)
+        totals = Timesheet.period_totals(self.employee, self.period_start, self.period_end)
+        holiday_units = Timesheet.holiday_units(self.employee, self.period_start, self.period_end, rate_kopecks)
+        # pay_units линейна по минутам: сумма по дням равна оплате суммы минут
+        base_units, overtime_units = pay_units(
+            totals.minutes, totals.overtime_minutes, rate_kopecks, self.OVERTIME_RATIO
+        )
+        kopecks = payslip_from_units(
+            totals.minutes, totals.overtime_minutes,
+            base_units * PERCENT, overtime_units * PERCENT,
+            self.UNITS_PER_KOPECK * PERCENT, self.NDFL_RATIO, holiday_units,
+        )
+        hours_per_day = Decimal(totals.minutes) / totals.days / 60 if totals.days else Decimal('0')
+        return self._result(totals.days, hours_per_day, kopecks)
     
-    def create_payroll(self, created_by=None) -> Payroll:
-        """Создать расчётный лист"""
-        data = self.calculate()
-        
-        return Payroll.objects.create(
+    def _result(self, work_days_count: int, hours_per_day: Decimal, kopecks: KopeckPayslip) -> PayslipResult:
+        return PayslipResult(
             employee=self.employee,
             period_start=self.period_start,
             period_end=self.period_end,
-            created_by=created_by,
-            total_hours=data['total_hours'],
-            overtime_hours=data['overtime_hours'],
-            base_salary=data['base_salary'],
-            overtime_pay=data['overtime_pay'],
-            bonus=data['bonus'],
-            gross_salary=data['gross_salary'],
-            ndfl_tax=data['ndfl_tax'],
-            other_deductions=data['other_deductions'],
-            net_salary=data['net_salary'],
+            hourly_rate=self.employee.hourly_rate,
+            work_days=work_days_count,
+            hours_per_day=hours_per_day,
+            total_hours=from_kopecks(kopecks.total_centihours),
+            overtime_hours=from_kopecks(kopecks.overtime_centihours),
+            base_salary=from_kopecks(kopecks.base_salary),
+            overtime_pay=from_kopecks(kopecks.overtime_pay),
+            holiday_pay=from_kopecks(kopecks.holiday_pay),
+            bonus=Decimal('0'),
+            gross_salary=from_kopecks(kopecks.gross_salary),
+            ndfl_tax=from_kopecks(kopecks.ndfl_tax),
+            other_deductions=Decimal('0'),
+            net_salary=from_kopecks(kopecks.net_salary),
+            from_timesheet=self.use_timesheet,
         )
     
-    def get_preview(self) -> dict:
+    def create_payroll(self, created_by=None) -> Payroll:
+        """Создать расчётный лист"""
+        payroll = self.calculate().to_payroll(created_by)
+        with transaction.atomic():
+            payroll.save()
+            Ledger.record_created([payroll])
+        return payroll
+    
+    def get_preview(self) -> PayslipResult:
         """Предпросмотр расчёта"""
-        data = self.calculate()
-        data['employee'] = self.employee
-        data['period_start'] = self.period_start
-        data['period_end'] = self.period_end
-        data['hourly_rate'] = self.employee.hourly_rate
-        return data
\ No newline at end of file
+        return self.calculate()
+
+
+class PayrollRecalculator:
+    """Пересчёт черновиков после изменения ставки или графика сотрудника.
+
+    Изменение полей из DEPENDS_ON помечает черновики этого сотрудника
+    устаревшими (is_stale), а пересчёт обновляет только помеченные листы —
+    без повторного массового расчёта за весь период. Подтверждённые
+    и выплаченные листы не трогаются.
+    """
+    
+    # Поля сотрудника, от которых зависит расчёт листа
+    DEPENDS_ON = ('hourly_rate', 'work_start', 'work_end', 'break_minutes', 'work_days', 'follows_calendar')
+    
+    # Поля листа, которые считает калькулятор
+    CALCULATED_FIELDS = (
+        'work_days', 'total_hours', 'overtime_hours', 'base_salary', 'overtime_pay',
+        'holiday_pay', 'gross_salary', 'ndfl_tax', 'net_salary',
+    )
+    
+    @classmethod
+    def mark_stale(cls, employee: Employee, changed_fields) -> int:
+        """Пометить черновики сотрудника, если изменилось что-то из DEPENDS_ON"""
+        if not set(changed_fields) & set(cls.DEPENDS_ON):
+            return 0
+        return employee.payrolls.filter(status='draft', is_stale=False).update(is_stale=True)
+    
+    @classmethod
+    def stale_count(cls) -> int:
+        return Payroll.objects.filter(status='draft', is_stale=True).count()
+    
+    @classmethod
+    def recompute(cls, employee_ids=None) -> int:
+        """Пересчитать помеченные черновики (всех или указанных сотрудников)"""
+        with transaction.atomic():
+            payrolls = Payroll.objects.select_for_update().select_related('employee').filter(
+                status='draft', is_stale=True
+            )
+            if employee_ids is not None:
+                payrolls = payrolls.filter(employee_id__in=employee_ids)
+            payrolls = list(payrolls)
+            
+            previous = [(payroll.gross_salary, payroll.net_salary) for payroll in payrolls]
+            for payroll in payrolls:
+                result = PayrollCalculator(
+                    payroll.employee, payroll.period_start, payroll.period_end, payroll.from_timesheet
+                ).calculate()
+                for field in cls.CALCULATED_FIELDS:
+                    setattr(payroll, field, getattr(result, field))
+                payroll.is_stale = False
+            
+            Payroll.objects.bulk_update(payrolls, [*cls.CALCULATED_FIELDS, 'is_stale'])
+            Ledger.record_changed(payrolls, previous)
+        return len(payrolls)
+    
+    @classmethod
+    def recompute_on_commit(cls, employee_ids):
+        """Пересчитать черновики указанных сотрудников после фиксации транзакции.
+        
+        Пересчёт идёт в том же запросе: помеченных листов у одного сотрудника
+        немного. Массовый пересчёт — команда recompute_payrolls.
+        """
+        transaction.on_commit(lambda: cls.recompute(employee_ids))
@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import zipfile
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from ..models import Employee, Payroll
+from .parallel import fork_map
+
+try:
+    # Нужен для PDF (PAYSLIP_FORMAT = 'pdf', см. requirements.txt)
+    from weasyprint import HTML
+except ImportError:
+    HTML = None
+
+
+TEMPLATE = 'nemo_park/payroll/payslip_print.html'
+
+PAYSLIP_FIELDS = (
+    'id', 'employee__first_name', 'employee__last_name', 'employee__position', 'employee__hourly_rate',
+    'period_start', 'period_end', 'work_days', 'total_hours', 'overtime_hours',
+    'base_salary', 'overtime_pay', 'holiday_pay', 'bonus', 'gross_salary',
+    'ndfl_tax', 'other_deductions', 'net_salary', 'status', 'paid_at',
+)
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'html': 'text/html; charset=utf-8',
+}
+
+RenderedPayslip = namedtuple('RenderedPayslip', ['payroll_id', 'filename', 'path'])
+
+
+def _render_chunk(jobs, fmt):
+    """Процесс-рендерер: [(строка листа, путь), ...] -> файлы на диске"""
+    template = get_template(TEMPLATE)
+    for row, path in jobs:
+        html = template.render({'payslip': row})
+        content = HTML(string=html).write_pdf() if fmt == 'pdf' else html.encode()
+        # Сначала во временный файл: параллельное скачивание не увидит недописанный лист
+        temporary = path.with_suffix(f'.{os.getpid()}.tmp')
+        temporary.write_bytes(content)
+        os.replace(temporary, path)
+    return len(jobs)
+
+
+class PayslipRenderer:
+    """Расчётные листы файлами для печати и рассылки.
+
+    Листы читаются из базы одним запросом в словари, а рендеринг идёт
+    в пуле процессов (fork), которым база не нужна. Готовый файл хранится
+    в PAYSLIP_CACHE_DIR под именем <id>-<хеш>, где хеш считается по всем
+    полям листа и тексту шаблона: повторное скачивание берёт файл с диска,
+    а изменённый лист получает новый хеш и перерисовывается.
+
+    Пачки листов рисует команда render_payslips (пул — только при явном
+    workers); веб-запрос собирает готовые файлы (collect).
+    """
+
+    # Меньше листов быстрее нарисовать в текущем процессе, чем поднимать пул
+    MIN_PARALLEL = 20
+
+    _template_digest = None
+
+    def __init__(self, fmt: str = None, workers: int = None, directory=None):
+        self.fmt = fmt or settings.PAYSLIP_FORMAT
+        if self.fmt not in CONTENT_TYPES:
+            raise ValueError(f'Неизвестный формат расчётных листов: {self.fmt}')
+        if self.fmt == 'pdf' and HTML is None:
+            raise ValueError('Для PDF нужен weasyprint (pip install -r requirements.txt) '
+                             'или NEMO_PAYSLIP_FORMAT=html')
+        self.workers = workers or 1
+        self.directory = Path(directory or settings.PAYSLIP_CACHE_DIR)
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.fmt]
+
+    # ==================== ДАННЫЕ ====================
+
+    @staticmethod
+    def rows(payrolls) -> list:
+        """Листы (QuerySet) словарями со всем, что нужно шаблону"""
+        positions = dict(Employee.POSITION_CHOICES)
+        statuses = dict(Payroll.STATUS_CHOICES)
+        rows = []
+        for row in payrolls.order_by('period_start', 'employee__last_name', 'id').values(*PAYSLIP_FIELDS):
+            row['full_name'] = f"{row.pop('employee__first_name')} {row.pop('employee__last_name')}"
+            row['position'] = positions.get(row.pop('employee__position'), '')
+            row['hourly_rate'] = row.pop('employee__hourly_rate')
+            row['status_display'] = statuses.get(row['status'], row['status'])
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def template_digest(cls) -> str:
+        if cls._template_digest is None:
+            source = get_template(TEMPLATE).template.source
+            cls._template_digest = hashlib.sha256(source.encode()).hexdigest()
+        return cls._template_digest
+
+    def digest(self, row: dict) -> str:
+        """Хеш содержимого листа: меняется при любом изменении полей или шаблона"""
+        payload = repr((sorted(row.items()), self.fmt, self.template_digest()))
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def path(self, row: dict) -> Path:
+        return self.directory / f"{row['id']}-{self.digest(row)}.{self.fmt}"
+
+    def filename(self, row: dict) -> str:
+        name = row['full_name'].replace(' ', '_')
+        return f"{row['period_start']:%Y-%m}/{name}_{row['id']}.{self.fmt}"
+
+    # ==================== РЕНДЕРИНГ ====================
+
+    def collect(self, payrolls) -> tuple:
+        """Листы без рендеринга: ([RenderedPayslip, ...], [(строка, путь), ...] ещё не нарисованных)"""
+        rendered = []
+        missing = []
+        for row in self.rows(payrolls):
+            path = self.path(row)
+            if not path.exists():
+                missing.append((row, path))
+            rendered.append(RenderedPayslip(row['id'], self.filename(row), path))
+        return rendered, missing
+
+    def render(self, payrolls) -> list:
+        """Нарисовать недостающие листы и вернуть [RenderedPayslip, ...]"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        rendered, missing = self.collect(payrolls)
+        if missing:
+            self._forget_stale(row for row, _ in missing)
+            self._render_missing(missing)
+        return rendered
+
+    def _forget_stale(self, rows):
+        """Удалить прежние версии перерисовываемых листов"""
+        for row in rows:
+            for stale in self.directory.glob(f"{row['id']}-*.{self.fmt}"):
+                stale.unlink(missing_ok=True)
+
+    def _render_missing(self, jobs):
+        fork_map(_render_chunk, jobs, min(self.workers, len(jobs) // self.MIN_PARALLEL), self.fmt)
+
+    def zip(self, payslips) -> bytes:
+        """Нарисованные листы [RenderedPayslip, ...] одним zip-архивом (папка на каждый месяц)"""
+        buffer = io.BytesIO()
+        # PDF уже сжат, HTML хорошо сжимается
+        compression = zipfile.ZIP_STORED if self.fmt == 'pdf' else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(buffer, 'w', compression) as archive:
+            for payslip in payslips:
+                archive.write(payslip.path, payslip.filename)
+        return buffer.getvalue()
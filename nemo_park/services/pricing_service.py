@@ -0,0 +1,165 @@
+import time
+from bisect import bisect_right
+from decimal import Decimal
+from datetime import date, timedelta
+
+from ..models import Ticket, PriceRule
+from .calendar_service import ProductionCalendar
+
+
+class PricingEngine:
+    """Динамическое ценообразование билетов Nemo Park.
+
+    Для каждого дня строится таблица цен {ticket_type: (пороги, цены)}:
+    пороги — число проданных на дату билетов, с которого действует цена.
+    Таблица считается один раз и дальше отдаётся из памяти процесса.
+    Правила меняют и в других процессах, поэтому кэш живёт не дольше
+    TABLES_TTL секунд.
+    """
+
+    MAX_CACHED_DAYS = 400
+    TABLES_TTL = 300
+
+    _tables = {}
+    _loaded_at = None
+
+    # ==================== КЭШ ====================
+
+    @classmethod
+    def invalidate(cls):
+        """Сбросить кэш (после изменения правил или праздников)"""
+        cls._tables.clear()
+        cls._loaded_at = None
+
+    @classmethod
+    def _expire(cls):
+        """Сбросить устаревший кэш: правила могли поменять в другом процессе"""
+        if cls._loaded_at is None or time.monotonic() - cls._loaded_at > cls.TABLES_TTL:
+            cls._tables.clear()
+            cls._loaded_at = time.monotonic()
+
+    @classmethod
+    def get_table(cls, day: date) -> dict:
+        """Таблица цен на день (из кэша или с расчётом)"""
+        cls._expire()
+        table = cls._tables.get(day)
+        if table is None:
+            rules = list(PriceRule.objects.filter(is_active=True))
+            is_holiday = ProductionCalendar.is_holiday(day)
+            table = cls._build_table(day, is_holiday, rules)
+            cls._remember(day, table)
+        return table
+
+    @classmethod
+    def _remember(cls, day, table):
+        if len(cls._tables) >= cls.MAX_CACHED_DAYS:
+            cls._tables.clear()
+        cls._tables[day] = table
+
+    # ==================== ЦЕНЫ ====================
+
+    @classmethod
+    def get_price(cls, ticket_type: str, day: date = None, occupancy: int = None) -> Decimal:
+        """Цена билета на дату с учётом текущей загруженности"""
+        day = day or date.today()
+        table = cls.get_table(day)
+        if ticket_type not in table:
+            # Бесплатный билет из-за опечатки в типе хуже ошибки
+            raise ValueError(f'Неизвестный тип билета: {ticket_type}')
+        thresholds, prices = table[ticket_type]
+
+        if len(thresholds) > 1:
+            if occupancy is None:
+                occupancy = Ticket.objects.filter(valid_date=day).count()
+            return prices[bisect_right(thresholds, occupancy) - 1]
+        return prices[0]
+
+    @classmethod
+    def get_prices(cls, day: date = None) -> dict:
+        """Цены всех типов билетов на дату (для прайс-листа на кассе)"""
+        day = day or date.today()
+        table = cls.get_table(day)
+        if any(len(thresholds) > 1 for thresholds, _ in table.values()):
+            occupancy = Ticket.objects.filter(valid_date=day).count()
+        else:
+            occupancy = 0
+        return {
+            ticket_type: cls.get_price(ticket_type, day, occupancy)
+            for ticket_type in table
+        }
+
+    @classmethod
+    def price_grid(cls, start: date, end: date) -> list:
+        """Сетка цен на сезон без учёта загруженности.
+
+        Правила загружаются одним запросом, праздники берутся из календаря,
+        а дни с одинаковым набором сработавших правил считаются один раз.
+        """
+        cls._expire()
+        rules = list(PriceRule.objects.filter(is_active=True))
+        holidays = ProductionCalendar.holiday_percents(start, end)
+
+        by_signature = {}
+        grid = []
+        current = start
+        while current <= end:
+            is_holiday = current in holidays
+            matched = tuple(r.pk for r in cls._matching_rules(current, is_holiday, rules))
+            signature = (current.isoweekday(), is_holiday, matched)
+
+            table = by_signature.get(signature)
+            if table is None:
+                table = cls._build_table(current, is_holiday, rules)
+                by_signature[signature] = table
+            if current not in cls._tables:
+                cls._remember(current, table)
+
+            grid.append({
+                'date': current,
+                'is_holiday': is_holiday,
+                'prices': {ticket_type: prices[0] for ticket_type, (_, prices) in table.items()},
+            })
+            current += timedelta(days=1)
+
+        return grid
+
+    # ==================== РАСЧЁТ ТАБЛИЦЫ ====================
+
+    @staticmethod
+    def _matching_rules(day: date, is_holiday: bool, rules: list) -> list:
+        """Правила, действующие в этот день (без учёта загруженности)"""
+        weekday = day.isoweekday()
+        matched = []
+        for rule in rules:
+            if rule.date_from and day < rule.date_from:
+                continue
+            if rule.date_to and day > rule.date_to:
+                continue
+            if rule.holidays_only and not is_holiday:
+                continue
+            weekdays = rule.weekdays_list
+            if weekdays and weekday not in weekdays:
+                continue
+            matched.append(rule)
+        return matched
+
+    @classmethod
+    def _build_table(cls, day: date, is_holiday: bool, rules: list) -> dict:
+        matched = cls._matching_rules(day, is_holiday, rules)
+        matched.sort(key=lambda r: (r.priority, r.pk or 0))
+
+        table = {}
+        for ticket_type, base_price in Ticket.TICKET_PRICES.items():
+            type_rules = [r for r in matched if not r.ticket_type or r.ticket_type == ticket_type]
+            thresholds = sorted({0} | {r.min_occupancy for r in type_rules})
+
+            prices = []
+            for threshold in thresholds:
+                price = Decimal(base_price)
+                for rule in type_rules:
+                    if rule.min_occupancy <= threshold:
+                        price = price * rule.multiplier + rule.surcharge
+                prices.append(max(Decimal('0'), price).quantize(Decimal('0.01')))
+
+            table[ticket_type] = (tuple(thresholds), tuple(prices))
+        return table
@@ -0,0 +1,143 @@
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import ExtractIsoWeekDay
+from django.utils import timezone
+
+from ..models import ArchivedOrderItem, OrderItem, Product, ProductSalesRollup
+
+
+ProductStat = namedtuple('ProductStat', ['product_id', 'name', 'emoji', 'category', 'quantity', 'revenue'])
+
+CategoryStat = namedtuple('CategoryStat', ['category', 'name', 'quantity', 'revenue', 'share'])
+
+# Выручка позиции — цена × количество (цена в позиции — за штуку)
+ITEM_REVENUE = F('quantity') * F('price')
+
+ORDERS_BY = {
+    'quantity': ('-quantity', '-revenue'),
+    'revenue': ('-revenue', '-quantity'),
+}
+
+
+class ProductSales:
+    """Аналитика продаж товаров по итогам ProductSalesRollup.
+
+    Каждый заказ при создании, отмене или удалении меняет итоги своих
+    товаров за день и час (F-выражения, без пересчёта), поэтому топ товаров,
+    разбивка по категориям и тепловая карта за любой период читаются из
+    небольшой таблицы итогов, а не из всех позиций заказов. Итоги
+    переживают перенос заказов в архив.
+    """
+
+    # ==================== ИЗМЕНЕНИЯ ====================
+
+    @classmethod
+    def record_order(cls, order, sign: int = 1):
+        """Учесть позиции заказа (sign=-1 — вычесть при отмене или удалении)"""
+        created = timezone.localtime(order.created_at)
+        rows = (
+            OrderItem.objects.filter(order=order).order_by().values('product_id')
+            .annotate(total_quantity=Sum('quantity'), total_revenue=Sum(ITEM_REVENUE, output_field=DecimalField()))
+        )
+        totals = {
+            (created.date(), created.hour, row['product_id']): (row['total_quantity'], row['total_revenue'])
+            for row in rows
+        }
+        cls._apply(totals, sign)
+
+    @staticmethod
+    def _apply(totals: dict, sign: int):
+        for (day, hour, product_id), (quantity, revenue) in totals.items():
+            rollup, _ = ProductSalesRollup.objects.get_or_create(day=day, hour=hour, product_id=product_id)
+            ProductSalesRollup.objects.filter(pk=rollup.pk).update(
+                quantity=F('quantity') + sign * quantity,
+                revenue=F('revenue') + sign * revenue,
+            )
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Пересобрать итоги из рабочих и архивных заказов, вернуть число строк"""
+        totals = defaultdict(lambda: [0, Decimal('0')])
+        for model in (OrderItem, ArchivedOrderItem):
+            items = (
+                model.objects.exclude(order__status='cancelled').filter(product__isnull=False)
+                .values_list('order__created_at', 'product_id', 'quantity', 'price').iterator()
+            )
+            for created_at, product_id, quantity, price in items:
+                created = timezone.localtime(created_at)
+                key = (created.date(), created.hour, product_id)
+                totals[key][0] += quantity
+                totals[key][1] += price * quantity
+
+        with transaction.atomic():
+            ProductSalesRollup.objects.all().delete()
+            ProductSalesRollup.objects.bulk_create([
+                ProductSalesRollup(day=day, hour=hour, product_id=product_id, quantity=quantity, revenue=revenue)
+                for (day, hour, product_id), (quantity, revenue) in totals.items()
+            ], batch_size=1000)
+        return len(totals)
+
+    # ==================== ЧТЕНИЕ ====================
+
+    @staticmethod
+    def _period(start: date, end: date, category: str = None):
+        rollups = ProductSalesRollup.objects.filter(day__gte=start, day__lte=end)
+        if category:
+            rollups = rollups.filter(product__category=category)
+        return rollups.order_by()
+
+    @classmethod
+    def top_products(cls, start: date, end: date, limit: int = 10, order_by: str = 'quantity',
+                     category: str = None) -> list:
+        """Топ товаров за период по количеству или выручке"""
+        rows = (
+            cls._period(start, end, category)
+            .values('product_id', 'product__name', 'product__image_emoji', 'product__category')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0)
+            .order_by(*ORDERS_BY[order_by], 'product__name')[:limit]
+        )
+        return [
+            ProductStat(row['product_id'], row['product__name'], row['product__image_emoji'],
+                        row['product__category'], row['quantity'], row['revenue'])
+            for row in rows
+        ]
+
+    @classmethod
+    def categories(cls, start: date, end: date) -> list:
+        """Продажи по категориям с долей выручки (в процентах)"""
+        names = dict(Product.CATEGORY_CHOICES)
+        rows = list(
+            cls._period(start, end).values('product__category')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0)
+            .order_by('-revenue')
+        )
+        total = sum(row['revenue'] for row in rows)
+        return [
+            CategoryStat(
+                row['product__category'], names.get(row['product__category'], row['product__category']),
+                row['quantity'], row['revenue'],
+                (row['revenue'] * 100 / total).quantize(Decimal('0.1')) if total else Decimal('0'),
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    def heatmap(cls, start: date, end: date, category: str = None, product_id: int = None) -> list:
+        """Количество проданного по дню недели и часу: 7 строк (Пн–Вс) по 24 часа"""
+        rollups = cls._period(start, end, category)
+        if product_id:
+            rollups = rollups.filter(product_id=product_id)
+        rows = (
+            rollups.annotate(weekday=ExtractIsoWeekDay('day'))
+            .values('weekday', 'hour').annotate(quantity=Sum('quantity'))
+        )
+        grid = [[0] * 24 for _ in range(7)]
+        for row in rows:
+            grid[row['weekday'] - 1][row['hour']] = row['quantity']
+        return grid
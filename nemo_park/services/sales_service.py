@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models import F
+
+from ..models import CustomUser, Employee, Payroll, Ticket, Order, Visitor, SalesHour, ArchiveRollup
+from .demand_service import SalesSeries
+from .kitchen_service import KitchenQueue
+from .leaderboard_service import CashierLeaderboard
+from .ledger_service import Ledger
+from .loyalty_service import LoyaltyLedger
+from .product_sales_service import ProductSales
+from .stock_service import Stock
+from .visitor_service import VisitorProfiles
+
+
+# Итоги с кассиром: ключ строки без кассира и счётчики, которые складываются при слиянии
+CASHIER_ROLLUPS = (
+    (SalesHour, ('day', 'hour', 'channel'), ('count', 'revenue')),
+    (ArchiveRollup, ('day', 'kind'), ('count', 'revenue')),
+)
+
+
+class SalesRemoval:
+    """Удаление продаж вместе со всеми итогами, которые из них набраны.
+
+    Билеты и заказы удаляются и сами, и каскадом — вместе с посетителем
+    (visitor CASCADE) или кассиром (cashier CASCADE). Каскад не вызывает
+    ни delete() модели, ни обработчиков представлений, поэтому все пути
+    удаления (страницы, админка) идут через этот класс: сначала продажи
+    вычитаются из почасового ряда, продаж товаров, профилей и баллов
+    (открытые заказы ещё и возвращают остатки), потом удаляются строки.
+    """
+
+    # ==================== ОДНА ПРОДАЖА ====================
+
+    @staticmethod
+    def forget_ticket(ticket: Ticket, visitor_side: bool = True):
+        """Вычесть билет из итогов (visitor_side=False — посетитель удаляется вместе с профилем и баллами)"""
+        SalesSeries.record_ticket(ticket, -1)
+        if visitor_side:
+            VisitorProfiles.record_ticket(ticket, -1)
+            LoyaltyLedger.record_ticket(ticket, -1)
+
+    @staticmethod
+    def forget_order(order: Order, visitor_side: bool = True):
+        """Вычесть заказ из итогов (отменённый уже вычтен при отмене).
+
+        Остатки возвращаются только за открытый заказ: приготовленная
+        и выданная еда на склад не возвращается.
+        """
+        if order.status != 'cancelled':
+            if order.status in KitchenQueue.OPEN_STATUSES:
+                Stock.give_back_order(order)
+            ProductSales.record_order(order, -1)
+            SalesSeries.record_order(order, -1)
+            if visitor_side:
+                VisitorProfiles.record_order(order, -1)
+                LoyaltyLedger.record_order(order, -1)
+        order_id = order.id
+        transaction.on_commit(lambda: KitchenQueue.remove(order_id))
+
+    # ==================== УДАЛЕНИЕ ====================
+
+    @classmethod
+    def delete_tickets(cls, tickets) -> int:
+        """Удалить билеты (QuerySet), вернуть количество"""
+        with transaction.atomic():
+            tickets = list(tickets.select_for_update())
+            # По одному: визит посетителя уходит из профиля вместе с последним билетом на день
+            for ticket in tickets:
+                cls.forget_ticket(ticket)
+                ticket.delete()
+        return len(tickets)
+
+    @classmethod
+    def delete_orders(cls, orders) -> int:
+        """Удалить заказы (QuerySet) с позициями, вернуть количество"""
+        with transaction.atomic():
+            orders = list(orders.select_for_update())
+            for order in orders:
+                cls.forget_order(order)
+                order.delete()
+        return len(orders)
+
+    @classmethod
+    def delete_visitors(cls, visitors) -> int:
+        """Удалить посетителей (QuerySet) с их билетами и заказами, вернуть количество"""
+        with transaction.atomic():
+            visitor_ids = list(visitors.values_list('pk', flat=True))
+            # Профили, любимые товары и баллы посетителя удалятся каскадом — их не трогаем
+            for ticket in Ticket.objects.filter(visitor_id__in=visitor_ids):
+                cls.forget_ticket(ticket, visitor_side=False)
+            for order in Order.objects.filter(visitor_id__in=visitor_ids):
+                cls.forget_order(order, visitor_side=False)
+            Visitor.objects.filter(pk__in=visitor_ids).delete()
+        return len(visitor_ids)
+
+    @classmethod
+    def delete_users(cls, users) -> int:
+        """Удалить пользователей (QuerySet) с продажами, которые они оформили как кассиры"""
+        with transaction.atomic():
+            user_ids = list(users.values_list('pk', flat=True))
+            cls.delete_tickets(Ticket.objects.filter(cashier_id__in=user_ids))
+            cls.delete_orders(Order.objects.filter(cashier_id__in=user_ids))
+            cls._release_cashiers(user_ids)
+            CustomUser.objects.filter(pk__in=user_ids).delete()
+            transaction.on_commit(CashierLeaderboard.invalidate)
+        return len(user_ids)
+
+    @classmethod
+    def delete_employees(cls, employees) -> int:
+        """Удалить сотрудников (QuerySet) с учётными записями и расчётными листами"""
+        with transaction.atomic():
+            employee_ids = list(employees.values_list('pk', flat=True))
+            cls.delete_users(CustomUser.objects.filter(employee_profile_id__in=employee_ids))
+            # Листы удалятся каскадом — сначала вычитаем их из общих итогов
+            Ledger.delete(Payroll.objects.filter(employee_id__in=employee_ids))
+            Employee.objects.filter(pk__in=employee_ids).delete()
+        return len(employee_ids)
+
+    @staticmethod
+    def _release_cashiers(user_ids):
+        """Перенести итоги удаляемых кассиров в строки без кассира.
+
+        Кассир в итогах — SET_NULL, а строка без кассира на ключ одна
+        (частичное ограничение), поэтому строки кассира прибавляются
+        к уже существующим строкам без кассира, а не просто обнуляют ключ.
+        """
+        for model, key, counters in CASHIER_ROLLUPS:
+            for row in model.objects.filter(cashier_id__in=user_ids).order_by('pk'):
+                target = model.objects.filter(cashier__isnull=True, **{
+                    field: getattr(row, field) for field in key
+                }).first()
+                if target is None:
+                    model.objects.filter(pk=row.pk).update(cashier=None)
+                    continue
+                model.objects.filter(pk=target.pk).update(**{
+                    field: F(field) + getattr(row, field) for field in counters
+                })
+                row.delete()
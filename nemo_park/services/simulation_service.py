@@ -0,0 +1,219 @@
+import hashlib
+import time
+from collections import Counter, namedtuple
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from ..models import Employee
+from ..schedule import compile_schedule, parse_work_days
+from .calendar_service import ProductionCalendar
+from .money import to_kopecks, from_kopecks, ratio
+from .payroll_service import PayrollCalculator, payslip_kopecks
+
+
+# rate_multipliers и work_days — кортежи пар (должность, значение), чтобы сценарий был хешируемым
+Scenario = namedtuple('Scenario', ['name', 'rate_multipliers', 'work_days', 'ndfl_rate', 'overtime_multiplier'])
+
+MonthTotals = namedtuple('MonthTotals', ['month', 'gross', 'ndfl', 'net'])
+
+SimulationResult = namedtuple('SimulationResult', [
+    'scenario', 'key', 'employees', 'months', 'by_position', 'gross', 'ndfl', 'net',
+])
+
+STAFF_FIELDS = ('position', 'hourly_rate', 'work_start', 'work_end', 'break_minutes', 'work_days', 'follows_calendar')
+
+
+class SimulationError(ValueError):
+    """Неверные параметры сценария (для сообщения пользователю)"""
+
+
+def make_scenario(name: str, rate_multipliers: dict = None, work_days: dict = None,
+                  ndfl_rate=None, overtime_multiplier=None) -> Scenario:
+    """Сценарий из «сырых» значений (форма, JSON) с проверкой"""
+    positions = {code for code, _ in Employee.POSITION_CHOICES}
+
+    def decimal(value, field):
+        try:
+            result = Decimal(str(value))
+        except InvalidOperation:
+            raise SimulationError(f'{field}: нужно число')
+        if result < 0 or not result.is_finite():
+            raise SimulationError(f'{field}: значение должно быть неотрицательным')
+        return result
+
+    rates = []
+    for position, multiplier in sorted((rate_multipliers or {}).items()):
+        if position not in positions:
+            raise SimulationError(f'Неизвестная должность: {position}')
+        multiplier = decimal(multiplier, f'Коэффициент ставки ({position})')
+        if multiplier != 1:
+            rates.append((position, multiplier))
+
+    schedules = []
+    for position, days in sorted((work_days or {}).items()):
+        if position not in positions:
+            raise SimulationError(f'Неизвестная должность: {position}')
+        if not days:
+            continue
+        parsed = parse_work_days(str(days))
+        if not parsed or any(not 1 <= day <= 7 for day in parsed):
+            raise SimulationError(f'Рабочие дни ({position}): номера от 1 до 7 через запятую')
+        schedules.append((position, ','.join(map(str, sorted(set(parsed))))))
+
+    ndfl_rate = PayrollCalculator.NDFL_RATE if ndfl_rate in (None, '') else decimal(ndfl_rate, 'НДФЛ')
+    if ndfl_rate >= 1:
+        raise SimulationError('НДФЛ: ставка должна быть меньше 1 (0.13 = 13%)')
+    if overtime_multiplier in (None, ''):
+        overtime_multiplier = PayrollCalculator.OVERTIME_MULTIPLIER
+    else:
+        overtime_multiplier = decimal(overtime_multiplier, 'Коэффициент переработки')
+
+    return Scenario(name or 'Сценарий', tuple(rates), tuple(schedules), ndfl_rate, overtime_multiplier)
+
+
+BASELINE = Scenario('Текущие условия', (), (), PayrollCalculator.NDFL_RATE, PayrollCalculator.OVERTIME_MULTIPLIER)
+
+
+def month_ranges(first_month: date, months: int) -> list:
+    """[(первый день, последний день), ...] для months месяцев подряд"""
+    ranges = []
+    start = first_month.replace(day=1)
+    for _ in range(months):
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        ranges.append((start, next_month - timedelta(days=1)))
+        start = next_month
+    return ranges
+
+
+class PayrollSimulator:
+    """Моделирование фонда оплаты труда «что если».
+
+    Сотрудники с одинаковыми должностью, ставкой и графиком сворачиваются
+    в группы, и каждая группа считается один раз на месяц, а итог умножается
+    на число сотрудников. Повторяющиеся сочетания (дни, минуты, ставка)
+    внутри прогона берутся из памяти. Готовые результаты кэшируются по хешу
+    сценария, периода и состава персонала и живут не дольше RESULTS_TTL
+    секунд — календарь могли поменять в другом процессе.
+    """
+
+    MAX_CACHED_RESULTS = 64
+    RESULTS_TTL = 300
+
+    _results = {}
+    _loaded_at = None
+
+    def __init__(self, first_month: date, months: int = 12):
+        self.months = month_ranges(first_month, months)
+        staff = Employee.objects.exclude(position='user').values_list(*STAFF_FIELDS)
+        self.groups = Counter(staff)
+        self.staff_hash = hashlib.sha256(repr(sorted(self.groups.items())).encode()).hexdigest()
+
+    # ==================== КЭШ ====================
+
+    @classmethod
+    def invalidate(cls):
+        """Сбросить кэш (после изменения календаря)"""
+        cls._results.clear()
+        cls._loaded_at = None
+
+    @classmethod
+    def _expire(cls):
+        if cls._loaded_at is None or time.monotonic() - cls._loaded_at > cls.RESULTS_TTL:
+            cls._results.clear()
+            cls._loaded_at = time.monotonic()
+
+    def scenario_key(self, scenario: Scenario) -> str:
+        """Хеш сценария вместе с периодом и составом персонала"""
+        payload = repr((scenario[1:], self.months[0][0], len(self.months), self.staff_hash))
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    # ==================== РАСЧЁТ ====================
+
+    def compare(self, scenarios) -> list:
+        """Базовый вариант и сценарии для сравнения бок о бок"""
+        return [self.run(scenario) for scenario in (BASELINE, *scenarios)]
+
+    def run(self, scenario: Scenario) -> SimulationResult:
+        self._expire()
+        key = self.scenario_key(scenario)
+        cached = self._results.get(key)
+        if cached is None:
+            cached = self._simulate(scenario, key)
+            if len(self._results) >= self.MAX_CACHED_RESULTS:
+                self._results.clear()
+            self._results[key] = cached
+        # Имя сценария не влияет на суммы и не входит в ключ
+        return cached._replace(scenario=scenario)
+
+    def _simulate(self, scenario: Scenario, key: str) -> SimulationResult:
+        rates = dict(scenario.rate_multipliers)
+        schedules = dict(scenario.work_days)
+        standard_minutes = PayrollCalculator.STANDARD_HOURS_PER_DAY * 60
+        overtime_ratio = ratio(scenario.overtime_multiplier)
+        ndfl_ratio = ratio(scenario.ndfl_rate)
+
+        totals = [[0, 0, 0] for _ in self.months]
+        by_position = Counter()
+        payslips = {}
+
+        for (position, hourly_rate, work_start, work_end, break_minutes, work_days, follows_calendar), count \
+                in self.groups.items():
+            schedule = compile_schedule(work_start, work_end, break_minutes, schedules.get(position, work_days))
+            rate_kopecks = to_kopecks(hourly_rate * rates.get(position, 1))
+
+            for month_totals, (month_start, month_end) in zip(totals, self.months):
+                days = ProductionCalendar.count_work_days(schedule, month_start, month_end, follows_calendar)
+                holidays = () if follows_calendar else \
+                    ProductionCalendar.holiday_work_days(schedule, month_start, month_end)
+
+                payslip_key = (days, holidays, schedule.minutes_per_day, rate_kopecks)
+                payslip = payslips.get(payslip_key)
+                if payslip is None:
+                    payslip = payslip_kopecks(
+                        days, schedule.minutes_per_day, rate_kopecks,
+                        standard_minutes, overtime_ratio, ndfl_ratio, holidays,
+                    )
+                    payslips[payslip_key] = payslip
+
+                month_totals[0] += payslip.gross_salary * count
+                month_totals[1] += payslip.ndfl_tax * count
+                month_totals[2] += payslip.net_salary * count
+                by_position[position] += payslip.gross_salary * count
+
+        return SimulationResult(
+            scenario=scenario,
+            key=key,
+            employees=sum(self.groups.values()),
+            months=[
+                MonthTotals(month_start, *map(from_kopecks, month_totals))
+                for (month_start, _), month_totals in zip(self.months, totals)
+            ],
+            by_position={position: from_kopecks(gross) for position, gross in sorted(by_position.items())},
+            gross=from_kopecks(sum(t[0] for t in totals)),
+            ndfl=from_kopecks(sum(t[1] for t in totals)),
+            net=from_kopecks(sum(t[2] for t in totals)),
+        )
+
+
+def result_to_dict(result: SimulationResult) -> dict:
+    """Результат для JSON API (суммы строками, чтобы не терять копейки)"""
+    scenario = result.scenario
+    return {
+        'key': result.key,
+        'scenario': {
+            'name': scenario.name,
+            'rate_multipliers': {position: str(value) for position, value in scenario.rate_multipliers},
+            'work_days': dict(scenario.work_days),
+            'ndfl_rate': str(scenario.ndfl_rate),
+            'overtime_multiplier': str(scenario.overtime_multiplier),
+        },
+        'employees': result.employees,
+        'gross': str(result.gross),
+        'ndfl': str(result.ndfl),
+        'net': str(result.net),
+        'by_position': {position: str(gross) for position, gross in result.by_position.items()},
+        'months': [
+            {'month': m.month.strftime('%Y-%m'), 'gross': str(m.gross), 'ndfl': str(m.ndfl), 'net': str(m.net)}
+            for m in result.months
+        ],
+    }
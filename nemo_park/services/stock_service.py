@@ -0,0 +1,121 @@
+from collections import namedtuple
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce
+
+from ..models import Product
+from .bom_service import BillOfMaterials
+
+
+Shortage = namedtuple('Shortage', ['product_id', 'name', 'requested', 'left'])
+
+RestockResult = namedtuple('RestockResult', ['products', 'added', 'counted'])
+
+
+class OutOfStock(ValueError):
+    """Товара не хватает на заказ (для сообщения кассиру)"""
+
+    def __init__(self, shortages: list):
+        self.shortages = shortages
+        super().__init__('Недостаточно на складе: ' + ', '.join(
+            f'{shortage.name} (нужно {shortage.requested}, осталось {shortage.left or 0})'
+            for shortage in shortages
+        ))
+
+
+class Stock:
+    """Остатки товаров.
+
+    Остаток (Product.stock) меняется только условным UPDATE с F() —
+    «stock = stock - n WHERE stock >= n» — в транзакции заказа, поэтому
+    параллельные кассы не теряют списаний и не уводят остаток в минус,
+    а блокируются лишь строки товаров из заказа (в порядке id, без
+    взаимных блокировок). Комбо списывает и свой остаток, и остатки
+    всего, что в него входит (BillOfMaterials). Товар с остатком 0 сам
+    снимается с продажи (is_available), приход возвращает в продажу только
+    такие товары — снятые вручную остаются снятыми. Пустой остаток — товар
+    не учитывается.
+    """
+
+    @staticmethod
+    def quantities(items) -> dict:
+        """Позиции заказа → {id товара: количество} (повторы складываются)"""
+        quantities = {}
+        for product_id, quantity in items:
+            if quantity <= 0:
+                raise ValueError('Количество должно быть положительным')
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
+
+    @staticmethod
+    def take(quantities: dict):
+        """Списать товары заказа {id товара: количество}; OutOfStock, если чего-то не хватает.
+
+        Вызывается внутри transaction.atomic() заказа: исключение откатывает
+        и списания, и сам заказ.
+        """
+        tracked = Product.objects.filter(pk__in=quantities, stock__isnull=False).values_list('pk', flat=True)
+        shortages = []
+        for product_id in sorted(tracked):
+            quantity = quantities[product_id]
+            taken = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+                stock=F('stock') - quantity,
+                # В UPDATE справа старое значение: остаток был ровно quantity — стал 0
+                is_available=Case(When(stock=quantity, then=Value(False)), default=F('is_available')),
+            )
+            if not taken:
+                name, left = Product.objects.filter(pk=product_id).values_list('name', 'stock').get()
+                shortages.append(Shortage(product_id, name, quantity, left))
+        if shortages:
+            raise OutOfStock(shortages)
+
+    @staticmethod
+    def give_back(quantities: dict):
+        """Вернуть на склад товары отменённого или удалённого заказа"""
+        for product_id in sorted(quantities):
+            Product.objects.filter(pk=product_id, stock__isnull=False).update(
+                stock=F('stock') + quantities[product_id],
+                is_available=Case(When(stock=0, then=Value(True)), default=F('is_available')),
+            )
+
+    @classmethod
+    def take_items(cls, items):
+        """Списать позиции [(id товара, количество), ...] вместе с составом комбо"""
+        cls.take(BillOfMaterials.explode(cls.quantities(items)).products)
+
+    @classmethod
+    def take_order(cls, order):
+        cls.take_items(order.orderitem_set.values_list('product_id', 'quantity'))
+
+    @classmethod
+    def give_back_order(cls, order):
+        quantities = cls.quantities(order.orderitem_set.values_list('product_id', 'quantity'))
+        cls.give_back(BillOfMaterials.explode(quantities).products)
+
+    @staticmethod
+    def restock(added: dict = None, counted: dict = None) -> RestockResult:
+        """Приход {id товара: количество} и инвентаризация {id товара: фактический остаток} одной транзакцией.
+
+        Приход прибавляется к остатку в SQL и не теряет продаж, прошедших
+        одновременно; инвентаризация ставит остаток как есть. Приход на
+        неучитываемый товар начинает его учёт.
+        """
+        added = {product_id: quantity for product_id, quantity in (added or {}).items() if quantity}
+        counted = counted or {}
+        with transaction.atomic():
+            for product_id in sorted(added):
+                Product.objects.filter(pk=product_id).update(
+                    stock=Coalesce(F('stock'), 0, output_field=models.PositiveIntegerField()) + added[product_id],
+                    is_available=Case(When(stock=0, then=Value(True)), default=F('is_available')),
+                )
+            for product_id in sorted(counted):
+                quantity = counted[product_id]
+                Product.objects.filter(pk=product_id).update(
+                    stock=quantity,
+                    is_available=(
+                        Value(False) if quantity == 0
+                        else Case(When(stock=0, then=Value(True)), default=F('is_available'))
+                    ),
+                )
+        return RestockResult(len(added.keys() | counted.keys()), sum(added.values()), len(counted))
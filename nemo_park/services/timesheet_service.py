@@ -0,0 +1,146 @@
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Employee, WorkShift, PayrollAccrual
+from .money import to_kopecks
+from .calendar_service import ProductionCalendar
+from .payroll_service import PayrollCalculator, pay_units, PERCENT
+
+
+AccrualTotals = namedtuple('AccrualTotals', ['days', 'minutes', 'overtime_minutes'])
+
+EMPTY_TOTALS = AccrualTotals(0, 0, 0)
+
+CUMULATIVE_FIELDS = ('cum_days', 'cum_minutes', 'cum_overtime_minutes')
+
+
+class TimesheetError(Exception):
+    """Ошибка отметки смены (для сообщения пользователю)"""
+
+
+class Timesheet:
+    """Табель: отметки смен и нарастающие итоги отработанного времени по дням.
+
+    При закрытии смены обновляется строка PayrollAccrual за день смены,
+    а разница добавляется к нарастающим итогам всех более поздних дней
+    одним UPDATE. Итоги за любой период — две строки на границах.
+    """
+
+    STANDARD_MINUTES = PayrollCalculator.STANDARD_HOURS_PER_DAY * 60
+
+    # ==================== СМЕНЫ ====================
+
+    @staticmethod
+    def open_shift(employee: Employee):
+        return employee.shifts.filter(ended_at__isnull=True).first()
+
+    @classmethod
+    def clock_in(cls, employee: Employee, at=None) -> WorkShift:
+        """Отметить приход"""
+        try:
+            with transaction.atomic():
+                # Блокировка сотрудника упорядочивает двойное нажатие «Пришёл»;
+                # ограничение work_shift_one_open — на случай без блокировок строк (SQLite)
+                Employee.objects.select_for_update().get(pk=employee.pk)
+                if cls.open_shift(employee):
+                    raise TimesheetError('Смена уже открыта')
+                return WorkShift.objects.create(employee=employee, started_at=at or timezone.now())
+        except IntegrityError:
+            raise TimesheetError('Смена уже открыта')
+
+    @classmethod
+    def clock_out(cls, employee: Employee, break_minutes: int = None, at=None) -> WorkShift:
+        """Отметить уход и начислить отработанное время"""
+        with transaction.atomic():
+            Employee.objects.select_for_update().get(pk=employee.pk)
+            shift = cls.open_shift(employee)
+            if shift is None:
+                raise TimesheetError('Нет открытой смены')
+
+            shift.ended_at = at or timezone.now()
+            duration = max(0, int((shift.ended_at - shift.started_at).total_seconds() // 60))
+            if break_minutes is None:
+                break_minutes = employee.break_minutes
+            shift.break_minutes = min(break_minutes, duration)
+            shift.worked_minutes = duration - shift.break_minutes
+            shift.save()
+
+            cls.accrue(employee, timezone.localtime(shift.started_at).date(), shift.worked_minutes)
+            return shift
+
+    # ==================== НАЧИСЛЕНИЯ ====================
+
+    @classmethod
+    def accrue(cls, employee: Employee, day, minutes: int):
+        """Добавить отработанные минуты за день и пересчитать нарастающие итоги"""
+        with transaction.atomic():
+            # Блокировка сотрудника упорядочивает параллельные закрытия смен
+            employee = Employee.objects.select_for_update().get(pk=employee.pk)
+            accruals = PayrollAccrual.objects.filter(employee=employee)
+
+            row = accruals.filter(day=day).first()
+            if row is None:
+                row = PayrollAccrual(employee=employee, day=day)
+                previous = accruals.filter(day__lt=day).order_by('-day').first()
+                if previous is not None:
+                    for field in CUMULATIVE_FIELDS:
+                        setattr(row, field, getattr(previous, field))
+
+            total_minutes = row.minutes + minutes
+            overtime_minutes = max(0, total_minutes - cls.STANDARD_MINUTES)
+
+            deltas = {
+                'cum_days': int(total_minutes > 0) - int(row.minutes > 0),
+                'cum_minutes': total_minutes - row.minutes,
+                'cum_overtime_minutes': overtime_minutes - row.overtime_minutes,
+            }
+
+            row.minutes = total_minutes
+            row.overtime_minutes = overtime_minutes
+            for field, delta in deltas.items():
+                setattr(row, field, getattr(row, field) + delta)
+            row.save()
+
+            accruals.filter(day__gt=day).update(**{
+                field: F(field) + delta for field, delta in deltas.items()
+            })
+            return row
+
+    @staticmethod
+    def period_totals(employee: Employee, period_start, period_end) -> AccrualTotals:
+        """Итоги за период по нарастающим итогам на его границах"""
+        accruals = PayrollAccrual.objects.filter(employee=employee).order_by('-day').values_list(*CUMULATIVE_FIELDS)
+        upto_end = accruals.filter(day__lte=period_end).first()
+        if upto_end is None:
+            return EMPTY_TOTALS
+        before_start = accruals.filter(day__lt=period_start).first() or EMPTY_TOTALS
+        return AccrualTotals(*(a - b for a, b in zip(upto_end, before_start)))
+
+    @staticmethod
+    def holiday_units(employee: Employee, period_start, period_end, rate_kopecks: int = None) -> int:
+        """Доплата за работу в праздники периода, в units * PERCENT (по текущей ставке сотрудника)"""
+        percents = ProductionCalendar.holiday_percents(period_start, period_end)
+        if not percents:
+            return 0
+        if rate_kopecks is None:
+            rate_kopecks = to_kopecks(employee.hourly_rate)
+        rows = PayrollAccrual.objects.filter(employee=employee, day__in=percents).values_list(
+            'day', 'minutes', 'overtime_minutes'
+        )
+        return sum(
+            sum(pay_units(minutes, overtime_minutes, rate_kopecks, PayrollCalculator.OVERTIME_RATIO))
+            * (percents[day] - PERCENT)
+            for day, minutes, overtime_minutes in rows
+        )
+
+    @classmethod
+    def rebuild(cls, employee: Employee):
+        """Пересобрать начисления сотрудника из закрытых смен (сверка)"""
+        with transaction.atomic():
+            PayrollAccrual.objects.filter(employee=employee).delete()
+            shifts = employee.shifts.filter(ended_at__isnull=False).order_by('started_at')
+            for shift in shifts:
+                cls.accrue(employee, timezone.localtime(shift.started_at).date(), shift.worked_minutes)
@@ -0,0 +1,180 @@
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum
+
+from ..models import (Ticket, Order, OrderItem, ArchivedTicket, ArchivedOrder, ArchivedOrderItem,
+                      VisitorProfile, VisitorProduct)
+
+
+FavouriteProduct = namedtuple('FavouriteProduct', ['product_id', 'name', 'emoji', 'quantity'])
+
+SEGMENT_CHOICES = (
+    ('top', 'Больше всех тратят'),
+    ('regulars', 'Постоянные'),
+    ('lapsed', 'Давно не приходили'),
+)
+
+
+class VisitorProfiles:
+    """Профили посетителей (VisitorProfile, VisitorProduct).
+
+    Визиты, траты и купленные товары посетителя меняются вместе с его
+    билетами и заказами (F-выражения, без пересчёта истории); визит — день,
+    на который у посетителя есть билет. Сегменты читаются по индексам
+    профиля и отдают первые limit строк без сканирования таблицы.
+    """
+
+    # ==================== ИЗМЕНЕНИЯ ====================
+
+    @staticmethod
+    def _profile(visitor_id) -> VisitorProfile:
+        return VisitorProfile.objects.get_or_create(visitor_id=visitor_id)[0]
+
+    @staticmethod
+    def _other_tickets(visitor_id, ticket_id):
+        """Остальные билеты посетителя в рабочей таблице и в архиве"""
+        return (
+            Ticket.objects.filter(visitor_id=visitor_id).exclude(pk=ticket_id),
+            ArchivedTicket.objects.filter(visitor_id=visitor_id).exclude(pk=ticket_id),
+        )
+
+    @classmethod
+    def record_ticket(cls, ticket: Ticket, sign: int = 1):
+        """Учесть билет (sign=-1 — вычесть до удаления или изменения билета)"""
+        if ticket.visitor_id is None:
+            return
+        profile = cls._profile(ticket.visitor_id)
+        others = cls._other_tickets(ticket.visitor_id, ticket.pk)
+        # Второй билет на тот же день — не новый визит
+        same_day = any(tickets.filter(valid_date=ticket.valid_date).exists() for tickets in others)
+
+        updates = {
+            'tickets': F('tickets') + sign,
+            'ticket_spend': F('ticket_spend') + sign * ticket.price,
+            'total_spend': F('total_spend') + sign * ticket.price,
+        }
+        if not same_day:
+            updates['visits'] = F('visits') + sign
+        VisitorProfile.objects.filter(pk=profile.pk).update(**updates)
+
+        profiles = VisitorProfile.objects.filter(pk=profile.pk)
+        if sign > 0:
+            profiles.filter(Q(last_visit__isnull=True) | Q(last_visit__lt=ticket.valid_date)).update(
+                last_visit=ticket.valid_date
+            )
+        elif not same_day and profile.last_visit == ticket.valid_date:
+            # Ушёл последний визит — берём предыдущий
+            days = [tickets.aggregate(last=Max('valid_date'))['last'] for tickets in others]
+            profiles.update(last_visit=max((day for day in days if day), default=None))
+
+    @classmethod
+    def record_order(cls, order: Order, sign: int = 1):
+        """Учесть заказ (отменённые не учитываются — вызывать с sign=-1 при отмене)"""
+        if order.visitor_id is None:
+            return
+        profile = cls._profile(order.visitor_id)
+        VisitorProfile.objects.filter(pk=profile.pk).update(
+            orders=F('orders') + sign,
+            food_spend=F('food_spend') + sign * order.total_price,
+            total_spend=F('total_spend') + sign * order.total_price,
+        )
+
+        rows = OrderItem.objects.filter(order=order).order_by().values('product_id').annotate(total=Sum('quantity'))
+        for row in rows:
+            bought, _ = VisitorProduct.objects.get_or_create(visitor_id=order.visitor_id, product_id=row['product_id'])
+            VisitorProduct.objects.filter(pk=bought.pk).update(quantity=F('quantity') + sign * row['total'])
+
+    @staticmethod
+    def rebuild(visitor_ids=None) -> int:
+        """Пересобрать профили (всех или visitor_ids) из рабочих и архивных продаж, вернуть число профилей"""
+        visitors = Q() if visitor_ids is None else Q(visitor_id__in=visitor_ids)
+        order_visitors = Q() if visitor_ids is None else Q(order__visitor_id__in=visitor_ids)
+        profiles = defaultdict(lambda: {'days': set(), 'tickets': 0, 'orders': 0,
+                                        'ticket_spend': Decimal('0'), 'food_spend': Decimal('0')})
+        for model in (Ticket, ArchivedTicket):
+            rows = model.objects.filter(visitors, visitor__isnull=False).values_list('visitor_id', 'valid_date', 'price')
+            for visitor_id, valid_date, price in rows.iterator():
+                profile = profiles[visitor_id]
+                profile['days'].add(valid_date)
+                profile['tickets'] += 1
+                profile['ticket_spend'] += price
+        for model in (Order, ArchivedOrder):
+            rows = (
+                model.objects.filter(visitors, visitor__isnull=False).exclude(status='cancelled')
+                .values_list('visitor_id', 'total_price')
+            )
+            for visitor_id, total_price in rows.iterator():
+                profile = profiles[visitor_id]
+                profile['orders'] += 1
+                profile['food_spend'] += total_price
+
+        products = defaultdict(int)
+        for model in (OrderItem, ArchivedOrderItem):
+            rows = (
+                model.objects.filter(order_visitors, order__visitor__isnull=False, product__isnull=False)
+                .exclude(order__status='cancelled')
+                .values_list('order__visitor_id', 'product_id', 'quantity')
+            )
+            for visitor_id, product_id, quantity in rows.iterator():
+                products[visitor_id, product_id] += quantity
+
+        with transaction.atomic():
+            VisitorProfile.objects.filter(visitors).delete()
+            VisitorProduct.objects.filter(visitors).delete()
+            VisitorProfile.objects.bulk_create([
+                VisitorProfile(
+                    visitor_id=visitor_id,
+                    visits=len(profile['days']),
+                    last_visit=max(profile['days'], default=None),
+                    tickets=profile['tickets'],
+                    orders=profile['orders'],
+                    ticket_spend=profile['ticket_spend'],
+                    food_spend=profile['food_spend'],
+                    total_spend=profile['ticket_spend'] + profile['food_spend'],
+                )
+                for visitor_id, profile in profiles.items()
+            ], batch_size=1000)
+            VisitorProduct.objects.bulk_create([
+                VisitorProduct(visitor_id=visitor_id, product_id=product_id, quantity=quantity)
+                for (visitor_id, product_id), quantity in products.items()
+            ], batch_size=1000)
+        return len(profiles)
+
+    # ==================== СЕГМЕНТЫ ====================
+
+    @staticmethod
+    def _profiles():
+        return VisitorProfile.objects.select_related('visitor')
+
+    @classmethod
+    def top_spenders(cls, limit: int = 50):
+        """Больше всех потратили (индекс по total_spend)"""
+        return cls._profiles().filter(total_spend__gt=0).order_by('-total_spend')[:limit]
+
+    @classmethod
+    def regulars(cls, min_visits: int = 3, limit: int = 50):
+        """Приходили не меньше min_visits раз, чаще всех — первыми (индекс по visits)"""
+        return cls._profiles().filter(visits__gte=min_visits).order_by('-visits', '-total_spend')[:limit]
+
+    @classmethod
+    def lapsed(cls, days: int = 90, min_visits: int = 1, limit: int = 50, today: date = None):
+        """Не приходили больше days дней, недавно ушедшие — первыми (индекс по last_visit)"""
+        cutoff = (today or date.today()) - timedelta(days=days)
+        return cls._profiles().filter(last_visit__lt=cutoff, visits__gte=min_visits).order_by('-last_visit')[:limit]
+
+    @staticmethod
+    def favourites(visitor_ids, limit: int = 3) -> dict:
+        """Любимые товары посетителей: {id посетителя: [FavouriteProduct, ...]}"""
+        rows = (
+            VisitorProduct.objects.filter(visitor_id__in=visitor_ids, quantity__gt=0)
+            .values_list('visitor_id', 'product_id', 'product__name', 'product__image_emoji', 'quantity')
+            .order_by('visitor_id', '-quantity', 'product__name')
+        )
+        favourites = defaultdict(list)
+        for visitor_id, *product in rows:
+            if len(favourites[visitor_id]) < limit:
+                favourites[visitor_id].append(FavouriteProduct(*product))
+        return favourites
@@ -1,3 +1,1362 @@
-from django.test import TestCase
+import io
+import random
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .db_routing import STICKY_SESSION_KEY, ReadReplicaRouter, ReplicaStickinessMiddleware, read_from_replica
+from .forms import TicketForm
+from .management.commands.bench_payroll import FIELDS, decimal_payslip, kopeck_payslip
+from .models import (
+    ArchivedOrder, ArchiveRollup, CustomUser, Employee, Holiday, LoyaltyBalance, LoyaltyCompaction, LoyaltyEvent,
+    Order, OrderItem, Payroll, PayrollAccrual, PayrollLedger, PriceRule, Product, ProductSalesRollup, SalesHour,
+    Ticket, Visitor, VisitorDuplicate, VisitorProduct, VisitorProfile,
+)
+from .schedule import DEFAULT_WORK_DAYS, compile_schedule
+from .services.analytics_service import SalesAnalytics
+from .services.archive_service import SalesArchive, all_orders, all_tickets, as_instances, sales_totals
+from .services.bom_service import BillOfMaterials, BomCycleError
+from .services.calendar_service import ProductionCalendar
+from .services.dedup_service import VisitorDeduplicator, VisitorRow, email_key, name_key, phone_key
+from .services.demand_service import SalesSeries
+from .services.kitchen_service import KitchenQueue
+from .services.leaderboard_service import CashierLeaderboard
+from .services.ledger_service import Ledger
+from .services.loyalty_service import LoyaltyLedger
+from .services.money import to_kopecks, from_kopecks, div_round
+from .services.payroll_service import PayrollCalculator, PayrollRecalculator, payslip_kopecks
+from .services.payslip_service import PayslipRenderer
+from .services.pricing_service import PricingEngine
+from .services.product_sales_service import ProductSales
+from .services.sales_service import SalesRemoval
+from .services.simulation_service import BASELINE, PayrollSimulator, SimulationError, make_scenario
+from .services.stock_service import Stock, OutOfStock
+from .services.timesheet_service import Timesheet, TimesheetError
+from .services.visitor_service import VisitorProfiles
+
+
+def sell_ticket(cashier, visitor, ticket_type='adult', valid_date=None):
+    """Билет, как его продаёт касса (add_ticket): цена по правилам и итоги"""
+    with transaction.atomic():
+        ticket = Ticket.objects.create(visitor=visitor, ticket_type=ticket_type, cashier=cashier,
+                                       valid_date=valid_date or timezone.localdate())
+        SalesSeries.record_ticket(ticket)
+        VisitorProfiles.record_ticket(ticket)
+        LoyaltyLedger.record_ticket(ticket)
+    return ticket
+
+
+def sell_order(cashier, items, visitor=None):
+    """Заказ, как его оформляет касса (create_order): списание остатков, позиции и итоги"""
+    with transaction.atomic():
+        Stock.take_items((product.pk, quantity) for product, quantity in items)
+        order = Order.objects.create(visitor=visitor, cashier=cashier, total_price=0)
+        total_kopecks = 0
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+            total_kopecks += to_kopecks(product.price) * quantity
+        order.total_price = from_kopecks(total_kopecks)
+        order.save()
+        ProductSales.record_order(order)
+        SalesSeries.record_order(order)
+        VisitorProfiles.record_order(order)
+        LoyaltyLedger.record_order(order)
+    return order
+
+
+def make_payroll(employee, period_start, gross, status='draft'):
+    """Расчётный лист на полмесяца, учтённый в книге итогов"""
+    gross = Decimal(gross)
+    ndfl = (gross * PayrollCalculator.NDFL_RATE).quantize(Decimal('0.01'))
+    with transaction.atomic():
+        payroll = Payroll.objects.create(
+            employee=employee, period_start=period_start, period_end=period_start + timedelta(days=14),
+            gross_salary=gross, ndfl_tax=ndfl, net_salary=gross - ndfl, status=status,
+            paid_at=timezone.now() if status == 'paid' else None,
+        )
+        Ledger.record_created([payroll])
+    return payroll
+
+
+class PricingEngineTests(TestCase):
+    """Цены билетов: правила, загруженность и сброс кэша таблиц"""
+
+    def setUp(self):
+        PricingEngine.invalidate()
+        self.addCleanup(PricingEngine.invalidate)
+        self.day = date(2026, 7, 15)
+
+    def test_base_price_without_rules(self):
+        self.assertEqual(PricingEngine.get_price('adult', self.day), Decimal('1500.00'))
+        self.assertEqual(PricingEngine.get_prices(self.day)['child'], Decimal('800.00'))
+
+    def test_unknown_ticket_type_raises(self):
+        with self.assertRaises(ValueError):
+            PricingEngine.get_price('pensioner', self.day)
+        form = TicketForm(data={'ticket_type': 'pensioner', 'valid_date': self.day})
+        self.assertIn('ticket_type', form.errors)
+
+    def test_occupancy_thresholds(self):
+        PriceRule.objects.create(name='Аншлаг', ticket_type='adult', min_occupancy=10, surcharge=Decimal('300'))
+        self.assertEqual(PricingEngine.get_price('adult', self.day, occupancy=9), Decimal('1500.00'))
+        self.assertEqual(PricingEngine.get_price('adult', self.day, occupancy=10), Decimal('1800.00'))
+        self.assertEqual(PricingEngine.get_price('child', self.day, occupancy=10), Decimal('800.00'))
+
+    def test_saving_rule_or_holiday_drops_tables(self):
+        PricingEngine.get_price('adult', self.day)
+        PriceRule.objects.create(name='Праздник', holidays_only=True, multiplier=Decimal('2'))
+        self.assertEqual(PricingEngine.get_price('adult', self.day), Decimal('1500.00'))
+        Holiday.objects.create(date=self.day, name='День парка')
+        self.assertEqual(PricingEngine.get_price('adult', self.day), Decimal('3000.00'))
+
+    def test_rules_changed_elsewhere_expire(self):
+        rule = PriceRule.objects.create(name='Лето', multiplier=Decimal('1.5'))
+        self.assertEqual(PricingEngine.get_price('adult', self.day), Decimal('2250.00'))
+        # update() мимо save(): так выглядит правка правила в другом процессе
+        PriceRule.objects.filter(pk=rule.pk).update(multiplier=Decimal('2'))
+        self.assertEqual(PricingEngine.get_price('adult', self.day), Decimal('2250.00'))
+        with mock.patch.object(PricingEngine, 'TABLES_TTL', -1):
+            self.assertEqual(PricingEngine.get_price('adult', self.day), Decimal('3000.00'))
+
+    def test_price_grid_matches_day_tables(self):
+        PriceRule.objects.create(name='Выходные', weekdays='6,7', surcharge=Decimal('500'))
+        grid = PricingEngine.price_grid(self.day, self.day + timedelta(days=6))
+        self.assertEqual(len(grid), 7)
+        PricingEngine.invalidate()
+        for row in grid:
+            self.assertEqual(row['prices']['vip'], PricingEngine.get_price('vip', row['date'], occupancy=0))
+        self.assertEqual({row['prices']['adult'] for row in grid}, {Decimal('1500.00'), Decimal('2000.00')})
+
+
+class ReplicaRoutingTests(TestCase):
+    """Чтение из реплики в помеченных GET-запросах и прилипание сессии после записи"""
+
+    def setUp(self):
+        patcher = mock.patch('nemo_park.db_routing.replica_alias', return_value='replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+        self.router = ReadReplicaRouter()
+
+    def _read_alias(self, request):
+        view = read_from_replica(lambda request: self.router.db_for_read(Ticket))
+        return view(request)
+
+    def _request(self, method='get', last_write=None):
+        request = getattr(self.factory, method)('/')
+        request.session = {} if last_write is None else {STICKY_SESSION_KEY: last_write}
+        return request
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self._read_alias(self._request()), 'replica')
+        self.assertIsNone(self._read_alias(self._request('post')))
+        # Вне декоратора — основная БД, запись — всегда в основную
+        self.assertIsNone(self.router.db_for_read(Ticket))
+        self.assertEqual(self.router.db_for_write(Ticket), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'nemo_park'))
+
+    def test_recent_write_sticks_to_default(self):
+        self.assertIsNone(self._read_alias(self._request(last_write=timezone.now().timestamp())))
+        with override_settings(REPLICA_STICKY_SECONDS=10):
+            self.assertEqual(self._read_alias(self._request(last_write=timezone.now().timestamp() - 11)), 'replica')
+
+    def test_no_replica_configured(self):
+        with mock.patch('nemo_park.db_routing.replica_alias', return_value=None):
+            self.assertIsNone(self._read_alias(self._request()))
+
+    def _through_middleware(self, view, method='post'):
+        request = self._request(method)
+        ReplicaStickinessMiddleware(view)(request)
+        return STICKY_SESSION_KEY in request.session
+
+    def test_only_successful_writes_stamp_session(self):
+        def write(request, status=200):
+            Visitor.objects.create(first_name='Ольга', last_name='Иванова', email=f'olga{status}@example.com')
+            return HttpResponse(status=status)
+
+        self.assertTrue(self._through_middleware(write))
+        self.assertFalse(self._through_middleware(lambda request: write(request, status=400)))
+        self.assertFalse(self._through_middleware(lambda request: HttpResponse(Visitor.objects.count())))
+        self.assertFalse(self._through_middleware(write, method='get'))
+
+
+class KopeckRoundingTests(SimpleTestCase):
+    """Расчёт в копейках: банковское округление и совпадение с эталоном на Decimal"""
+
+    def test_div_round_half_even(self):
+        self.assertEqual(div_round(5, 10), 0)
+        self.assertEqual(div_round(15, 10), 2)
+        self.assertEqual(div_round(25, 10), 2)
+        self.assertEqual(div_round(26, 10), 3)
+        self.assertEqual(div_round(-5, 10), 0)
+        self.assertEqual(div_round(-15, 10), -2)
+
+    def test_to_and_from_kopecks(self):
+        self.assertEqual(to_kopecks(3), 300)
+        self.assertEqual(to_kopecks('0.005'), 0)
+        self.assertEqual(to_kopecks('0.015'), 2)
+        self.assertEqual(to_kopecks(Decimal('1234.56')), 123456)
+        self.assertEqual(from_kopecks(123456), Decimal('1234.56'))
+        self.assertEqual(from_kopecks(5), Decimal('0.05'))
+
+    def test_half_kopeck_rounds_to_even(self):
+        params = (PayrollCalculator.STANDARD_HOURS_PER_DAY * 60,
+                  PayrollCalculator.OVERTIME_RATIO, PayrollCalculator.NDFL_RATIO)
+        # 1 коп./час: полчаса — ровно половина копейки (к чётному 0), полтора часа — 1,5 (к 2)
+        self.assertEqual(payslip_kopecks(1, 30, 1, *params).base_salary, 0)
+        self.assertEqual(payslip_kopecks(1, 90, 1, *params).base_salary, 2)
+        self.assertEqual(payslip_kopecks(3, 30, 1, *params).base_salary, 2)
+
+    def test_overtime_and_holidays(self):
+        # 10 часов в день при 8-часовой норме: 2 часа переработки в день
+        result = kopeck_payslip(5, 600, Decimal('100'), holiday_days=1, holiday_percent=200)
+        values = dict(zip(FIELDS, result))
+        self.assertEqual(values['total_hours'], Decimal('50.00'))
+        self.assertEqual(values['overtime_hours'], Decimal('10.00'))
+        self.assertEqual(values['base_salary'], Decimal('4000.00'))
+        self.assertEqual(values['overtime_pay'], 10 * 100 * PayrollCalculator.OVERTIME_MULTIPLIER)
+        self.assertEqual(values['holiday_pay'], 800 + 2 * 100 * PayrollCalculator.OVERTIME_MULTIPLIER)
+        self.assertEqual(values['net_salary'], values['gross_salary'] - values['ndfl_tax'])
+        self.assertEqual(result, decimal_payslip(5, 600, Decimal('100'), 1, 200))
+
+    def test_matches_decimal_reference(self):
+        rng = random.Random(20260101)
+        for _ in range(20000):
+            work_days = rng.randint(0, 31)
+            case = (
+                work_days,
+                rng.randint(0, 24 * 60) - rng.choice((0, 30, 45, 60)),  # минут в день
+                Decimal(rng.randint(0, 300000)) / 100,                # ставка ₽/час
+                rng.randint(0, min(work_days, 3)),                    # из них в праздники
+                rng.choice((100, 150, 200, 300)),                     # коэффициент праздника, %
+            )
+            expected = decimal_payslip(*case)
+            actual = kopeck_payslip(*case)
+            if expected != actual:
+                self.fail(f'{case}: Decimal={dict(zip(FIELDS, expected))} копейки={dict(zip(FIELDS, actual))}')
+
+
+class WorkScheduleTests(TestCase):
+    """Скомпилированный график: часы, маска дней и подсчёт без перебора"""
+
+    def test_compile_parses_fields_once(self):
+        schedule = compile_schedule('22:00', '06:00', 30, '5,6,7')
+        self.assertEqual((schedule.mask, schedule.work_days), (0b1110000, (5, 6, 7)))
+        self.assertEqual((schedule.minutes_per_day, schedule.hours_per_day), (450, Decimal('7.5')))
+        self.assertEqual((schedule.work_days_display, schedule.schedule_display), ('Пт, Сб, Вс', '22:00 - 06:00'))
+        # Одинаковые графики — один объект
+        self.assertIs(compile_schedule('22:00', '06:00', 30, '5,6,7'), schedule)
+        self.assertEqual(compile_schedule('09:00', '18:00', 60, '').work_days, DEFAULT_WORK_DAYS)
+
+    def test_counts_match_day_by_day(self):
+        rng = random.Random(33)
+        for _ in range(300):
+            days = rng.sample(range(1, 8), rng.randint(1, 7))
+            schedule = compile_schedule('09:00', '18:00', 60, ','.join(map(str, days)))
+            start = date(2025, 1, 1) + timedelta(days=rng.randint(0, 700))
+            end = start + timedelta(days=rng.randint(-1, 120))
+            expected = sum(schedule.works_on(start + timedelta(days=i)) for i in range((end - start).days + 1))
+            self.assertEqual(schedule.count_work_days(start, end), expected)
+
+            year = start.year
+            bits = schedule.year_bits(year)
+            day = date(year, 1, 1)
+            self.assertEqual(bits.bit_count(), schedule.count_work_days(day, date(year, 12, 31)))
+            self.assertEqual(bool(bits >> (start - day).days & 1), schedule.works_on(start))
+
+    def test_employee_keeps_mask_in_sync(self):
+        employee = Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier',
+                                           work_days='1,3,5')
+        self.assertEqual(employee.work_days_mask, 0b0010101)
+        employee.work_days = '6,7'
+        employee.save(update_fields=['work_days'])
+        employee.refresh_from_db()
+        self.assertEqual(employee.work_days_mask, 0b1100000)
+        self.assertEqual(employee.schedule.mask, employee.work_days_mask)
+
+
+class TimesheetTests(TestCase):
+    """Нарастающие итоги табеля при закрытии смен"""
+
+    def setUp(self):
+        self.employee = Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier',
+                                                hourly_rate=Decimal('200'))
+        self.days = [date(2026, 4, 13) + timedelta(days=i) for i in range(3)]
+
+    def _cumulative(self):
+        return list(PayrollAccrual.objects.filter(employee=self.employee).order_by('day').values_list(
+            'day', 'minutes', 'overtime_minutes', 'cum_days', 'cum_minutes', 'cum_overtime_minutes',
+        ))
+
+    def _calculate(self):
+        return PayrollCalculator(self.employee, self.days[0], self.days[2], use_timesheet=True).calculate()
+
+    def test_clock_out_accrues_worked_minutes(self):
+        started = timezone.make_aware(datetime(2026, 4, 13, 9, 0))
+        Timesheet.clock_in(self.employee, at=started)
+        with self.assertRaises(TimesheetError):
+            Timesheet.clock_in(self.employee, at=started)
+        shift = Timesheet.clock_out(self.employee, break_minutes=60, at=started + timedelta(hours=10))
+        self.assertEqual(shift.worked_minutes, 540)
+        self.assertEqual(self._cumulative(), [(self.days[0], 540, 60, 1, 540, 60)])
+        with self.assertRaises(TimesheetError):
+            Timesheet.clock_out(self.employee)
+
+    def test_earlier_day_shifts_later_totals(self):
+        Timesheet.accrue(self.employee, self.days[2], 600)
+        Timesheet.accrue(self.employee, self.days[0], 300)
+        Timesheet.accrue(self.employee, self.days[0], 240)
+        self.assertEqual(self._cumulative(), [
+            (self.days[0], 540, 60, 1, 540, 60),
+            (self.days[2], 600, 120, 2, 1140, 180),
+        ])
+        self.assertEqual(tuple(Timesheet.period_totals(self.employee, self.days[1], self.days[2])), (1, 600, 120))
+        self.assertEqual(tuple(Timesheet.period_totals(self.employee, self.days[0], self.days[2])), (2, 1140, 180))
+
+        incremental = self._cumulative()
+        for day, minutes in ((self.days[2], 600), (self.days[0], 540)):
+            started = timezone.make_aware(datetime.combine(day, time(8)))
+            self.employee.shifts.create(started_at=started, ended_at=started + timedelta(minutes=minutes),
+                                        worked_minutes=minutes)
+        Timesheet.rebuild(self.employee)
+        self.assertEqual(self._cumulative(), incremental)
+
+    def test_payroll_uses_current_rate(self):
+        Timesheet.accrue(self.employee, self.days[0], 480)
+        Timesheet.accrue(self.employee, self.days[1], 540)
+        result = self._calculate()
+        self.assertEqual((result.work_days, result.overtime_hours), (2, Decimal('1.00')))
+        self.assertEqual(result.gross_salary, Decimal('200') * 16 + Decimal('200') * 1 * PayrollCalculator.OVERTIME_MULTIPLIER)
+        self.employee.hourly_rate = Decimal('400')
+        self.employee.save()
+        self.assertEqual(self._calculate().gross_salary, 2 * result.gross_salary)
+
+
+class SalesArchiveTests(TestCase):
+    """Перенос старых продаж в архив: итоги не меняются, списки видят архив"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('archive_test', password='x', role='cashier')
+        self.visitor = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                              email='olga@example.com', phone='+79161234567')
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        self.old = timezone.make_aware(datetime(2025, 6, 1, 12, 0))
+        self.old_ticket = sell_ticket(self.cashier, self.visitor)
+        self.old_order = sell_order(self.cashier, [(self.popcorn, 2)], visitor=self.visitor)
+        Ticket.objects.filter(pk=self.old_ticket.pk).update(purchase_date=self.old)
+        Order.objects.filter(pk=self.old_order.pk).update(created_at=self.old)
+        self.new_ticket = sell_ticket(self.cashier, self.visitor, ticket_type='child')
+
+    def _archive(self):
+        archive = SalesArchive(date(2026, 1, 1), batch_size=1)
+        return archive.archive_tickets(), archive.archive_orders()
+
+    def test_totals_survive_archiving(self):
+        before = sales_totals(cashier=self.cashier)
+        self.assertEqual(self._archive(), (1, 1))
+        self.assertEqual(sales_totals(cashier=self.cashier), before)
+        self.assertEqual(list(Ticket.objects.values_list('pk', flat=True)), [self.new_ticket.pk])
+        self.assertFalse(Order.objects.exists())
+
+        rollups = {row.kind: row for row in ArchiveRollup.objects.filter(day=date(2025, 6, 1))}
+        self.assertEqual((rollups['ticket'].count, rollups['ticket'].revenue), (1, self.old_ticket.price))
+        self.assertEqual((rollups['order'].count, rollups['order'].revenue), (1, Decimal('500')))
+        self.assertEqual(ArchivedOrder.objects.get().items.get().quantity, 2)
+
+    def test_unified_read_marks_archived_rows(self):
+        self._archive()
+        rows = as_instances(Ticket, all_tickets(cashier=self.cashier).order_by('-purchase_date'))
+        self.assertEqual([(row.pk, row.archived) for row in rows],
+                         [(self.new_ticket.pk, False), (self.old_ticket.pk, True)])
+        with self.assertNumQueries(0):
+            self.assertEqual(rows[1].visitor, self.visitor)
+            self.assertEqual(rows[1].cashier, self.cashier)
+
+        order, = as_instances(Order, all_orders(cashier=self.cashier))
+        self.assertEqual((order.pk, order.items_count, order.archived), (self.old_order.pk, 1, True))
+
+    def test_lists_show_archive_on_request(self):
+        self._archive()
+        client = Client()
+        client.force_login(self.cashier)
+        url = reverse('tickets')
+        self.assertEqual(len(client.get(url).context['tickets']), 1)
+        self.assertEqual(len(client.get(url, {'archive': '1'}).context['tickets']), 2)
+
+        url = reverse('orders')
+        self.assertEqual(client.get(url).context['total_orders'], 0)
+        response = client.get(url, {'archive': '1'})
+        self.assertEqual((response.context['total_orders'], response.context['total_revenue']),
+                         (1, Decimal('500')))
+        self.assertNotContains(response, reverse('order_detail', args=[self.old_order.pk]))
+
+
+class DerivedRowsAdminTests(TestCase):
+    """Итоги и журналы в админке только для чтения, но уходят каскадом вместе с владельцем"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin_test', password='x', role='admin')
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.employee = Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier')
+        started = timezone.make_aware(datetime(2026, 4, 13, 9, 0))
+        Timesheet.clock_in(self.employee, at=started)
+        self.shift = Timesheet.clock_out(self.employee, at=started + timedelta(hours=9))
+
+    def _admin_url(self, obj, action):
+        return reverse(f'admin:nemo_park_{obj._meta.model_name}_{action}', args=[obj.pk])
+
+    def test_shifts_are_read_only(self):
+        accrual = PayrollAccrual.objects.get()
+        for obj in (self.shift, accrual):
+            self.assertEqual(self.client.get(self._admin_url(obj, 'delete')).status_code, 403)
+            response = self.client.post(self._admin_url(obj, 'change'), {})
+            self.assertEqual(response.status_code, 403)
+        self.assertTrue(PayrollAccrual.objects.filter(pk=accrual.pk).exists())
+
+    def _payroll(self):
+        payroll = Payroll.objects.create(employee=self.employee, period_start=date(2026, 4, 1),
+                                         period_end=date(2026, 4, 30), gross_salary=Decimal('1000'))
+        Ledger.record_created([payroll])
+
+    def test_payroll_ledger_is_read_only(self):
+        self._payroll()
+        row = PayrollLedger.objects.filter(employee=None, period=None).get()
+        self.assertEqual(self.client.get(self._admin_url(row, 'delete')).status_code, 403)
+        self.client.post(reverse('admin:nemo_park_payrollledger_changelist'),
+                         {'action': 'delete_selected', '_selected_action': [row.pk], 'post': 'yes'})
+        self.assertTrue(PayrollLedger.objects.filter(pk=row.pk).exists())
+
+    def test_product_sales_rollup_is_read_only(self):
+        popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        sell_order(self.admin, [(popcorn, 2)])
+        row = ProductSalesRollup.objects.get()
+        self.assertEqual(self.client.get(self._admin_url(row, 'delete')).status_code, 403)
+        response = self.client.post(self._admin_url(popcorn, 'delete'), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ProductSalesRollup.objects.exists())
+
+    def test_sales_hour_is_read_only(self):
+        SalesSeries.record('ticket', self.admin.pk, timezone.now(), Decimal('1500'))
+        row = SalesHour.objects.get()
+        self.assertEqual(self.client.get(self._admin_url(row, 'delete')).status_code, 403)
+        self.client.post(reverse('admin:nemo_park_saleshour_changelist'),
+                         {'action': 'delete_selected', '_selected_action': [row.pk], 'post': 'yes'})
+        self.assertTrue(SalesHour.objects.filter(pk=row.pk).exists())
+
+    def test_visitor_profile_is_read_only(self):
+        visitor = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                         email='olga@example.com', phone='+79161234567')
+        popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        sell_order(self.admin, [(popcorn, 2)], visitor)
+        profile = VisitorProfile.objects.get()
+        favourite = VisitorProduct.objects.get()
+        for obj in (profile, favourite):
+            self.assertEqual(self.client.get(self._admin_url(obj, 'delete')).status_code, 403)
+
+        response = self.client.post(self._admin_url(visitor, 'delete'), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(VisitorProfile.objects.exists())
+        self.assertFalse(ProductSalesRollup.objects.exclude(quantity=0).exists())
+
+    @override_settings(LOYALTY_SETTLE_SECONDS=0)
+    def test_loyalty_ledger_is_append_only(self):
+        visitor = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                         email='olga@example.com', phone='+79161234567')
+        popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        sell_order(self.admin, [(popcorn, 2)], visitor)
+        LoyaltyLedger.compact()
+        for obj in (LoyaltyEvent.objects.get(), LoyaltyBalance.objects.get(), LoyaltyCompaction.objects.get()):
+            self.assertEqual(self.client.get(self._admin_url(obj, 'delete')).status_code, 403)
+
+        response = self.client.post(self._admin_url(visitor, 'delete'), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(LoyaltyEvent.objects.exists())
+        self.assertFalse(LoyaltyBalance.objects.exists())
+
+    def test_employee_delete_cascades(self):
+        self._payroll()
+        response = self.client.post(self._admin_url(self.employee, 'delete'), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Employee.objects.exists())
+        self.assertFalse(PayrollAccrual.objects.exists())
+        self.assertEqual(Ledger.discrepancies(), [])
+
+
+class ProductionCalendarTests(TestCase):
+    """Рабочие дни по календарю: праздники и перенесённые рабочие субботы"""
+
+    def setUp(self):
+        ProductionCalendar.invalidate()
+        self.addCleanup(ProductionCalendar.invalidate)
+        self.five_days = compile_schedule('09:00', '18:00', 60, '1,2,3,4,5')
+        self.mon_wed_fri = compile_schedule('09:00', '18:00', 60, '1,3,5')
+        # Выходной со вторника 29.12 перенесён на субботу 26.12
+        Holiday.objects.create(date=date(2026, 12, 29), name='Перенос', pay_multiplier=Decimal('2'))
+        Holiday.objects.create(date=date(2026, 12, 26), kind=Holiday.WORKDAY, moved_to=date(2026, 12, 29))
+
+    def _count(self, schedule, start, end, follows_calendar=True):
+        return ProductionCalendar.count_work_days(schedule, start, end, follows_calendar)
+
+    def test_transferred_workday_only_for_schedules_working_that_weekday(self):
+        start, end = date(2026, 12, 21), date(2026, 12, 31)
+        self.assertEqual(self._count(self.five_days, start, end), 9)
+        # Во вторник не работает: ничего не теряет и субботу не отрабатывает
+        self.assertEqual(self._count(self.mon_wed_fri, start, end), 5)
+        self.assertEqual(self._count(self.five_days, start, end, follows_calendar=False), 9)
+        self.assertEqual(ProductionCalendar.holiday_work_days(self.five_days, start, end), ((1, 200),))
+        self.assertEqual(ProductionCalendar.holiday_work_days(self.mon_wed_fri, start, end), ())
+
+    def test_workday_without_transfer_date_applies_to_all(self):
+        Holiday.objects.create(date=date(2026, 12, 19), kind=Holiday.WORKDAY)
+        start, end = date(2026, 12, 14), date(2026, 12, 20)
+        self.assertEqual(self._count(self.five_days, start, end), 6)
+        self.assertEqual(self._count(self.mon_wed_fri, start, end), 4)
+
+    def test_counts_match_day_by_day(self):
+        start, end = date(2026, 1, 1), date(2026, 12, 31)
+        for schedule in (self.five_days, self.mon_wed_fri):
+            calendar = ProductionCalendar.get_year(2026)
+            expected = 0
+            day = start
+            while day <= end:
+                works = schedule.works_on(day) and day != date(2026, 12, 29)
+                works = works or (day == date(2026, 12, 26) and schedule.works_on(date(2026, 12, 29)))
+                expected += works
+                day += timedelta(days=1)
+            self.assertEqual(self._count(schedule, start, end), expected)
+            self.assertEqual(calendar.schedule_bits(schedule.mask, True).bit_count(), expected)
+
+    def test_saving_holiday_drops_compiled_year(self):
+        start, end = date(2026, 12, 21), date(2026, 12, 31)
+        self.assertEqual(self._count(self.five_days, start, end), 9)
+        Holiday.objects.create(date=date(2026, 12, 31), name='Новый год')
+        self.assertEqual(self._count(self.five_days, start, end), 8)
+
+
+class PayrollSimulatorTests(TestCase):
+    """Моделирование ФОТ: совпадение с расчётом по сотрудникам, сценарии и кэш"""
+
+    def setUp(self):
+        PayrollSimulator.invalidate()
+        ProductionCalendar.invalidate()
+        self.addCleanup(PayrollSimulator.invalidate)
+        self.addCleanup(ProductionCalendar.invalidate)
+        self.staff = [
+            Employee.objects.create(first_name='Иван', last_name=name, position='cashier',
+                                    hourly_rate=Decimal('200'))
+            for name in ('Петров', 'Сидоров')
+        ]
+        self.staff.append(Employee.objects.create(first_name='Анна', last_name='Смирнова', position='admin',
+                                                  hourly_rate=Decimal('350'), work_days='1,2,3,4,5,6',
+                                                  follows_calendar=False))
+        Holiday.objects.create(date=date(2026, 6, 12), name='День России')
+        self.first_month = date(2026, 5, 1)
+
+    def test_baseline_matches_payroll_calculator(self):
+        result = PayrollSimulator(self.first_month, months=2).run(BASELINE)
+        self.assertEqual(result.employees, 3)
+        for month in result.months:
+            month_end = (month.month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            payslips = [PayrollCalculator(employee, month.month, month_end).calculate() for employee in self.staff]
+            self.assertEqual(month.gross, sum(payslip.gross_salary for payslip in payslips))
+            self.assertEqual(month.net, sum(payslip.net_salary for payslip in payslips))
+        self.assertEqual(result.gross, sum(month.gross for month in result.months))
+
+    def test_scenario_changes_only_its_position(self):
+        simulator = PayrollSimulator(self.first_month, months=1)
+        baseline, raised = simulator.compare([make_scenario('Кассирам +50%', rate_multipliers={'cashier': '1.5'})])
+        self.assertEqual(raised.by_position['admin'], baseline.by_position['admin'])
+        self.assertEqual(raised.by_position['cashier'], baseline.by_position['cashier'] * Decimal('1.5'))
+
+    def test_results_cached_until_calendar_changes(self):
+        simulator = PayrollSimulator(self.first_month, months=2)
+        first = simulator.run(BASELINE)
+        with self.assertNumQueries(0):
+            self.assertEqual(simulator.run(BASELINE._replace(name='Другое имя')).gross, first.gross)
+        Holiday.objects.create(date=date(2026, 5, 4), name='Выходной')
+        self.assertNotEqual(simulator.run(BASELINE).gross, first.gross)
+
+    def test_make_scenario_validates_input(self):
+        for kwargs in ({'rate_multipliers': {'pilot': 2}}, {'rate_multipliers': {'admin': 'много'}},
+                       {'work_days': {'admin': '1,9'}}, {'ndfl_rate': '1.3'}):
+            with self.assertRaises(SimulationError):
+                make_scenario('Ошибка', **kwargs)
+        scenario = make_scenario('', rate_multipliers={'admin': 1}, work_days={'admin': '3,1,1'})
+        self.assertEqual((scenario.name, scenario.rate_multipliers, scenario.work_days),
+                         ('Сценарий', (), (('admin', '1,3'),)))
+
+
+class PayrollLedgerTests(TestCase):
+    """Книга итогов листов совпадает с агрегатом по самим листам"""
+
+    def setUp(self):
+        self.employees = [
+            Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier'),
+            Employee.objects.create(first_name='Анна', last_name='Смирнова', position='admin'),
+        ]
+
+    def test_rollups_follow_changes(self):
+        first, second = self.employees
+        january, february = date(2026, 1, 1), date(2026, 2, 1)
+        a = make_payroll(first, january, '10000.00')
+        b = make_payroll(first, february, '12000.50')
+        c = make_payroll(second, january, '30000.00')
+        self.assertEqual(Ledger.totals('draft').count, 3)
+        self.assertEqual(Ledger.totals('draft').gross, Decimal('52000.50'))
+
+        Ledger.transition(a, 'paid')
+        self.assertEqual(Ledger.totals('paid', employee=first).gross, Decimal('10000.00'))
+        self.assertEqual(Ledger.totals('draft', employee=first).gross, Decimal('12000.50'))
+        self.assertEqual(Ledger.totals('draft', period=january).gross, Decimal('30000.00'))
+
+        moved = Ledger.bulk_transition(Payroll.objects.all(), 'confirmed')
+        # Выплаченный лист обратно в «подтверждён» не переходит
+        self.assertEqual(moved.count, 2)
+        self.assertEqual(Ledger.status_counts(), {'draft': 0, 'confirmed': 2, 'paid': 1})
+
+        Ledger.delete(Payroll.objects.filter(pk__in=[b.pk, c.pk]))
+        self.assertEqual(Ledger.totals('confirmed').count, 0)
+        self.assertEqual(Ledger.totals('paid').net, a.net_salary)
+        self.assertEqual(Ledger.discrepancies(), [])
+
+    def test_one_row_per_null_key(self):
+        for gross in ('1000.00', '2000.00', '3000.00'):
+            make_payroll(self.employees[0], date(2026, 3, 1), gross)
+        self.assertEqual(PayrollLedger.objects.filter(employee=None, period=None, status='draft').count(), 1)
+        self.assertEqual(PayrollLedger.objects.filter(employee=None, period=date(2026, 3, 1)).count(), 1)
+        self.assertEqual(PayrollLedger.objects.filter(employee=self.employees[0], period=None).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PayrollLedger.objects.create(employee=None, period=None, status='draft')
+
+
+class PayrollBulkStatusTests(TestCase):
+    """Массовое подтверждение и выплата листов за период или по выбору"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('bulk_admin', password='x', role='admin')
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.employee = Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier')
+        self.draft = make_payroll(self.employee, date(2026, 3, 1), '10000.00')
+        self.confirmed = make_payroll(self.employee, date(2026, 3, 16), '12000.00', status='confirmed')
+        self.paid = make_payroll(self.employee, date(2026, 2, 16), '9000.00', status='paid')
+        self.april = make_payroll(self.employee, date(2026, 4, 1), '11000.00')
+
+    def _post(self, **data):
+        return self.client.post(reverse('payroll_bulk_status'), data)
+
+    def _statuses(self):
+        return dict(Payroll.objects.values_list('pk', 'status'))
+
+    def test_pay_period(self):
+        self._post(action='pay_period', period_start='2026-02-01', period_end='2026-03-31')
+        self.assertEqual(self._statuses(), {self.draft.pk: 'paid', self.confirmed.pk: 'paid',
+                                            self.paid.pk: 'paid', self.april.pk: 'draft'})
+        self.assertFalse(Payroll.objects.filter(status='paid', paid_at=None).exists())
+        self.assertEqual(Ledger.totals('paid').count, 3)
+        self.assertEqual(Ledger.discrepancies(), [])
+
+    def test_confirm_selected_skips_paid(self):
+        self._post(action='confirm_selected', payroll_ids=[self.draft.pk, self.paid.pk])
+        self.assertEqual(self._statuses()[self.draft.pk], 'confirmed')
+        self.assertEqual(self._statuses()[self.paid.pk], 'paid')
+        self.assertEqual(Ledger.status_counts(), {'draft': 1, 'confirmed': 2, 'paid': 1})
+
+    def test_queries_do_not_grow_with_payrolls(self):
+        def pay(month):
+            with CaptureQueriesContext(connection) as queries:
+                moved = Ledger.bulk_transition(Payroll.objects.filter(period_start__month=month), 'paid')
+            return moved.count, len(queries)
+
+        for day in range(2, 12):
+            make_payroll(self.employee, date(2026, 5, day), '1000.00')
+        single_count, single_queries = pay(4)
+        many_count, many_queries = pay(5)
+        self.assertEqual((single_count, many_count), (1, 10))
+        self.assertEqual(many_queries, single_queries)
+
+    def test_cashier_cannot_change_status(self):
+        cashier = CustomUser.objects.create_user('bulk_cashier', password='x', role='cashier')
+        self.client.force_login(cashier)
+        self._post(action='pay_period', period_start='2026-01-01', period_end='2026-12-31')
+        self.assertEqual(Ledger.totals('paid').count, 1)
+
+
+class PayrollRecalculatorTests(TestCase):
+    """Пересчёт черновиков после изменения ставки или графика"""
+
+    def setUp(self):
+        ProductionCalendar.invalidate()
+        self.addCleanup(ProductionCalendar.invalidate)
+        self.employee = Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier',
+                                                hourly_rate=Decimal('200'))
+        self.draft = self._payroll(date(2026, 3, 1), date(2026, 3, 31))
+        self.confirmed = self._payroll(date(2026, 2, 1), date(2026, 2, 28), status='confirmed')
+
+    def _payroll(self, start, end, status='draft'):
+        payroll = PayrollCalculator(self.employee, start, end).calculate().to_payroll()
+        payroll.status = status
+        with transaction.atomic():
+            payroll.save()
+            Ledger.record_created([payroll])
+        return payroll
+
+    def _change(self, **fields):
+        for name, value in fields.items():
+            setattr(self.employee, name, value)
+        self.employee.save()
+        return PayrollRecalculator.mark_stale(self.employee, fields)
+
+    def test_only_pay_fields_mark_drafts(self):
+        self.assertEqual(self._change(phone='+79160000000'), 0)
+        self.assertEqual(self._change(hourly_rate=Decimal('300')), 1)
+        self.assertEqual(PayrollRecalculator.stale_count(), 1)
+        self.confirmed.refresh_from_db()
+        self.assertFalse(self.confirmed.is_stale)
+
+    def test_recompute_updates_drafts_and_ledger(self):
+        confirmed_gross = self.confirmed.gross_salary
+        self._change(hourly_rate=Decimal('300'), work_days='1,2,3')
+        with self.captureOnCommitCallbacks(execute=True):
+            PayrollRecalculator.recompute_on_commit([self.employee.pk])
+
+        self.draft.refresh_from_db()
+        expected = PayrollCalculator(self.employee, self.draft.period_start, self.draft.period_end).calculate()
+        self.assertFalse(self.draft.is_stale)
+        self.assertEqual((self.draft.work_days, self.draft.gross_salary, self.draft.net_salary),
+                         (expected.work_days, expected.gross_salary, expected.net_salary))
+        self.confirmed.refresh_from_db()
+        self.assertEqual(self.confirmed.gross_salary, confirmed_gross)
+        self.assertEqual(Ledger.discrepancies(), [])
+        # Повторный пересчёт ничего не делает
+        self.assertEqual(PayrollRecalculator.recompute(), 0)
+
+
+class PayslipRendererTests(TestCase):
+    """Расчётные листы файлами: кэш по хешу содержимого и архив по месяцам"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.renderer = PayslipRenderer('html', directory=directory.name)
+        employee = Employee.objects.create(first_name='Иван', last_name='Петров', position='cashier')
+        self.march = make_payroll(employee, date(2026, 3, 1), '10000.00')
+        self.april = make_payroll(employee, date(2026, 4, 1), '12000.00')
+
+    def test_renders_once_and_reuses_files(self):
+        payslips = self.renderer.render(Payroll.objects.all())
+        self.assertEqual([payslip.payroll_id for payslip in payslips], [self.march.pk, self.april.pk])
+        self.assertIn('Петров', payslips[0].path.read_text(encoding='utf-8'))
+
+        rendered, missing = self.renderer.collect(Payroll.objects.all())
+        self.assertEqual((rendered, missing), (payslips, []))
+        with mock.patch.object(PayslipRenderer, '_render_missing') as render_missing:
+            self.renderer.render(Payroll.objects.all())
+        render_missing.assert_not_called()
+
+    def test_changed_payroll_is_rendered_again(self):
+        old = self.renderer.render(Payroll.objects.filter(pk=self.march.pk))[0]
+        Payroll.objects.filter(pk=self.march.pk).update(bonus=Decimal('500'))
+        new = self.renderer.render(Payroll.objects.filter(pk=self.march.pk))[0]
+        self.assertNotEqual(new.path, old.path)
+        self.assertFalse(old.path.exists())
+        self.assertEqual(list(self.renderer.directory.glob(f'{self.march.pk}-*')), [new.path])
+
+    def test_zip_groups_by_month(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.renderer.zip(self.renderer.render(Payroll.objects.all()))))
+        self.assertEqual(archive.namelist(), [f'2026-03/Иван_Петров_{self.march.pk}.html',
+                                              f'2026-04/Иван_Петров_{self.april.pk}.html'])
+
+    def test_pdf_needs_weasyprint(self):
+        with mock.patch('nemo_park.services.payslip_service.HTML', None), self.assertRaises(ValueError):
+            PayslipRenderer('pdf')
+        with self.assertRaises(ValueError):
+            PayslipRenderer('docx')
+
+
+class SalesHourTests(TestCase):
+    """Почасовой ряд: прибавление, вычитание и строки без кассира"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('cashier_test', password='x', role='cashier')
+        self.moment = timezone.make_aware(datetime(2026, 5, 4, 14, 20))
+
+    def test_record_and_subtract(self):
+        SalesSeries.record('order', self.cashier.pk, self.moment, Decimal('350.00'))
+        SalesSeries.record('order', self.cashier.pk, self.moment + timedelta(minutes=30), Decimal('150.00'))
+        SalesSeries.record('order', self.cashier.pk, self.moment, Decimal('150.00'), sign=-1)
+        row = SalesHour.objects.get(channel='order', cashier=self.cashier)
+        self.assertEqual((row.day, row.hour), (date(2026, 5, 4), 14))
+        self.assertEqual((row.count, row.revenue), (1, Decimal('350.00')))
+
+    def test_null_cashier_row_is_shared(self):
+        for _ in range(3):
+            SalesSeries.record('ticket', None, self.moment, Decimal('500.00'))
+        row = SalesHour.objects.get(channel='ticket', cashier=None)
+        self.assertEqual((row.count, row.revenue), (3, Decimal('1500.00')))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SalesHour.objects.create(day=row.day, hour=row.hour, channel='ticket', cashier=None)
+
+    def test_rebuild_matches_recorded(self):
+        order = Order.objects.create(cashier=self.cashier, total_price=Decimal('420.00'))
+        SalesSeries.record_order(order)
+        recorded = list(SalesHour.objects.values_list('day', 'hour', 'channel', 'cashier', 'count', 'revenue'))
+        SalesSeries.rebuild()
+        rebuilt = list(SalesHour.objects.values_list('day', 'hour', 'channel', 'cashier', 'count', 'revenue'))
+        self.assertEqual(rebuilt, recorded)
+
+
+class CashierLeaderboardTests(TestCase):
+    """Рейтинг кассиров: период из счётчиков, «сегодня» — из памяти"""
+
+    def setUp(self):
+        CashierLeaderboard.invalidate()
+        self.addCleanup(CashierLeaderboard.invalidate)
+        employee = Employee.objects.create(first_name='Анна', last_name='Смирнова', position='cashier')
+        self.anna = CustomUser.objects.create_user('anna', password='x', role='cashier', employee_profile=employee)
+        self.boris = CustomUser.objects.create_user('boris', password='x', role='cashier')
+        self.visitor = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                              email='olga@example.com', phone='+79161234567')
+
+    def _hour(self, cashier, day, channel, count, revenue):
+        SalesHour.objects.create(day=day, hour=12, channel=channel, cashier=cashier,
+                                 count=count, revenue=Decimal(revenue))
+
+    def test_period_ranking(self):
+        day = date(2026, 5, 4)
+        self._hour(self.anna, day, 'ticket', 2, '3000.00')
+        self._hour(self.boris, day, 'order', 10, '4000.00')
+        self._hour(self.boris, day + timedelta(days=1), 'ticket', 1, '1500.00')
+        self._hour(None, day, 'ticket', 5, '9000.00')
+
+        ranking = CashierLeaderboard.ranking(day, day)
+        self.assertEqual([(stat.username, stat.revenue) for stat in ranking],
+                         [('boris', Decimal('4000.00')), ('anna', Decimal('3000.00'))])
+        self.assertEqual(ranking[1].name, 'Анна Смирнова')
+
+        ranking = CashierLeaderboard.ranking(day, day + timedelta(days=1), order_by='average_basket', limit=1)
+        self.assertEqual([(stat.username, stat.average_basket) for stat in ranking], [('anna', Decimal('1500.00'))])
+
+    def test_today_follows_committed_sales(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sell_ticket(self.anna, self.visitor)
+        self.assertEqual([stat.username for stat in CashierLeaderboard.today()], ['anna'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = sell_ticket(self.boris, self.visitor, ticket_type='vip')
+        with self.assertNumQueries(0):
+            ranking = CashierLeaderboard.today()
+        self.assertEqual([stat.username for stat in ranking], ['boris', 'anna'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesSeries.record_ticket(ticket, sign=-1)
+        self.assertEqual([stat.username for stat in CashierLeaderboard.today()], ['anna'])
+        # То же, что перечитанное из счётчиков
+        today = timezone.localdate()
+        live = CashierLeaderboard.today()
+        CashierLeaderboard.invalidate()
+        self.assertEqual(CashierLeaderboard.ranking(today, today), live)
+
+
+class SalesAnalyticsTests(TestCase):
+    """Дневные корзины аналитики: досчёт пропусков, срок жизни и предел кэша"""
+
+    def setUp(self):
+        SalesAnalytics.invalidate()
+        self.addCleanup(SalesAnalytics.invalidate)
+        self.cashier = CustomUser.objects.create_user('analytics_test', password='x', role='cashier')
+        self.day = date(2026, 5, 4)
+
+    def _sale(self, day, channel='ticket', revenue='500.00', hour=12):
+        # Напрямую, мимо SalesSeries.record: кэш не узнаёт о продаже
+        SalesHour.objects.create(day=day, hour=hour, channel=channel, cashier=self.cashier,
+                                 count=1, revenue=Decimal(revenue))
+
+    def test_loads_only_missing_days(self):
+        self._sale(self.day)
+        self._sale(self.day + timedelta(days=2), channel='order', revenue='350.00')
+        with self.assertNumQueries(1):
+            days = SalesAnalytics.days(self.day, self.day + timedelta(days=2))
+        self.assertEqual([(bucket.tickets, bucket.orders) for bucket in days], [(1, 0), (0, 0), (0, 1)])
+        with self.assertNumQueries(0):
+            SalesAnalytics.days(self.day + timedelta(days=1), self.day + timedelta(days=2))
+        # Расширение периода с двух сторон — один агрегат на два отрезка
+        with self.assertNumQueries(1):
+            days = SalesAnalytics.days(self.day - timedelta(days=1), self.day + timedelta(days=3))
+        self.assertEqual(len(days), 5)
+
+    def test_cache_expires_after_ttl(self):
+        self._sale(self.day)
+        SalesAnalytics.days(self.day, self.day)
+        self._sale(self.day, hour=13)
+        self.assertEqual(SalesAnalytics.summary(self.day, self.day).tickets, 1)
+        with mock.patch.object(SalesAnalytics, 'BUCKET_TTL', -1):
+            self.assertEqual(SalesAnalytics.summary(self.day, self.day).tickets, 2)
+
+    def test_cache_is_capped(self):
+        with mock.patch.object(SalesAnalytics, 'MAX_CACHED_BUCKETS', 5):
+            SalesAnalytics.days(self.day, self.day + timedelta(days=2))
+            SalesAnalytics.days(self.day, self.day + timedelta(days=2), cashier_id=self.cashier.pk)
+            self.assertEqual(SalesAnalytics._size, 3)
+            self.assertEqual(sum(map(len, SalesAnalytics._buckets.values())), 3)
+            with self.assertNumQueries(1):
+                SalesAnalytics.days(self.day, self.day)
+
+    def test_today_is_not_cached(self):
+        today = timezone.localdate()
+        SalesAnalytics.days(today - timedelta(days=1), today)
+        self._sale(today)
+        self.assertEqual(SalesAnalytics.summary(today, today).tickets, 1)
+
+    def test_compare_with_previous_period(self):
+        self._sale(self.day, revenue='600.00')
+        self._sale(self.day - timedelta(days=2), revenue='400.00')
+        comparison = SalesAnalytics.compare(self.day - timedelta(days=1), self.day, 'previous')
+        self.assertEqual(comparison.previous.start, self.day - timedelta(days=3))
+        self.assertEqual((comparison.current.revenue, comparison.previous.revenue),
+                         (Decimal('600.00'), Decimal('400.00')))
+        self.assertEqual(comparison.changes['revenue'], Decimal('50.0'))
+        self.assertEqual([row.previous.day for row in comparison.rows],
+                         [self.day - timedelta(days=3), self.day - timedelta(days=2)])
+
+
+class StockTests(TestCase):
+    """Условное списание остатков"""
+
+    def setUp(self):
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'), stock=5)
+        self.cola = Product.objects.create(name='Кола', category='drink', price=Decimal('150'), stock=1)
+        self.coffee = Product.objects.create(name='Кофе', category='drink', price=Decimal('180'))
+
+    def _stock(self, product):
+        product.refresh_from_db()
+        return product.stock, product.is_available
+
+    def test_take_decrements_and_hides_sold_out(self):
+        Stock.take({self.popcorn.pk: 2, self.cola.pk: 1, self.coffee.pk: 10})
+        self.assertEqual(self._stock(self.popcorn), (3, True))
+        self.assertEqual(self._stock(self.cola), (0, False))
+        # Без остатка товар не учитывается
+        self.assertEqual(self._stock(self.coffee), (None, True))
+
+    def test_shortage_changes_nothing(self):
+        with self.assertRaises(OutOfStock) as raised, transaction.atomic():
+            Stock.take({self.popcorn.pk: 2, self.cola.pk: 3})
+        self.assertEqual([shortage.product_id for shortage in raised.exception.shortages], [self.cola.pk])
+        self.assertEqual(raised.exception.shortages[0].left, 1)
+        self.assertEqual(self._stock(self.popcorn), (5, True))
+        self.assertEqual(self._stock(self.cola), (1, True))
+
+    def test_give_back_returns_to_sale(self):
+        Stock.take({self.cola.pk: 1})
+        Stock.give_back({self.cola.pk: 1, self.coffee.pk: 1})
+        self.assertEqual(self._stock(self.cola), (1, True))
+        self.assertEqual(self._stock(self.coffee), (None, True))
+
+    def test_quantities_rejects_non_positive(self):
+        self.assertEqual(Stock.quantities([(1, 2), (1, 3), (2, 1)]), {1: 5, 2: 1})
+        with self.assertRaises(ValueError):
+            Stock.quantities([(1, 0)])
+
+
+class OrderStatusTests(TestCase):
+    """Смена статуса заказа на кассе: отмена возвращает остатки ровно один раз"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('status_test', password='x', role='cashier')
+        self.client = Client()
+        self.client.force_login(self.cashier)
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'), stock=5)
+        self.order = sell_order(self.cashier, [(self.popcorn, 2)])
+
+    def _set_status(self, status):
+        self.client.post(reverse('update_order_status', args=[self.order.pk]), {'status': status})
+        self.popcorn.refresh_from_db()
+        return self.popcorn.stock, ProductSalesRollup.objects.get().quantity
+
+    def test_cancel_twice_gives_back_once(self):
+        self.assertEqual(self._set_status('cancelled'), (5, 0))
+        self.assertEqual(self._set_status('cancelled'), (5, 0))
+        self.assertEqual(self._set_status('pending'), (3, 2))
+
+    def test_uncancel_without_stock_keeps_order_cancelled(self):
+        self._set_status('cancelled')
+        Stock.restock(counted={self.popcorn.pk: 1})
+        self.assertEqual(self._set_status('pending'), (1, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+
+
+class BillOfMaterialsTests(SimpleTestCase):
+    """Развёртывание состава комбо"""
+
+    def test_nested_quantities_multiply(self):
+        # Комбо 1 = 2 × комбо 2 + товар 3; комбо 2 = 3 × товар 4
+        components = {1: [(2, 2), (3, 1)], 2: [(4, 3)]}
+        recipes = {3: [(10, Decimal('0.5'))], 4: [(11, Decimal('0.2'))]}
+        flat = BillOfMaterials.flatten(components, recipes)
+        self.assertEqual(flat[1].products, {2: 2, 3: 1, 4: 6})
+        self.assertEqual(flat[1].ingredients, {10: Decimal('0.5'), 11: Decimal('1.2')})
+        self.assertEqual(flat[2].products, {4: 3})
+
+    def test_cycle_detected(self):
+        with self.assertRaises(BomCycleError):
+            BillOfMaterials.flatten({1: [(1, 1)]}, {})
+        with self.assertRaises(BomCycleError):
+            BillOfMaterials.flatten({1: [(2, 1)], 2: [(3, 1)], 3: [(1, 2)]}, {})
+
+    def test_shared_component_is_not_a_cycle(self):
+        flat = BillOfMaterials.flatten({1: [(3, 1), (2, 1)], 2: [(3, 2)]}, {})
+        self.assertEqual(flat[1].products, {2: 1, 3: 3})
+
+
+@override_settings(KITCHEN_COOKS=1)
+class KitchenQueueTests(TestCase):
+    """Позиция и время готовности заказа в очереди кухни"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('kitchen_test', password='x', role='cashier')
+        self.burger = Product.objects.create(name='Бургер', category='burger', price=Decimal('300'), prep_minutes=10)
+        self.fries = Product.objects.create(name='Картофель', category='snack', price=Decimal('150'), prep_minutes=4)
+        # Очередь — состояние класса: каждый тест собирает её заново
+        self.addCleanup(setattr, KitchenQueue, '_loaded_at', None)
+
+    def _order(self, items, status='pending', is_rush=False, started_at=None):
+        order = Order.objects.create(cashier=self.cashier, status=status, is_rush=is_rush, started_at=started_at)
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        return order
+
+    def test_lanes_and_positions(self):
+        first = self._order([(self.burger, 1)])
+        second = self._order([(self.fries, 2)])
+        rush = self._order([(self.fries, 1)], is_rush=True)
+        KitchenQueue.rebuild()
+
+        self.assertEqual(KitchenQueue.eta(rush.pk)[:5], (rush.pk, 'rush', 1, 0, 4))
+        self.assertEqual(KitchenQueue.eta(first.pk)[:5], (first.pk, 'normal', 2, 4, 10))
+        self.assertEqual(KitchenQueue.eta(second.pk)[:5], (second.pk, 'normal', 3, 14, 8))
+        self.assertEqual(KitchenQueue.summary(), {'preparing': 0, 'rush': 1, 'normal': 2})
+
+    def test_preparing_goes_first_and_removal_moves_queue(self):
+        waiting = self._order([(self.burger, 1)])
+        started_at = timezone.now() - timedelta(minutes=4)
+        cooking = self._order([(self.burger, 1)], status='preparing', started_at=started_at)
+        KitchenQueue.rebuild()
+
+        eta = KitchenQueue.eta(cooking.pk)
+        self.assertEqual((eta.lane, eta.position), ('preparing', 1))
+        self.assertEqual(eta.eta, started_at + timedelta(minutes=10))
+        eta = KitchenQueue.eta(waiting.pk)
+        self.assertEqual((eta.position, eta.minutes_ahead), (2, 6))
+
+        KitchenQueue.remove(cooking.pk)
+        self.assertIsNone(KitchenQueue.eta(cooking.pk))
+        self.assertEqual(KitchenQueue.eta(waiting.pk)[2:4], (1, 0))
+
+    def test_combo_cooks_its_components(self):
+        combo = Product.objects.create(name='Комбо', category='combo', price=Decimal('400'), prep_minutes=0,
+                                       bom={'products': [[self.burger.pk, 1], [self.fries.pk, 1]], 'ingredients': []})
+        order = self._order([(combo, 2)])
+        KitchenQueue.rebuild()
+        self.assertEqual(KitchenQueue.eta(order.pk).minutes, 2 * (10 + 4))
+
+
+class ProductSalesTests(TestCase):
+    """Топ товаров, категории и тепловая карта по итогам продаж"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('products_test', password='x', role='cashier')
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        self.cola = Product.objects.create(name='Кола', category='drink', price=Decimal('150'))
+        self.pizza = Product.objects.create(name='Пицца', category='pizza', price=Decimal('700'))
+        sell_order(self.cashier, [(self.popcorn, 1), (self.cola, 3)])
+        self.order = sell_order(self.cashier, [(self.cola, 2), (self.pizza, 1)])
+        self.today = timezone.localdate()
+
+    def test_top_products_by_quantity_and_revenue(self):
+        top = ProductSales.top_products(self.today, self.today)
+        self.assertEqual([(stat.name, stat.quantity) for stat in top], [('Кола', 5), ('Пицца', 1), ('Попкорн', 1)])
+        top = ProductSales.top_products(self.today, self.today, limit=2, order_by='revenue')
+        self.assertEqual([(stat.name, stat.revenue) for stat in top],
+                         [('Кола', Decimal('750')), ('Пицца', Decimal('700'))])
+        top = ProductSales.top_products(self.today, self.today, category='drink')
+        self.assertEqual([stat.product_id for stat in top], [self.cola.pk])
+        self.assertEqual(ProductSales.top_products(self.today - timedelta(days=7), self.today - timedelta(days=1)), [])
+
+    def test_categories_and_heatmap(self):
+        categories = ProductSales.categories(self.today, self.today)
+        self.assertEqual([(stat.category, stat.revenue) for stat in categories],
+                         [('drink', Decimal('750')), ('pizza', Decimal('700')), ('snack', Decimal('250'))])
+        self.assertEqual(categories[0].share, Decimal('44.1'))
+
+        grid = ProductSales.heatmap(self.today, self.today, category='drink')
+        created = timezone.localtime(self.order.created_at)
+        self.assertEqual(grid[created.isoweekday() - 1][created.hour], 5)
+        self.assertEqual(sum(map(sum, grid)), 5)
+
+    def test_cancelled_orders_leave_top_and_rebuild_agrees(self):
+        order = sell_order(self.cashier, [(self.popcorn, 10)])
+        self.assertEqual(ProductSales.top_products(self.today, self.today, limit=1)[0].name, 'Попкорн')
+        order.status = 'cancelled'
+        order.save()
+        ProductSales.record_order(order, sign=-1)
+        self.assertEqual(ProductSales.top_products(self.today, self.today, limit=1)[0].name, 'Кола')
+
+        recorded = set(ProductSalesRollup.objects.filter(quantity__gt=0)
+                       .values_list('day', 'hour', 'product_id', 'quantity', 'revenue'))
+        ProductSales.rebuild()
+        rebuilt = set(ProductSalesRollup.objects.values_list('day', 'hour', 'product_id', 'quantity', 'revenue'))
+        self.assertEqual(rebuilt, recorded)
+
+
+class SalesRemovalTests(TestCase):
+    """Удаление продаж вычитает их из итогов; остатки возвращают только открытые заказы"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('removal_test', password='x', role='cashier')
+        self.visitor = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                              email='olga@example.com', phone='+79161234567')
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'), stock=10)
+
+    def _stock(self):
+        self.popcorn.refresh_from_db()
+        return self.popcorn.stock
+
+    def _sold(self):
+        return (
+            sum(ProductSalesRollup.objects.values_list('quantity', flat=True)),
+            sum(SalesHour.objects.filter(channel='order').values_list('count', flat=True)),
+        )
+
+    def test_open_order_returns_stock(self):
+        order = sell_order(self.cashier, [(self.popcorn, 3)], self.visitor)
+        self.assertEqual(self._stock(), 7)
+        SalesRemoval.delete_orders(Order.objects.filter(pk=order.pk))
+        self.assertEqual(self._stock(), 10)
+        self.assertEqual(self._sold(), (0, 0))
+
+    def test_delivered_order_keeps_stock(self):
+        order = sell_order(self.cashier, [(self.popcorn, 3)], self.visitor)
+        Order.objects.filter(pk=order.pk).update(status='delivered')
+        SalesRemoval.delete_orders(Order.objects.filter(pk=order.pk))
+        self.assertEqual(self._stock(), 7)
+        self.assertEqual(self._sold(), (0, 0))
+
+    def test_visitor_cascade(self):
+        delivered = sell_order(self.cashier, [(self.popcorn, 2)], self.visitor)
+        Order.objects.filter(pk=delivered.pk).update(status='delivered')
+        sell_order(self.cashier, [(self.popcorn, 1)], self.visitor)
+        sell_ticket(self.cashier, self.visitor)
+        SalesRemoval.delete_visitors(Visitor.objects.filter(pk=self.visitor.pk))
+        self.assertEqual(self._stock(), 8)
+        self.assertEqual(self._sold(), (0, 0))
+        self.assertFalse(SalesHour.objects.exclude(count=0).exists())
+
+    def test_cashier_rows_fold_into_rows_without_cashier(self):
+        moment = timezone.now()
+        SalesSeries.record('ticket', None, moment, Decimal('900.00'))
+        sell_ticket(self.cashier, self.visitor)
+        SalesRemoval.delete_users(CustomUser.objects.filter(pk=self.cashier.pk))
+        rows = list(SalesHour.objects.values_list('cashier', 'count', 'revenue'))
+        self.assertEqual(rows, [(None, 1, Decimal('900.00'))])
+        self.assertFalse(Ticket.objects.exists())
+
+
+class VisitorProfileTests(TestCase):
+    """Профили посетителей: визиты, траты, любимые товары и сегменты"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('profiles_test', password='x', role='cashier')
+        self.olga = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                           email='olga@example.com', phone='+79161234567')
+        self.petr = Visitor.objects.create(first_name='Пётр', last_name='Сидоров',
+                                           email='petr@example.com', phone='+79167654321')
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        self.cola = Product.objects.create(name='Кола', category='drink', price=Decimal('150'))
+        self.may, self.june = date(2026, 5, 1), date(2026, 6, 1)
+
+    def _profile(self, visitor):
+        return VisitorProfile.objects.values_list(
+            'visits', 'last_visit', 'tickets', 'orders', 'total_spend'
+        ).get(visitor=visitor)
+
+    def test_visits_are_days_with_tickets(self):
+        sell_ticket(self.cashier, self.olga, valid_date=self.may)
+        sell_ticket(self.cashier, self.olga, ticket_type='child', valid_date=self.may)
+        june = sell_ticket(self.cashier, self.olga, valid_date=self.june)
+        sell_order(self.cashier, [(self.popcorn, 1), (self.cola, 2)], visitor=self.olga)
+        self.assertEqual(self._profile(self.olga), (2, self.june, 3, 1, Decimal('4350.00')))
+
+        SalesRemoval.delete_tickets(Ticket.objects.filter(pk=june.pk))
+        self.assertEqual(self._profile(self.olga), (1, self.may, 2, 1, Decimal('2850.00')))
+        favourites = VisitorProfiles.favourites([self.olga.pk])[self.olga.pk]
+        self.assertEqual([(product.name, product.quantity) for product in favourites],
+                         [('Кола', 2), ('Попкорн', 1)])
+
+    def test_rebuild_matches_incremental(self):
+        sell_ticket(self.cashier, self.olga, valid_date=self.may)
+        sell_ticket(self.cashier, self.petr, ticket_type='vip', valid_date=self.june)
+        sell_order(self.cashier, [(self.cola, 3)], visitor=self.petr)
+        recorded = [self._profile(visitor) for visitor in (self.olga, self.petr)]
+        recorded_products = set(VisitorProduct.objects.values_list('visitor_id', 'product_id', 'quantity'))
+
+        self.assertEqual(VisitorProfiles.rebuild(), 2)
+        self.assertEqual([self._profile(visitor) for visitor in (self.olga, self.petr)], recorded)
+        self.assertEqual(set(VisitorProduct.objects.values_list('visitor_id', 'product_id', 'quantity')),
+                         recorded_products)
+
+    def test_segments(self):
+        for day in (self.may, self.may + timedelta(days=1), self.may + timedelta(days=2)):
+            sell_ticket(self.cashier, self.olga, valid_date=day)
+        sell_ticket(self.cashier, self.petr, ticket_type='vip', valid_date=self.june)
+
+        self.assertEqual([profile.visitor for profile in VisitorProfiles.top_spenders()], [self.petr, self.olga])
+        self.assertEqual([profile.visitor for profile in VisitorProfiles.regulars()], [self.olga])
+        lapsed = VisitorProfiles.lapsed(days=20, today=self.june)
+        self.assertEqual([profile.visitor for profile in lapsed], [self.olga])
+
+
+class VisitorDedupTests(TestCase):
+    """Поиск дублей по блокам и слияние посетителей"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('dedup_test', password='x', role='cashier')
+
+    def _visitor(self, first_name, last_name, phone, email):
+        return Visitor.objects.create(first_name=first_name, last_name=last_name, phone=phone, email=email)
+
+    def test_keys(self):
+        self.assertEqual(phone_key('8 (916) 123-45-67'), '79161234567')
+        self.assertEqual(phone_key('916 123 45 67'), '79161234567')
+        self.assertEqual(phone_key('12345'), '')
+        self.assertEqual(email_key(' Ivan.Petrov+park@GoogleMail.com'), 'ivanpetrov@gmail.com')
+        self.assertEqual(email_key('ivan.petrov@ya.ru'), 'ivan-petrov@yandex.ru')
+        self.assertEqual(name_key('Пётр', 'Семёнов-Тян'), ('семенов тян', 'петр'))
+
+    def test_blocks_limit_candidates(self):
+        rows = [
+            VisitorRow(1, ('петров', 'иван'), '79161234567', ''),
+            VisitorRow(2, ('смирнова', 'анна'), '79161234567', ''),
+            VisitorRow(3, ('петровский', 'игорь'), '', 'igor@example.com'),
+            VisitorRow(4, ('козлов', 'олег'), '', 'oleg@example.com'),
+        ]
+        pairs = {(a.id, b.id) for a, b in VisitorDeduplicator.candidate_pairs(rows)}
+        # Общий телефон и общий блок фамилии (пет/и); Козлов ни с кем не сравнивается
+        self.assertEqual(pairs, {(1, 2), (1, 3)})
+
+    def test_large_block_uses_window(self):
+        rows = [VisitorRow(i, ('иванов', f'иван{i:03d}'), '', '') for i in range(50)]
+        with mock.patch.multiple(VisitorDeduplicator, MAX_BLOCK=10, WINDOW=3):
+            pairs = VisitorDeduplicator.candidate_pairs(rows)
+        self.assertEqual(len(pairs), 47 * 3 + 2 + 1)
+        self.assertTrue(all(abs(a.id - b.id) <= 3 for a, b in pairs))
+
+    def test_run_finds_variants(self):
+        first = self._visitor('Иван', 'Петров', '+7 916 123-45-67', 'ivan@example.com')
+        second = self._visitor('Петров', 'Иван', '89161234567', 'petrov@example.com')
+        third = self._visitor('Игорь', 'Петров', '+7 916 123-45-68', 'igor@example.com')
+        self._visitor('Анна', 'Смирнова', '+7 903 000-00-00', 'ivan@example.org')
+        matches = VisitorDeduplicator().run()
+        self.assertEqual({(m.visitor_id, m.duplicate_id, m.reason) for m in matches}, {
+            (first.pk, second.pk, 'phone'),
+        })
+        self.assertEqual(VisitorDuplicate.objects.count(), 1)
+        self.assertNotIn(third.pk, {m.duplicate_id for m in matches})
+
+    @override_settings(LOYALTY_SETTLE_SECONDS=0)
+    def test_merge_appends_transfer_events(self):
+        visitor = self._visitor('Иван', 'Петров', '+7 916 123-45-67', 'ivan@example.com')
+        duplicate = self._visitor('Иван', 'Петров', '89161234567', 'ivan.p@example.com')
+        popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+        sell_order(self.cashier, [(popcorn, 2)], visitor)
+        moved = sell_order(self.cashier, [(popcorn, 4)], duplicate)
+        LoyaltyLedger.compact()
+        before = list(LoyaltyEvent.objects.filter(visitor=visitor).values_list('id', 'points'))
+
+        result = VisitorDeduplicator.merge(visitor, duplicate)
+        self.assertEqual(result.orders, 1)
+        self.assertEqual(LoyaltyLedger.balance(visitor.pk), 5 + 10)
+        # Старые события посетителя не переписаны, перенос — новыми событиями
+        self.assertEqual(list(LoyaltyEvent.objects.filter(visitor=visitor, kind='order').values_list('id', 'points')),
+                         before)
+        self.assertEqual(list(LoyaltyEvent.objects.filter(visitor=visitor, kind='merge').values_list(
+            'order_id', 'points')), [(moved.pk, 10)])
+        self.assertEqual(VisitorProfile.objects.get(visitor=visitor).orders, 2)
+
+        LoyaltyLedger.compact()
+        self.assertEqual(LoyaltyBalance.objects.get(visitor=visitor).points, 15)
+        # Удаление перенесённого заказа снимает баллы уже у посетителя
+        SalesRemoval.delete_orders(Order.objects.filter(pk=moved.pk))
+        self.assertEqual(LoyaltyLedger.balance(visitor.pk), 5)
+
+
+class LoyaltyLedgerTests(TestCase):
+    """Баллы лояльности: журнал без правок, граница свёртки и баланс по хвосту"""
+
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user('loyalty_test', password='x', role='cashier')
+        self.olga = Visitor.objects.create(first_name='Ольга', last_name='Иванова',
+                                           email='olga@example.com', phone='+79161234567')
+        self.petr = Visitor.objects.create(first_name='Пётр', last_name='Сидоров',
+                                           email='petr@example.com', phone='+79167654321')
+        self.popcorn = Product.objects.create(name='Попкорн', category='snack', price=Decimal('250'))
+
+    def _settle(self, *events):
+        """Сделать события старше LOYALTY_SETTLE_SECONDS"""
+        LoyaltyEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_cancel_is_idempotent(self):
+        order = sell_order(self.cashier, [(self.popcorn, 2)], visitor=self.olga)
+        self.assertEqual(LoyaltyLedger.balance(self.olga.pk), 5)
+        LoyaltyLedger.record_order(order, sign=-1)
+        LoyaltyLedger.record_order(order, sign=-1)
+        self.assertEqual(list(LoyaltyEvent.objects.order_by('id').values_list('kind', 'points')),
+                         [('order', 5), ('order', -5)])
+        self.assertEqual(LoyaltyLedger.balance(self.olga.pk), 0)
+
+    def test_compaction_stops_at_unsettled_events(self):
+        sell_order(self.cashier, [(self.popcorn, 2)], visitor=self.olga)
+        sell_order(self.cashier, [(self.popcorn, 4)], visitor=self.petr)
+        first, second = LoyaltyEvent.objects.order_by('id')
+        self.assertEqual(LoyaltyLedger.compact(), (0, 0, 0))
+
+        self._settle(first, second)
+        fresh = sell_order(self.cashier, [(self.popcorn, 8)], visitor=self.olga)
+        self.assertEqual(LoyaltyLedger.compact(), (second.pk, 2, 2))
+        self.assertEqual(LoyaltyBalance.objects.get(visitor=self.olga).points, 5)
+        # Несвёрнутое событие — в хвосте после границы
+        self.assertEqual(LoyaltyLedger.balances([self.olga.pk, self.petr.pk]),
+                         {self.olga.pk: 25, self.petr.pk: 10})
+        self.assertEqual(LoyaltyLedger.compact(), (second.pk, 0, 0))
+
+        SalesRemoval.delete_orders(Order.objects.filter(pk=fresh.pk))
+        with override_settings(LOYALTY_SETTLE_SECONDS=0):
+            result = LoyaltyLedger.compact()
+        self.assertEqual((result.events, result.visitors), (2, 1))
+        self.assertEqual(LoyaltyBalance.objects.get(visitor=self.olga).points, 5)
+        self.assertEqual(LoyaltyBalance.objects.get(visitor=self.olga).earned, 25)
+        self.assertEqual(list(LoyaltyCompaction.objects.order_by('id').values_list('compacted_to', flat=True)),
+                         [second.pk, result.compacted_to])
+
+    def test_balances_read_snapshot_and_tail(self):
+        sell_order(self.cashier, [(self.popcorn, 2)], visitor=self.olga)
+        with override_settings(LOYALTY_SETTLE_SECONDS=0):
+            LoyaltyLedger.compact()
+        sell_order(self.cashier, [(self.popcorn, 4)], visitor=self.olga)
+        sell_order(self.cashier, [(self.popcorn, 4)], visitor=self.petr)
+        with self.assertNumQueries(2):
+            balances = LoyaltyLedger.balances([self.olga.pk, self.petr.pk])
+        self.assertEqual(balances, {self.olga.pk: 15, self.petr.pk: 10})
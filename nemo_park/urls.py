@@ -18,6 +18,10 @@ urlpatterns = [
     
     # Посетители
     path('visitors/', views.visitors_list, name='visitors'),
+    path('visitors/segments/', views.visitor_segments, name='visitor_segments'),
+    path('visitors/<int:visitor_id>/points/', views.visitor_points, name='visitor_points'),
+    path('visitors/duplicates/', views.visitor_duplicates, name='visitor_duplicates'),
+    path('visitors/merge/<int:visitor_id>/<int:duplicate_id>/', views.merge_visitors, name='merge_visitors'),
     path('add-visitor/', views.add_visitor, name='add_visitor'),
     path('edit-visitor/<int:visitor_id>/', views.edit_visitor, name='edit_visitor'),
     path('delete-visitor/<int:visitor_id>/', views.delete_visitor, name='delete_visitor'),
@@ -27,12 +31,14 @@ urlpatterns = [
     path('add-ticket/', views.add_ticket, name='add_ticket'),
     path('edit-ticket/<int:ticket_id>/', views.edit_ticket, name='edit_ticket'),
     path('delete-ticket/<int:ticket_id>/', views.delete_ticket, name='delete_ticket'),
+    path('tickets/prices/', views.ticket_prices, name='ticket_prices'),
     
     # Товары
     path('products/', views.products_list, name='products'),
     path('add-product/', views.add_product, name='add_product'),
     path('edit-product/<int:product_id>/', views.edit_product, name='edit_product'),
     path('delete-product/<int:product_id>/', views.delete_product, name='delete_product'),
+    path('products/restock/', views.restock_products, name='restock_products'),
     
     # Заказы
     path('orders/', views.orders_list, name='orders'),
@@ -40,15 +46,30 @@ urlpatterns = [
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
     path('order/<int:order_id>/status/', views.update_order_status, name='update_order_status'),
     path('delete-order/<int:order_id>/', views.delete_order, name='delete_order'),
+    path('kitchen/', views.kitchen, name='kitchen'),
+    path('kitchen/<int:order_id>/next/', views.kitchen_advance, name='kitchen_advance'),
     
     # ========== НОВОЕ: Зарплата ==========
     path('payroll/', views.payroll_list, name='payroll_list'),
     path('payroll/calculate/', views.payroll_calculate, name='payroll_calculate'),
     path('payroll/bulk/', views.payroll_bulk, name='payroll_bulk'),
+    path('payroll/simulate/', views.payroll_simulate, name='payroll_simulate'),
+    path('payroll/simulate/api/', views.payroll_simulate_api, name='payroll_simulate_api'),
     path('payroll/my/', views.my_payroll, name='my_payroll'),
     path('payroll/<int:pk>/', views.payroll_detail, name='payroll_detail'),
+    path('payroll/<int:pk>/payslip/', views.payroll_payslip, name='payroll_payslip'),
     path('payroll/<int:pk>/paid/', views.payroll_mark_paid, name='payroll_mark_paid'),
     path('payroll/<int:pk>/delete/', views.payroll_delete, name='payroll_delete'),
     path('payroll/bulk-delete/', views.payroll_bulk_delete, name='payroll_bulk_delete'),
+    path('payroll/bulk-status/', views.payroll_bulk_status, name='payroll_bulk_status'),
+    path('payroll/recompute/', views.payroll_recompute, name='payroll_recompute'),
+    path('payroll/payslips/', views.payroll_payslips_zip, name='payroll_payslips_zip'),
+    path('timesheet/', views.timesheet, name='timesheet'),
+    path('timesheet/clock-in/', views.timesheet_clock_in, name='timesheet_clock_in'),
+    path('timesheet/clock-out/', views.timesheet_clock_out, name='timesheet_clock_out'),
     path('orders/analytics/', views.orders_analytics, name='orders_analytics'),
+    path('orders/analytics/products/', views.product_analytics, name='product_analytics'),
+    path('orders/analytics/staffing/', views.staffing, name='staffing'),
+    path('orders/analytics/cashiers/', views.cashier_leaderboard, name='cashier_leaderboard'),
+    path('orders/analytics/ingredients/', views.ingredient_usage, name='ingredient_usage'),
 ]
\ No newline at end of file
@@ -1,17 +1,45 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Count, Sum
 from django.utils import timezone
 from datetime import date, timedelta
+from copy import copy
 from decimal import Decimal
 import json
 
-from .models import Employee, Visitor, Ticket, CustomUser, Product, Order, OrderItem, Payroll
+from .models import (Employee, Visitor, Ticket, CustomUser, Product, Order, OrderItem, Payroll, WorkShift,
+                     VisitorDuplicate)
 from .forms import (LoginForm, RegisterForm, EmployeeForm, VisitorForm, TicketForm, 
-                    EditEmployeeForm, ProductForm, PayrollCalculateForm, PayrollBulkForm)
-from .services.payroll_service import PayrollCalculator  
+                    EditEmployeeForm, ProductForm, PayrollCalculateForm, PayrollBulkForm,
+                    PayrollSimulationForm, PayrollScenarioForm, ProductAnalyticsForm, RestockForm,
+                    AnalyticsPeriodForm)
+from .services.payroll_service import PayrollCalculator, PayrollRecalculator, PayslipBatch
+from .services.demand_service import DemandForecaster, SalesSeries, staffing_plan
+from .services.analytics_service import SalesAnalytics
+from .services.leaderboard_service import CashierLeaderboard
+from .services.pricing_service import PricingEngine
+from .services.product_sales_service import ProductSales
+from .services.visitor_service import VisitorProfiles, SEGMENT_CHOICES
+from .services.dedup_service import VisitorDeduplicator
+from .services.loyalty_service import LoyaltyLedger
+from .services.sales_service import SalesRemoval
+from .services.stock_service import Stock, OutOfStock
+from .services.bom_service import BillOfMaterials
+from .services.kitchen_service import KitchenQueue, LANE_CHOICES
+from .services.archive_service import sales_totals, all_tickets, all_orders, as_instances
+from .services.money import to_kopecks, from_kopecks
+from .services.timesheet_service import Timesheet, TimesheetError
+from .services.ledger_service import Ledger
+from .services.payslip_service import PayslipRenderer
+from .services.simulation_service import PayrollSimulator, SimulationError, make_scenario, result_to_dict
+from .db_routing import read_from_replica
+from .schedule import DAY_NAMES
 
 
 # ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
@@ -92,45 +120,35 @@ def user_logout(request):
 # ==================== ГЛАВНАЯ ====================
 
 @login_required
+@read_from_replica
 def dashboard(request):
     if request.user.role == 'user':
         return render(request, 'nemo_park/waiting_approval.html')
     
     if request.user.role == 'admin':
-        # Считаем выручку за билеты
-        tickets_revenue = Ticket.objects.aggregate(total=Sum('price'))['total'] or 0
-        
-        # Считаем выручку за заказы
-        orders_revenue = Order.objects.aggregate(total=Sum('total_price'))['total'] or 0
-        
-        # Общая выручка
-        total_revenue = tickets_revenue + orders_revenue
+        # Выручка и количество с учётом архива
+        totals = sales_totals()
         
         context = {
             'employees_count': Employee.objects.count(),
             'visitors_count': Visitor.objects.count(),
-            'tickets_count': Ticket.objects.count(),
-            'orders_count': Order.objects.count(),
-            'tickets_revenue': tickets_revenue,
-            'orders_revenue': orders_revenue,
-            'total_revenue': total_revenue,
+            'tickets_count': totals['tickets_count'],
+            'orders_count': totals['orders_count'],
+            'tickets_revenue': totals['tickets_revenue'],
+            'orders_revenue': totals['orders_revenue'],
+            'total_revenue': totals['tickets_revenue'] + totals['orders_revenue'],
         }
     elif request.user.role == 'cashier':
-        # Билеты этого кассира
-        user_tickets = Ticket.objects.filter(cashier=request.user)
-        tickets_revenue = user_tickets.aggregate(total=Sum('price'))['total'] or 0
-        
-        # Заказы этого кассира
-        user_orders = Order.objects.filter(cashier=request.user)
-        orders_revenue = user_orders.aggregate(total=Sum('total_price'))['total'] or 0
+        # Продажи этого кассира с учётом архива
+        totals = sales_totals(cashier=request.user)
         
         context = {
             'visitors_count': Visitor.objects.count(),
-            'tickets_count': user_tickets.count(),
-            'orders_count': user_orders.count(),
-            'tickets_revenue': tickets_revenue,
-            'orders_revenue': orders_revenue,
-            'personal_revenue': tickets_revenue + orders_revenue,
+            'tickets_count': totals['tickets_count'],
+            'orders_count': totals['orders_count'],
+            'tickets_revenue': totals['tickets_revenue'],
+            'orders_revenue': totals['orders_revenue'],
+            'personal_revenue': totals['tickets_revenue'] + totals['orders_revenue'],
         }
     else:
         context = {}
@@ -141,6 +159,7 @@ def dashboard(request):
 # ==================== СОТРУДНИКИ ====================
 
 @login_required
+@read_from_replica
 def employees_list(request):
     if request.user.role == 'user':
         return render(request, 'nemo_park/waiting_approval.html')
@@ -202,6 +221,12 @@ def edit_employee(request, employee_id):
         if form.is_valid():
             employee = form.save()
             
+            # Ставка или график изменились — черновики пересчитываются после сохранения
+            stale_count = PayrollRecalculator.mark_stale(employee, form.changed_data)
+            if stale_count:
+                PayrollRecalculator.recompute_on_commit([employee.pk])
+                messages.info(request, f'Черновики расчётных листов пересчитаны: {stale_count}')
+            
             if hasattr(employee, 'customuser'):
                 user = employee.customuser
                 user.role = form.cleaned_data['position']
@@ -255,11 +280,9 @@ def delete_employee(request, employee_id):
     employee = get_object_or_404(Employee, id=employee_id)
     
     if request.method == 'POST':
-        if hasattr(employee, 'customuser'):
-            employee.customuser.delete()
-        
         employee_name = f"{employee.first_name} {employee.last_name}"
-        employee.delete()
+        # Учётная запись, её продажи и листы удаляются каскадом — итоги вычитаются заранее
+        SalesRemoval.delete_employees(Employee.objects.filter(pk=employee.pk))
         messages.success(request, f'Сотрудник {employee_name} успешно удален!')
         return redirect('employees')
     
@@ -269,6 +292,7 @@ def delete_employee(request, employee_id):
 # ==================== ПОСЕТИТЕЛИ ====================
 
 @login_required
+@read_from_replica
 def visitors_list(request):
     if request.user.role == 'user':
         return render(request, 'nemo_park/waiting_approval.html')
@@ -276,10 +300,74 @@ def visitors_list(request):
         messages.error(request, 'У вас нет доступа к этой странице')
         return redirect('dashboard')
     
-    visitors = Visitor.objects.all()
+    visitors = list(Visitor.objects.all())
+    balances = LoyaltyLedger.balances(visitor.id for visitor in visitors)
+    for visitor in visitors:
+        visitor.points = balances[visitor.id]
     return render(request, 'nemo_park/visitors/visitors.html', {'visitors': visitors})
 
 
+@login_required
+def visitor_points(request, visitor_id):
+    """Баланс баллов посетителя для кассы (JSON)"""
+    if request.user.role == 'user':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+    visitor = get_object_or_404(Visitor, id=visitor_id)
+    return JsonResponse({'visitor': visitor.id, 'points': LoyaltyLedger.balance(visitor.id)})
+
+
+@login_required
+@read_from_replica
+def visitor_segments(request):
+    """Сегменты посетителей: лучшие по тратам, постоянные, давно не приходившие"""
+    if request.user.role == 'user':
+        return render(request, 'nemo_park/waiting_approval.html')
+    if not admin_required(request.user):
+        messages.error(request, 'У вас нет доступа к этой странице')
+        return redirect('dashboard')
+    
+    segment = request.GET.get('segment', 'top')
+    if segment not in dict(SEGMENT_CHOICES):
+        segment = 'top'
+    try:
+        days = max(1, int(request.GET.get('days', 90)))
+    except ValueError:
+        days = 90
+    try:
+        min_visits = max(1, int(request.GET.get('min_visits', 3)))
+    except ValueError:
+        min_visits = 3
+    
+    if segment == 'regulars':
+        profiles = VisitorProfiles.regulars(min_visits)
+    elif segment == 'lapsed':
+        profiles = VisitorProfiles.lapsed(days)
+    else:
+        profiles = VisitorProfiles.top_spenders()
+    profiles = list(profiles)
+    
+    favourites = VisitorProfiles.favourites([profile.visitor_id for profile in profiles])
+    rows = [(profile, favourites.get(profile.visitor_id, [])) for profile in profiles]
+    
+    return render(request, 'nemo_park/visitors/segments.html', {
+        'rows': rows,
+        'segment': segment,
+        'segments': SEGMENT_CHOICES,
+        'days': days,
+        'min_visits': min_visits,
+    })
+
+
+def warn_duplicates(request, visitor):
+    """Предупредить, если посетитель похож на уже зарегистрированных"""
+    matches = VisitorDeduplicator.check(visitor)
+    if matches:
+        other_ids = [match.visitor_id if match.duplicate_id == visitor.pk else match.duplicate_id for match in matches]
+        others = Visitor.objects.filter(id__in=other_ids)
+        names = ', '.join(f'{other} (#{other.id})' for other in others)
+        messages.warning(request, f'Похоже на уже зарегистрированных посетителей: {names}. Проверьте список дублей.')
+
+
 @login_required
 def add_visitor(request):
     if request.user.role != 'admin':
@@ -289,8 +377,9 @@ def add_visitor(request):
     if request.method == 'POST':
         form = VisitorForm(request.POST)
         if form.is_valid():
-            form.save()
+            visitor = form.save()
             messages.success(request, 'Посетитель успешно добавлен!')
+            warn_duplicates(request, visitor)
             return redirect('visitors')
     else:
         form = VisitorForm()
@@ -310,6 +399,7 @@ def edit_visitor(request, visitor_id):
         form = VisitorForm(request.POST, instance=visitor)
         if form.is_valid():
             form.save()
+            warn_duplicates(request, visitor)
             messages.success(request, f'Данные посетителя {visitor.first_name} {visitor.last_name} успешно обновлены!')
             return redirect('visitors')
     else:
@@ -328,25 +418,74 @@ def delete_visitor(request, visitor_id):
     
     if request.method == 'POST':
         visitor_name = f"{visitor.first_name} {visitor.last_name}"
-        visitor.delete()
+        # Билеты и заказы посетителя удаляются каскадом — итоги продаж вычитаются заранее
+        SalesRemoval.delete_visitors(Visitor.objects.filter(pk=visitor.pk))
         messages.success(request, f'Посетитель {visitor_name} успешно удален!')
         return redirect('visitors')
     
     return render(request, 'nemo_park/visitors/delete_visitor.html', {'visitor': visitor})
 
 
+@login_required
+def visitor_duplicates(request):
+    """Вероятные дубли посетителей: поиск и слияние"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет доступа к этой странице')
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        # В запросе — без пула процессов; на большой базе — команда find_duplicate_visitors
+        matches = VisitorDeduplicator().run()
+        messages.success(request, f'Поиск дублей завершён: найдено пар {len(matches)}')
+        return redirect('visitor_duplicates')
+    
+    duplicates = VisitorDuplicate.objects.select_related('visitor', 'duplicate')
+    return render(request, 'nemo_park/visitors/duplicates.html', {'duplicates': duplicates})
+
+
+@login_required
+def merge_visitors(request, visitor_id, duplicate_id):
+    """Слить дубль с посетителем: билеты и заказы переходят к посетителю, дубль удаляется"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет прав для слияния посетителей')
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        visitor = get_object_or_404(Visitor, id=visitor_id)
+        duplicate = get_object_or_404(Visitor, id=duplicate_id)
+        try:
+            result = VisitorDeduplicator.merge(visitor, duplicate)
+        except ValueError as error:
+            messages.error(request, str(error))
+        else:
+            messages.success(
+                request,
+                f'{duplicate} (#{duplicate_id}) слит с {visitor} (#{visitor.id}): '
+                f'билетов {result.tickets + result.archived_tickets}, заказов {result.orders + result.archived_orders}'
+            )
+    return redirect('visitor_duplicates')
+
+
 # ==================== БИЛЕТЫ ====================
 
 @login_required
+@read_from_replica
 def tickets_list(request):
     if request.user.role == 'user':
         return render(request, 'nemo_park/waiting_approval.html')
     
-    if request.user.role == 'admin':
-        tickets = Ticket.objects.all()
+    filters = {} if request.user.role == 'admin' else {'cashier': request.user}
+    
+    # ?archive=1 — вместе с архивом, иначе только рабочая таблица
+    show_archive = request.GET.get('archive') == '1'
+    if show_archive:
+        tickets = as_instances(Ticket, all_tickets(**filters).order_by('-purchase_date'))
     else:
-        tickets = Ticket.objects.filter(cashier=request.user)
-    return render(request, 'nemo_park/tickets/tickets.html', {'tickets': tickets})
+        tickets = Ticket.objects.filter(**filters).select_related('visitor', 'cashier')
+    return render(request, 'nemo_park/tickets/tickets.html', {
+        'tickets': tickets,
+        'show_archive': show_archive,
+    })
 
 
 @login_required
@@ -359,13 +498,51 @@ def add_ticket(request):
         if form.is_valid():
             ticket = form.save(commit=False)
             ticket.cashier = request.user 
-            ticket.save()
+            with transaction.atomic():
+                ticket.save()
+                SalesSeries.record_ticket(ticket)
+                VisitorProfiles.record_ticket(ticket)
+                LoyaltyLedger.record_ticket(ticket)
             messages.success(request, 'Билет успешно продан!')
             return redirect('tickets')
     else:
         form = TicketForm()
     
-    return render(request, 'nemo_park/tickets/add_ticket.html', {'form': form})
+    return render(request, 'nemo_park/tickets/add_ticket.html', {
+        'form': form,
+        'prices': PricingEngine.get_prices(),
+    })
+
+
+@login_required
+def ticket_prices(request):
+    """Сетка цен билетов на период"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет доступа к этой странице')
+        return redirect('dashboard')
+    
+    try:
+        start_date = date.fromisoformat(request.GET.get('start', ''))
+    except ValueError:
+        start_date = date.today()
+    try:
+        end_date = date.fromisoformat(request.GET.get('end', ''))
+    except ValueError:
+        end_date = start_date + timedelta(days=30)
+    
+    # Не больше года за раз
+    end_date = min(max(end_date, start_date), start_date + timedelta(days=366))
+    
+    grid = PricingEngine.price_grid(start_date, end_date)
+    for row in grid:
+        row['prices'] = [row['prices'].get(code) for code, _ in Ticket.TICKET_TYPES]
+    
+    return render(request, 'nemo_park/tickets/ticket_prices.html', {
+        'grid': grid,
+        'ticket_types': Ticket.TICKET_TYPES,
+        'start_date': start_date,
+        'end_date': end_date,
+    })
 
 
 @login_required
@@ -380,9 +557,17 @@ def edit_ticket(request, ticket_id):
         return redirect('tickets')
     
     if request.method == 'POST':
+        # Форма меняет сам объект — профиль посетителя вычитаем по копии до изменений
+        previous = copy(ticket)
         form = TicketForm(request.POST, instance=ticket)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                VisitorProfiles.record_ticket(previous, -1)
+                form.save()
+                VisitorProfiles.record_ticket(ticket)
+                if previous.visitor_id != ticket.visitor_id:
+                    LoyaltyLedger.record_ticket(previous, -1)
+                    LoyaltyLedger.record_ticket(ticket)
             messages.success(request, 'Данные билета успешно обновлены!')
             return redirect('tickets')
     else:
@@ -403,7 +588,7 @@ def delete_ticket(request, ticket_id):
         return redirect('tickets')
     
     if request.method == 'POST':
-        ticket.delete()
+        SalesRemoval.delete_tickets(Ticket.objects.filter(pk=ticket.pk))
         messages.success(request, 'Билет успешно удален!')
         return redirect('tickets')
     
@@ -464,7 +649,8 @@ def edit_product(request, product_id):
     if request.method == 'POST':
         form = ProductForm(request.POST, instance=product)
         if form.is_valid():
-            form.save()
+            # Остаток меняют продажи и приход — не перезаписываем его значением, прочитанным до сохранения
+            form.save(commit=False).save(update_fields=form.Meta.fields)
             messages.success(request, f'Товар "{product.name}" успешно обновлён!')
             return redirect('products')
     else:
@@ -483,31 +669,66 @@ def delete_product(request, product_id):
     
     if request.method == 'POST':
         product_name = product.name
-        product.delete()
+        with transaction.atomic():
+            product.delete()
+            BillOfMaterials.rebuild()
         messages.success(request, f'Товар "{product_name}" успешно удалён!')
         return redirect('products')
     
     return render(request, 'nemo_park/products/delete_product.html', {'product': product})
 
 
+@login_required
+def restock_products(request):
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет прав для учёта остатков')
+        return redirect('products')
+    
+    products = Product.objects.order_by('category', 'name')
+    
+    if request.method == 'POST':
+        form = RestockForm(request.POST, products=products)
+        if form.is_valid():
+            result = Stock.restock(form.added(), form.counted())
+            messages.success(
+                request,
+                f'Остатки обновлены: товаров {result.products}, приход {result.added} шт., '
+                f'инвентаризация {result.counted} поз.'
+            )
+            return redirect('restock_products')
+    else:
+        form = RestockForm(products=products)
+    
+    return render(request, 'nemo_park/products/restock.html', {'form': form})
+
+
 # ==================== ЗАКАЗЫ ====================
 
 @login_required
+@read_from_replica
 def orders_list(request):
     if request.user.role == 'user':
         return render(request, 'nemo_park/waiting_approval.html')
     
-    if request.user.role == 'admin':
-        orders = Order.objects.all().order_by('-created_at')
+    filters = {} if request.user.role == 'admin' else {'cashier': request.user}
+    
+    # ?archive=1 — вместе с архивом, иначе только рабочая таблица
+    show_archive = request.GET.get('archive') == '1'
+    if show_archive:
+        orders = as_instances(Order, all_orders(**filters).order_by('-created_at'))
     else:
-        orders = Order.objects.filter(cashier=request.user).order_by('-created_at')
+        orders = list(
+            Order.objects.filter(**filters).select_related('visitor', 'cashier')
+            .annotate(items_count=Count('orderitem')).order_by('-created_at')
+        )
     
-    total_orders = orders.count()
+    total_orders = len(orders)
     total_revenue = sum(order.total_price for order in orders)
-    pending_orders = orders.filter(status='pending').count()
+    pending_orders = sum(1 for order in orders if order.status == 'pending')
     
     context = {
         'orders': orders,
+        'show_archive': show_archive,
         'total_orders': total_orders,
         'total_revenue': total_revenue,
         'pending_orders': pending_orders,
@@ -548,29 +769,44 @@ def create_order(request):
                 'visitors': visitors,
             })
         
-        order = Order.objects.create(
-            visitor_id=visitor_id if visitor_id else None,
-            cashier=request.user,
-            notes=notes,
-            total_price=0
-        )
-        
-        total = 0
-        for item in items:
-            product = Product.objects.get(id=item['product_id'])
-            quantity = int(item['quantity'])
-            price = product.price
-            
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=price
-            )
-            total += price * quantity
-        
-        order.total_price = total
-        order.save()
+        try:
+            with transaction.atomic():
+                # Списание остатков — в той же транзакции, что и позиции заказа
+                Stock.take_items((int(item['product_id']), int(item['quantity'])) for item in items)
+                order = Order.objects.create(
+                    visitor_id=visitor_id if visitor_id else None,
+                    cashier=request.user,
+                    notes=notes,
+                    is_rush=bool(request.POST.get('is_rush')),
+                    total_price=0
+                )
+                
+                total_kopecks = 0
+                for item in items:
+                    product = Product.objects.get(id=item['product_id'])
+                    quantity = int(item['quantity'])
+                    price = product.price
+                    
+                    OrderItem.objects.create(
+                        order=order,
+                        product=product,
+                        quantity=quantity,
+                        price=price
+                    )
+                    total_kopecks += to_kopecks(price) * quantity
+                
+                total = from_kopecks(total_kopecks)
+                order.total_price = total
+                order.save()
+                ProductSales.record_order(order)
+                SalesSeries.record_order(order)
+                VisitorProfiles.record_order(order)
+                LoyaltyLedger.record_order(order)
+                transaction.on_commit(lambda: KitchenQueue.update(order))
+        except ValueError as e:
+            # OutOfStock или неверное количество
+            messages.error(request, str(e))
+            return redirect('create_order')
         
         messages.success(request, f'Заказ #{order.id} создан! Сумма: {total} ₽')
         return redirect('orders')
@@ -598,6 +834,7 @@ def order_detail(request, order_id):
     return render(request, 'nemo_park/orders/order_detail.html', {
         'order': order,
         'items': items,
+        'eta': KitchenQueue.eta(order.id) if order.status in KitchenQueue.OPEN_STATUSES else None,
     })
 
 
@@ -611,9 +848,34 @@ def update_order_status(request, order_id):
     if request.method == 'POST':
         new_status = request.POST.get('status')
         if new_status in dict(Order.STATUS_CHOICES):
-            order.status = new_status
-            order.save()
-            messages.success(request, f'Статус заказа #{order.id} обновлён')
+            try:
+                with transaction.atomic():
+                    # Статус читается из заблокированной строки: две кассы, отменяющие
+                    # заказ одновременно, не вернут остатки и не вычтут итоги дважды
+                    order = Order.objects.select_for_update().get(pk=order.pk)
+                    # Отменённые заказы не входят в продажи товаров и возвращают остатки
+                    was_cancelled = order.status == 'cancelled'
+                    order.status = new_status
+                    if new_status == 'preparing' and order.started_at is None:
+                        order.started_at = timezone.now()
+                    elif new_status == 'pending':
+                        order.started_at = None
+                    order.save()
+                    transaction.on_commit(lambda: KitchenQueue.update(order))
+                    if was_cancelled != (new_status == 'cancelled'):
+                        sign = -1 if new_status == 'cancelled' else 1
+                        if sign > 0:
+                            Stock.take_order(order)
+                        else:
+                            Stock.give_back_order(order)
+                        ProductSales.record_order(order, sign)
+                        SalesSeries.record_order(order, sign)
+                        VisitorProfiles.record_order(order, sign)
+                        LoyaltyLedger.record_order(order, sign)
+            except OutOfStock as e:
+                messages.error(request, f'Заказ #{order.id} нельзя вернуть в работу. {e}')
+            else:
+                messages.success(request, f'Статус заказа #{order.id} обновлён')
     
     return redirect('order_detail', order_id=order_id)
 
@@ -628,17 +890,66 @@ def delete_order(request, order_id):
     
     if request.method == 'POST':
         order_num = order.id
-        order.delete()
+        SalesRemoval.delete_orders(Order.objects.filter(pk=order.pk))
         messages.success(request, f'Заказ #{order_num} удалён')
         return redirect('orders')
     
     return render(request, 'nemo_park/orders/delete_order.html', {'order': order})
 
 
+@login_required
+def kitchen(request):
+    """Экран кухни: открытые заказы в порядке приготовления, по станциям (категориям товаров)"""
+    if request.user.role == 'user':
+        return render(request, 'nemo_park/waiting_approval.html')
+    
+    stations = [(code, name) for code, name in Product.CATEGORY_CHOICES if code != 'combo']
+    station = request.GET.get('station') or None
+    if station not in dict(stations):
+        station = None
+    
+    queues = KitchenQueue.summary()
+    return render(request, 'nemo_park/orders/kitchen.html', {
+        'rows': KitchenQueue.board(station),
+        'queues': [(name, queues[lane]) for lane, name in LANE_CHOICES],
+        'stations': stations,
+        'station': station,
+    })
+
+
+@login_required
+def kitchen_advance(request, order_id):
+    """Кухня: начать готовить заказ или отметить готовым"""
+    if request.user.role == 'user':
+        return render(request, 'nemo_park/waiting_approval.html')
+    
+    if request.method == 'POST':
+        with transaction.atomic():
+            order = get_object_or_404(Order.objects.select_for_update(), id=order_id)
+            advanced = order.status in KitchenQueue.OPEN_STATUSES
+            if advanced:
+                if order.status == 'pending':
+                    order.status, order.started_at = 'preparing', timezone.now()
+                else:
+                    order.status = 'ready'
+                order.save(update_fields=['status', 'started_at'])
+                transaction.on_commit(lambda: KitchenQueue.update(order))
+        if advanced:
+            messages.success(request, f'Заказ #{order.id}: {order.get_status_display().lower()}')
+        else:
+            messages.error(request, f'Заказ #{order.id} уже не в очереди кухни')
+    
+    station = request.POST.get('station', '')
+    url = reverse('kitchen')
+    if station in dict(Product.CATEGORY_CHOICES):
+        url += f'?station={station}'
+    return redirect(url)
+
 
 # ==================== РАСЧЁТ ЗАРПЛАТЫ ====================
 
 @login_required
+@read_from_replica
 def payroll_list(request):
     """Список всех расчётных листов"""
     if request.user.role == 'user':
@@ -648,18 +959,23 @@ def payroll_list(request):
         messages.error(request, 'У вас нет доступа к этой странице')
         return redirect('dashboard')
     
-    # Сначала считаем статистику по ВСЕМ записям
-    all_payrolls = Payroll.objects.select_related('employee')
-    total_paid = all_payrolls.filter(status='paid').aggregate(total=Sum('net_salary'))['total'] or 0
-    pending_count = all_payrolls.filter(status='draft').count()
+    # Статистика по ВСЕМ записям — из книги итогов
+    total_paid = Ledger.totals('paid').net
+    counts = Ledger.status_counts()
+    pending_count = counts['draft'] + counts['confirmed']
     
-    # Потом берём последние 100 для отображения
-    payrolls = all_payrolls.order_by('-period_end', '-created_at')[:100]
+    # Последние 100 для отображения
+    payrolls = Payroll.objects.select_related('employee').order_by('-period_end', '-created_at')[:100]
     
+    today = date.today()
     context = {
         'payrolls': payrolls,
         'total_paid': total_paid,
         'pending_count': pending_count,
+        'total_count': sum(counts.values()),
+        'stale_count': PayrollRecalculator.stale_count(),
+        'month_start': today.replace(day=1),
+        'month_end': (today.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1),
     }
     return render(request, 'nemo_park/payroll/payroll_list.html', context)
 
@@ -685,13 +1001,14 @@ def payroll_calculate(request):
                 messages.error(request, f'У сотрудника {employee.full_name} не настроен график работы!')
                 return render(request, 'nemo_park/payroll/payroll_calculate.html', {'form': form})
             
-            calculator = PayrollCalculator(employee, period_start, period_end)
+            use_timesheet = form.cleaned_data['use_timesheet']
+            calculator = PayrollCalculator(employee, period_start, period_end, use_timesheet)
             
             if 'preview' in request.POST:
                 preview = calculator.get_preview()
                 
                 # Проверка: есть ли рабочие дни
-                if preview['work_days'] == 0:
+                if preview.work_days == 0:
                     messages.warning(request, 'В выбранном периоде нет рабочих дней по графику сотрудника')
                     
             elif 'create' in request.POST:
@@ -704,6 +1021,7 @@ def payroll_calculate(request):
     return render(request, 'nemo_park/payroll/payroll_calculate.html', {
         'form': form,
         'preview': preview,
+        'use_timesheet': request.method == 'POST' and form.is_valid() and form.cleaned_data['use_timesheet'],
     })
 
 
@@ -726,6 +1044,87 @@ def payroll_detail(request, pk):
     })
 
 
+@login_required
+def payroll_recompute(request):
+    """Пересчитать черновики, помеченные после изменения ставки или графика"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет прав')
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        count = PayrollRecalculator.recompute()
+        messages.success(request, f'🔄 Пересчитано черновиков: {count}')
+    return redirect('payroll_list')
+
+
+@login_required
+def payroll_payslip(request, pk):
+    """Расчётный лист файлом для печати (из кэша, если лист не менялся)"""
+    if request.user.role == 'user':
+        return render(request, 'nemo_park/waiting_approval.html')
+    
+    payroll = get_object_or_404(Payroll, pk=pk)
+    
+    # Кассир может скачать только свои
+    if request.user.role == 'cashier':
+        if not hasattr(request.user, 'employee_profile') or request.user.employee_profile != payroll.employee:
+            messages.error(request, 'Вы можете просматривать только свои расчётные листы')
+            return redirect('my_payroll')
+    
+    try:
+        renderer = PayslipRenderer()
+    except ValueError as error:
+        messages.error(request, str(error))
+        return redirect('payroll_detail', pk=pk)
+    # Один лист рисуется на месте (без пула), дальше берётся из кэша
+    payslip = renderer.render(Payroll.objects.filter(pk=pk))[0]
+    return FileResponse(
+        open(payslip.path, 'rb'),
+        content_type=renderer.content_type,
+        as_attachment=renderer.fmt == 'pdf',
+        filename=payslip.filename.split('/')[-1],
+    )
+
+
+@login_required
+def payroll_payslips_zip(request):
+    """Все расчётные листы за период одним zip-архивом"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет прав')
+        return redirect('dashboard')
+    
+    try:
+        period_start = date.fromisoformat(request.GET.get('period_start', ''))
+        period_end = date.fromisoformat(request.GET.get('period_end', ''))
+    except ValueError:
+        messages.error(request, 'Укажите период')
+        return redirect('payroll_list')
+    
+    payrolls = Payroll.objects.filter(period_start__gte=period_start, period_end__lte=period_end)
+    if not payrolls.exists():
+        messages.warning(request, 'За этот период расчётных листов нет')
+        return redirect('payroll_list')
+    
+    try:
+        renderer = PayslipRenderer()
+    except ValueError as error:
+        messages.error(request, str(error))
+        return redirect('payroll_list')
+    # Пачку рисует команда (пул процессов), запрос только собирает готовые файлы
+    payslips, missing = renderer.collect(payrolls)
+    if missing:
+        messages.warning(
+            request,
+            f'Ещё не нарисовано листов: {len(missing)}. Запустите '
+            f'python manage.py render_payslips --start {period_start} --end {period_end}'
+        )
+        return redirect('payroll_list')
+    
+    response = HttpResponse(renderer.zip(payslips), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="payslips_{period_start}_{period_end}.zip"'
+    return response
+
+
 @login_required
 def payroll_bulk(request):
     """Массовый расчёт для всех сотрудников"""
@@ -733,7 +1132,7 @@ def payroll_bulk(request):
         messages.error(request, 'У вас нет прав для массового расчёта')
         return redirect('dashboard')
     
-    results = []
+    results = PayslipBatch()
     form_data = None
     
     if request.method == 'POST':
@@ -741,43 +1140,30 @@ def payroll_bulk(request):
         if form.is_valid():
             period_start = form.cleaned_data['period_start']
             period_end = form.cleaned_data['period_end']
-            form_data = {'period_start': period_start, 'period_end': period_end}
+            use_timesheet = form.cleaned_data['use_timesheet']
+            form_data = {'period_start': period_start, 'period_end': period_end, 'use_timesheet': use_timesheet}
             
             employees = Employee.objects.exclude(position='user')
-            
-            for employee in employees:
-                calculator = PayrollCalculator(employee, period_start, period_end)
-                preview = calculator.get_preview()
-                results.append(preview)
+            results = PayrollCalculator.calculate_batch(employees, period_start, period_end, use_timesheet)
             
             if 'create_all' in request.POST:
-                created_count = 0
-                total_sum = Decimal('0')
-                
-                for employee in employees:
-                    calculator = PayrollCalculator(employee, period_start, period_end)
-                    payroll = calculator.create_payroll(created_by=request.user)
-                    created_count += 1
-                    total_sum += payroll.net_salary
-                
-                messages.success(request, f'Создано {created_count} расчётных листов на сумму {total_sum} ₽!')
+                payrolls = results.create_payrolls(created_by=request.user)
+                messages.success(request, f'Создано {len(payrolls)} расчётных листов на сумму {results.total_net} ₽!')
                 return redirect('payroll_list')
     else:
         form = PayrollBulkForm()
     
-    total_gross = sum(r['gross_salary'] for r in results)
-    total_net = sum(r['net_salary'] for r in results)
-    
     return render(request, 'nemo_park/payroll/payroll_bulk.html', {
         'form': form,
         'results': results,
         'form_data': form_data,
-        'total_gross': total_gross,
-        'total_net': total_net,
+        'total_gross': results.total_gross,
+        'total_net': results.total_net,
     })
 
 
 @login_required
+@read_from_replica
 def my_payroll(request):
     """Мои расчётные листы"""
     if request.user.role == 'user':
@@ -790,7 +1176,7 @@ def my_payroll(request):
     if hasattr(request.user, 'employee_profile') and request.user.employee_profile:
         employee = request.user.employee_profile
         payrolls = Payroll.objects.filter(employee=employee).order_by('-period_end')
-        total_earned = payrolls.filter(status='paid').aggregate(total=Sum('net_salary'))['total'] or 0
+        total_earned = Ledger.totals('paid', employee=employee).net
     
     return render(request, 'nemo_park/payroll/my_payroll.html', {
         'employee': employee,
@@ -799,6 +1185,140 @@ def my_payroll(request):
     })
 
 
+# ==================== МОДЕЛИРОВАНИЕ ФОТ ====================
+
+SCENARIO_PREFIXES = ('s1', 's2')
+
+
+@login_required
+@read_from_replica
+def payroll_simulate(request):
+    """Моделирование «что если»: фонд оплаты труда по сценариям бок о бок"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет прав для моделирования зарплаты')
+        return redirect('dashboard')
+    
+    results = []
+    if request.method == 'POST':
+        form = PayrollSimulationForm(request.POST)
+        scenario_forms = [PayrollScenarioForm(request.POST, prefix=prefix) for prefix in SCENARIO_PREFIXES]
+        if form.is_valid() and all(f.is_valid() for f in scenario_forms):
+            simulator = PayrollSimulator(form.cleaned_data['first_month'], form.cleaned_data['months'])
+            results = simulator.compare([f.scenario for f in scenario_forms])
+    else:
+        form = PayrollSimulationForm()
+        scenario_forms = [PayrollScenarioForm(prefix=prefix) for prefix in SCENARIO_PREFIXES]
+    
+    # Строки таблицы: месяц и суммы всех сценариев рядом
+    month_rows = []
+    if results:
+        baseline = results[0]
+        for i, month in enumerate(baseline.months):
+            month_rows.append({
+                'month': month.month,
+                'cells': [(r.months[i], r.months[i].gross - month.gross) for r in results],
+            })
+    
+    return render(request, 'nemo_park/payroll/payroll_simulate.html', {
+        'form': form,
+        'scenario_forms': scenario_forms,
+        'results': [(r, r.gross - results[0].gross) for r in results],
+        'month_rows': month_rows,
+        'positions': dict(Employee.POSITION_CHOICES),
+    })
+
+
+@login_required
+@read_from_replica
+def payroll_simulate_api(request):
+    """JSON API моделирования.
+    
+    POST {"first_month": "2026-01-01", "months": 12, "scenarios": [{"name": ..., "rate_multipliers":
+    {"cashier": "1.1"}, "work_days": {"cashier": "1,2,3,4,5,6"}, "ndfl_rate": "0.13",
+    "overtime_multiplier": "1.5"}]} — первым в ответе всегда идёт базовый вариант.
+    """
+    if request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Нужен POST'}, status=405)
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+        first_month = date.fromisoformat(str(payload.get('first_month') or date.today().replace(day=1)))
+        months = int(payload.get('months', 12))
+        if not 1 <= months <= 24:
+            raise SimulationError('months: от 1 до 24')
+        scenarios = [
+            make_scenario(
+                item.get('name', ''),
+                item.get('rate_multipliers'),
+                item.get('work_days'),
+                item.get('ndfl_rate'),
+                item.get('overtime_multiplier'),
+            )
+            for item in payload.get('scenarios', [])
+        ]
+    except (ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    results = PayrollSimulator(first_month, months).compare(scenarios)
+    return JsonResponse({'results': [result_to_dict(r) for r in results]})
+
+
+# ==================== ТАБЕЛЬ ====================
+
+@login_required
+def timesheet(request):
+    """Отметка смен: приход/уход, последние смены"""
+    if request.user.role == 'user':
+        return render(request, 'nemo_park/waiting_approval.html')
+    
+    employee = getattr(request.user, 'employee_profile', None)
+    open_shift = None
+    shifts = []
+    if employee:
+        open_shift = Timesheet.open_shift(employee)
+        shifts = employee.shifts.filter(ended_at__isnull=False)[:30]
+    
+    # Админ видит, кто сейчас на смене
+    on_shift = []
+    if request.user.role == 'admin':
+        on_shift = WorkShift.objects.filter(ended_at__isnull=True).select_related('employee')
+    
+    return render(request, 'nemo_park/payroll/timesheet.html', {
+        'employee': employee,
+        'open_shift': open_shift,
+        'shifts': shifts,
+        'on_shift': on_shift,
+    })
+
+
+@login_required
+def timesheet_clock_in(request):
+    """Отметить приход"""
+    employee = getattr(request.user, 'employee_profile', None)
+    if request.method == 'POST' and employee:
+        try:
+            Timesheet.clock_in(employee)
+            messages.success(request, 'Смена начата!')
+        except TimesheetError as e:
+            messages.error(request, str(e))
+    return redirect('timesheet')
+
+
+@login_required
+def timesheet_clock_out(request):
+    """Отметить уход"""
+    employee = getattr(request.user, 'employee_profile', None)
+    if request.method == 'POST' and employee:
+        try:
+            shift = Timesheet.clock_out(employee)
+            messages.success(request, f'Смена закрыта! Отработано: {shift.worked_hours:.2f} ч')
+        except TimesheetError as e:
+            messages.error(request, str(e))
+    return redirect('timesheet')
+
+
 @login_required
 def payroll_mark_paid(request, pk):
     """Отметить как выплачено"""
@@ -809,14 +1329,53 @@ def payroll_mark_paid(request, pk):
     payroll = get_object_or_404(Payroll, pk=pk)
     
     if request.method == 'POST':
-        payroll.status = 'paid'
-        payroll.paid_at = timezone.now()
-        payroll.save()
+        payroll = Ledger.transition(payroll, 'paid')
         messages.success(request, f'Выплата {payroll.net_salary} ₽ для {payroll.employee.full_name} отмечена!')
     
     return redirect('payroll_detail', pk=pk)
 
 
+@login_required
+def payroll_bulk_status(request):
+    """Массовая смена статуса: подтвердить / выплатить за период или выбранные"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет прав')
+        return redirect('dashboard')
+    
+    if request.method != 'POST':
+        return redirect('payroll_list')
+    
+    action = request.POST.get('action', '')
+    status = {'confirm': 'confirmed', 'pay': 'paid'}.get(action.split('_')[0])
+    scope = action.split('_')[-1]
+    
+    if status is None or scope not in ('period', 'selected'):
+        messages.error(request, 'Неизвестное действие')
+        return redirect('payroll_list')
+    
+    if scope == 'period':
+        try:
+            period_start = date.fromisoformat(request.POST.get('period_start', ''))
+            period_end = date.fromisoformat(request.POST.get('period_end', ''))
+        except ValueError:
+            messages.error(request, 'Укажите период')
+            return redirect('payroll_list')
+        payrolls = Payroll.objects.filter(period_start__gte=period_start, period_end__lte=period_end)
+    else:
+        ids = [int(pk) for pk in request.POST.getlist('payroll_ids') if pk.isdigit()]
+        if not ids:
+            messages.warning(request, 'Не выбрано ни одного расчётного листа')
+            return redirect('payroll_list')
+        payrolls = Payroll.objects.filter(pk__in=ids)
+    
+    result = Ledger.bulk_transition(payrolls, status)
+    if status == 'paid':
+        messages.success(request, f'💸 Выплачено {result.count} листов на {result.net:.2f} ₽')
+    else:
+        messages.success(request, f'📋 Подтверждено {result.count} листов на {result.net:.2f} ₽')
+    return redirect('payroll_list')
+
+
 @login_required
 def payroll_delete(request, pk):
     """Удалить расчётный лист"""
@@ -827,7 +1386,7 @@ def payroll_delete(request, pk):
     payroll = get_object_or_404(Payroll, pk=pk)
     
     if request.method == 'POST':
-        payroll.delete()
+        Ledger.delete(Payroll.objects.filter(pk=payroll.pk))
         messages.success(request, 'Расчётный лист удалён!')
         return redirect('payroll_list')
     
@@ -843,125 +1402,190 @@ def payroll_bulk_delete(request):
         delete_type = request.POST.get('delete_type')
         
         if delete_type == 'all':
-            count = Payroll.objects.count()
-            Payroll.objects.all().delete()
+            count = Ledger.delete(Payroll.objects.all())
             messages.success(request, f'🗑️ Удалено {count} расчётных листов')
         
         elif delete_type == 'draft':
-            count = Payroll.objects.filter(status='draft').count()
-            Payroll.objects.filter(status='draft').delete()
+            count = Ledger.delete(Payroll.objects.filter(status='draft'))
             messages.success(request, f'🗑️ Удалено {count} черновиков')
         
         elif delete_type == 'paid':
-            count = Payroll.objects.filter(status='paid').count()
-            Payroll.objects.filter(status='paid').delete()
+            count = Ledger.delete(Payroll.objects.filter(status='paid'))
             messages.success(request, f'🗑️ Удалено {count} выплаченных')
         
         return redirect('payroll_list')
     
-    # Статистика для отображения
+    # Статистика для отображения — из книги итогов
+    counts = Ledger.status_counts()
     context = {
-        'total_count': Payroll.objects.count(),
-        'draft_count': Payroll.objects.filter(status='draft').count(),
-        'paid_count': Payroll.objects.filter(status='paid').count(),
+        'total_count': sum(counts.values()),
+        'draft_count': counts['draft'],
+        'paid_count': counts['paid'],
     }
     
     return render(request, 'nemo_park/payroll/payroll_bulk_delete.html', context)
 
 @login_required
+@read_from_replica
 def orders_analytics(request):
-    """Аналитика заказов по дням"""
+    """Аналитика продаж по дням за выбранный период со сравнением"""
     if request.user.role == 'user':
         return render(request, 'nemo_park/waiting_approval.html')
     
-    from datetime import timedelta
-    from django.db.models import Count
-    from django.db.models.functions import TruncDate
-    
-    # Период — последние 30 дней
-    end_date = date.today()
-    start_date = end_date - timedelta(days=30)
-    
-    # Заказы в зависимости от роли
-    if request.user.role == 'admin':
-        orders_qs = Order.objects.all()
+    form = AnalyticsPeriodForm(request.GET or None)
+    if form.is_valid():
+        params = form.cleaned_data
     else:
-        orders_qs = Order.objects.filter(cashier=request.user)
-    
-    # Группируем по дням
-    orders_by_day = orders_qs.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date
-    ).annotate(
-        day=TruncDate('created_at')
-    ).values('day').annotate(
-        count=Count('id'),
-        revenue=Sum('total_price')
-    ).order_by('day')
-    
-    # Билеты по дням
-    if request.user.role == 'admin':
-        tickets_qs = Ticket.objects.all()
-    else:
-        tickets_qs = Ticket.objects.filter(cashier=request.user)
-    
-    tickets_by_day = tickets_qs.filter(
-        purchase_date__date__gte=start_date,
-        purchase_date__date__lte=end_date
-    ).annotate(
-        day=TruncDate('purchase_date')
-    ).values('day').annotate(
-        count=Count('id'),
-        revenue=Sum('price')
-    ).order_by('day')
-    
-    # Общая статистика
-    total_orders = orders_qs.filter(
-        created_at__date__gte=start_date
-    ).aggregate(
-        count=Count('id'),
-        revenue=Sum('total_price')
-    )
+        params = {name: field.initial for name, field in form.fields.items()}
+    start_date, end_date, compare = params['start'], params['end'], params['compare']
     
-    total_tickets = tickets_qs.filter(
-        purchase_date__date__gte=start_date
-    ).aggregate(
-        count=Count('id'),
-        revenue=Sum('price')
-    )
+    # Кассир видит только свои продажи
+    cashier_id = None if request.user.role == 'admin' else request.user.id
+    comparison = SalesAnalytics.compare(start_date, end_date, compare, cashier_id)
     
-    # Популярные товары
-    popular_products = OrderItem.objects.filter(
-        order__created_at__date__gte=start_date
-    ).values(
-        'product__name', 'product__image_emoji'
-    ).annotate(
-        total_qty=Sum('quantity'),
-        total_revenue=Sum('price')
-    ).order_by('-total_qty')[:10]
-    
-    # Лучшие кассиры (только для админа)
+    # Популярные товары — из итогов продаж по товарам
+    popular_products = ProductSales.top_products(start_date, end_date, 10)
+    
+    # Лучшие кассиры (только для админа) — билеты и заказы из почасовых счётчиков
     top_cashiers = []
     if request.user.role == 'admin':
-        top_cashiers = Order.objects.filter(
-            created_at__date__gte=start_date
-        ).values(
-            'cashier__username', 'cashier__employee_profile__first_name', 
-            'cashier__employee_profile__last_name'
-        ).annotate(
-            orders_count=Count('id'),
-            revenue=Sum('total_price')
-        ).order_by('-revenue')[:5]
+        top_cashiers = CashierLeaderboard.ranking(start_date, end_date, limit=5)
     
     context = {
-        'orders_by_day': list(orders_by_day),
-        'tickets_by_day': list(tickets_by_day),
-        'total_orders': total_orders,
-        'total_tickets': total_tickets,
+        'form': form,
+        'current': comparison.current,
+        'previous': comparison.previous,
+        'changes': comparison.changes,
+        'orders_by_day': [row for row in comparison.rows
+                          if row.current.orders or (row.previous and row.previous.orders)],
+        'tickets_by_day': [row for row in comparison.rows
+                           if row.current.tickets or (row.previous and row.previous.tickets)],
         'popular_products': popular_products,
         'top_cashiers': top_cashiers,
         'start_date': start_date,
         'end_date': end_date,
     }
     
-    return render(request, 'nemo_park/orders/analytics.html', context)
\ No newline at end of file
+    return render(request, 'nemo_park/orders/analytics.html', context)
+
+
+@login_required
+def product_analytics(request):
+    """Продажи товаров за любой период: топ, категории, тепловая карта по часам"""
+    if request.user.role == 'user':
+        return render(request, 'nemo_park/waiting_approval.html')
+    
+    form = ProductAnalyticsForm(request.GET or None)
+    if form.is_valid():
+        params = form.cleaned_data
+    else:
+        params = {name: field.initial for name, field in form.fields.items()}
+    
+    start, end, category = params['start'], params['end'], params['category']
+    top_products = ProductSales.top_products(start, end, params['limit'], params['order_by'], category)
+    categories = ProductSales.categories(start, end)
+    
+    # Тепловая карта: насыщенность ячейки — доля от максимума за период
+    grid = ProductSales.heatmap(start, end, category)
+    peak = max(max(row) for row in grid) or 1
+    heatmap = [
+        (DAY_NAMES[weekday], [(quantity, f'{quantity / peak:.2f}') for quantity in row])
+        for weekday, row in enumerate(grid, start=1)
+    ]
+    
+    return render(request, 'nemo_park/orders/product_analytics.html', {
+        'form': form,
+        'start_date': start,
+        'end_date': end,
+        'top_products': top_products,
+        'categories': categories,
+        'heatmap': heatmap,
+        'hours': range(24),
+    })
+
+
+@login_required
+def staffing(request):
+    """Прогноз продаж по часам против кассиров по графику"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет доступа к этой странице')
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        DemandForecaster.fit()
+        messages.success(request, '🔮 Прогноз пересчитан')
+        return redirect(request.get_full_path())
+    
+    try:
+        day = date.fromisoformat(request.GET.get('day', ''))
+    except ValueError:
+        day = date.today() + timedelta(days=1)
+    
+    plan = staffing_plan(day)
+    fitted_on, _ = DemandForecaster.profile()
+    
+    return render(request, 'nemo_park/orders/staffing.html', {
+        'day': day,
+        'day_name': DAY_NAMES[day.isoweekday()],
+        'prev_day': day - timedelta(days=1),
+        'next_day': day + timedelta(days=1),
+        'plan': plan,
+        'fitted_on': fitted_on,
+        'capacity': settings.STAFFING_SALES_PER_CASHIER_HOUR,
+        'short_hours': sum(1 for row in plan if row.gap < 0),
+    })
+
+
+@login_required
+def ingredient_usage(request):
+    """Расход товаров (с учётом комбо) и ингредиентов за период"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет доступа к этой странице')
+        return redirect('dashboard')
+    
+    today = timezone.localdate()
+    try:
+        start_date = date.fromisoformat(request.GET.get('start', ''))
+        end_date = date.fromisoformat(request.GET.get('end', ''))
+    except ValueError:
+        start_date = end_date = today
+    
+    products, ingredients = BillOfMaterials.usage(start_date, end_date)
+    return render(request, 'nemo_park/orders/ingredients.html', {
+        'products': products,
+        'ingredients': ingredients,
+        'start_date': start_date,
+        'end_date': end_date,
+    })
+
+
+@login_required
+def cashier_leaderboard(request):
+    """Рейтинг кассиров: сегодня (живой) или за период"""
+    if request.user.role != 'admin':
+        messages.error(request, 'У вас нет доступа к этой странице')
+        return redirect('dashboard')
+    
+    today = timezone.localdate()
+    windows = {'today': 0, 'week': 6, 'month': 29}
+    window = request.GET.get('window', 'today')
+    try:
+        start_date = date.fromisoformat(request.GET.get('start', ''))
+        end_date = date.fromisoformat(request.GET.get('end', ''))
+        window = 'custom'
+    except ValueError:
+        window = window if window in windows else 'today'
+        start_date, end_date = today - timedelta(days=windows[window]), today
+    
+    order_by = request.GET.get('order_by', 'revenue')
+    if order_by not in CashierLeaderboard.ORDERS_BY:
+        order_by = 'revenue'
+    
+    return render(request, 'nemo_park/orders/leaderboard.html', {
+        'ranking': CashierLeaderboard.ranking(start_date, end_date, order_by),
+        'window': window,
+        'order_by': order_by,
+        'start_date': start_date,
+        'end_date': end_date,
+        'is_live': start_date == end_date == today,
+    })
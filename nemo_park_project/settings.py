@@ -4,6 +4,7 @@ Django settings for nemo_park_project project.
 Парк развлечений Немо - система управления
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'nemo_park.db_routing.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,13 +72,96 @@ WSGI_APPLICATION = 'nemo_park_project.wsgi.application'  # было 'aquapark_pr
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# По умолчанию SQLite. Для PostgreSQL: NEMO_DB_ENGINE=postgresql и параметры NEMO_DB_*
+# (нужен пакет psycopg[pool]).
+DB_ENGINE = os.environ.get('NEMO_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('NEMO_DB_NAME', 'nemo_park'),
+            'USER': os.environ.get('NEMO_DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('NEMO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('NEMO_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('NEMO_DB_PORT', '5432'),
+            # Пул соединений psycopg вместо CONN_MAX_AGE (вместе их использовать нельзя)
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('NEMO_DB_POOL_MIN', '2')),
+                    'max_size': int(os.environ.get('NEMO_DB_POOL_MAX', '10')),
+                    'timeout': 10,
+                },
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Постоянные соединения между запросами
+            'CONN_MAX_AGE': int(os.environ.get('NEMO_DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Блокировка на запись берётся в начале транзакции, а не при первом UPDATE
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+# PRAGMA для каждого нового соединения SQLite (см. nemo_park/db_tuning.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,        # 64 МБ
+    'mmap_size': 268435456,      # 256 МБ
+    'busy_timeout': 20000,       # мс
+    'temp_store': 'MEMORY',
 }
 
+# Реплика для чтения (аналитика и списки). Включается переменной окружения
+# NEMO_REPLICA_DB_NAME: путь ко второму файлу SQLite или имя базы PostgreSQL.
+# В тестах реплика зеркалит default.
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_STICKY_SECONDS = int(os.environ.get('NEMO_REPLICA_STICKY_SECONDS', '10'))
+
+if os.environ.get('NEMO_REPLICA_DB_NAME'):
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        'ENGINE': os.environ.get('NEMO_REPLICA_DB_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.environ['NEMO_REPLICA_DB_NAME'],
+        'HOST': os.environ.get('NEMO_REPLICA_DB_HOST', ''),
+        'PORT': os.environ.get('NEMO_REPLICA_DB_PORT', ''),
+        'USER': os.environ.get('NEMO_REPLICA_DB_USER', ''),
+        'PASSWORD': os.environ.get('NEMO_REPLICA_DB_PASSWORD', ''),
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DATABASES[REPLICA_DATABASE_ALIAS]['ENGINE'] == 'django.db.backends.postgresql':
+        DATABASES[REPLICA_DATABASE_ALIAS]['OPTIONS'] = {'pool': True}
+
+DATABASE_ROUTERS = ['nemo_park.db_routing.ReadReplicaRouter']
+
+# Готовые расчётные листы для скачивания (см. nemo_park/services/payslip_service.py)
+PAYSLIP_CACHE_DIR = Path(os.environ.get('NEMO_PAYSLIP_CACHE_DIR', BASE_DIR / 'payslip_cache'))
+PAYSLIP_WORKERS = int(os.environ.get('NEMO_PAYSLIP_WORKERS', '4'))
+# pdf (нужен weasyprint из requirements.txt) или html — самостоятельная страница для печати
+PAYSLIP_FORMAT = os.environ.get('NEMO_PAYSLIP_FORMAT', 'pdf')
+
+# Процессов команды find_duplicate_visitors для сравнения пар (см. nemo_park/services/dedup_service.py)
+VISITOR_DEDUP_WORKERS = int(os.environ.get('NEMO_VISITOR_DEDUP_WORKERS', '4'))
+
+# Сколько продаж в час обслуживает один кассир (страница «Кассы по часам»)
+STAFFING_SALES_PER_CASHIER_HOUR = int(os.environ.get('NEMO_STAFFING_SALES_PER_HOUR', '20'))
+
+# Баллы лояльности: 1 балл за каждые N рублей покупки; свёртка журнала не трогает события моложе N секунд
+LOYALTY_RUBLES_PER_POINT = int(os.environ.get('NEMO_LOYALTY_RUBLES_PER_POINT', '100'))
+LOYALTY_SETTLE_SECONDS = int(os.environ.get('NEMO_LOYALTY_SETTLE_SECONDS', '60'))
+
+# Поваров на кухне — заказы готовятся параллельно (оценка времени готовности в очереди кухни)
+KITCHEN_COOKS = int(os.environ.get('NEMO_KITCHEN_COOKS', '2'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators